@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from collections import Counter
+import datetime
+from typing import TYPE_CHECKING, Optional
+
+from comment import Comment
+from text_index import tokenize
+from yak import Yak
+
+if TYPE_CHECKING:
+	from yak_data import TotalYakData, UserActivity
+
+_HOUR = 3600
+
+
+def _hour_bucket(created_at: datetime.datetime) -> int:
+	return int(created_at.timestamp()) // _HOUR
+
+class ArchiveAggregates:
+	"""Running totals over a whole archive, kept up to date as yaks and
+	comments are added or updated instead of being recomputed.
+	
+	Every item's contribution is remembered, so re-adding a yak or comment
+	(with new vote counts, say) subtracts its old contribution first. Like
+	the `yak_data` loops, comments only count once their yak is in the
+	archive, and comments on a yak without a user id don't count towards
+	anyone's activity. Word counts use `text_index.tokenize`, not nltk,
+	don't drop stopwords, and do include comments whose yak isn't archived."""
+	
+	def __init__(self):
+		# user id -> [posts, comments, post upvotes, comment upvotes]
+		self.users = {} # type: dict[str, list[int]]
+		# hours since the epoch -> [posts, comments]
+		self.hours = {} # type: dict[int, list[int]]
+		self.words = Counter() # type: Counter[str]
+		# (poster, commenter) -> [comments, threads commented on], split by
+		# whether the yak was anonymous
+		self.incognito_pairs = {} # type: dict[tuple[str, str], list[int]]
+		self.public_pairs = {} # type: dict[tuple[str, str], list[int]]
+		
+		# what each item currently contributes, so it can be taken back out.
+		# text is kept as varint codes into _vocabulary rather than a copy
+		# yak id -> (user id, votes, hour, is incognito, word codes)
+		self._yaks = {} # type: dict[str, tuple[Optional[str], int, int, bool, bytes]]
+		# (yak id, comment id) -> (user id, votes, hour, word codes)
+		self._comments = {} # type: dict[tuple[str, str], tuple[Optional[str], int, int, bytes]]
+		self._vocabulary = [] # type: list[str]
+		self._word_codes = {} # type: dict[str, int]
+		
+		# each thread's comments, summed, so they can be counted (or not)
+		# all at once when their yak is added or changes:
+		# yak id -> commenter -> [comments, upvotes]
+		self._thread_users = {} # type: dict[str, dict[str, list[int]]]
+		# yak id -> hours since the epoch -> [comments]
+		self._thread_hours = {} # type: dict[str, dict[int, list[int]]]
+	
+	@staticmethod
+	def _add(table: dict, key, deltas: tuple[int, ...]):
+		values = table.get(key)
+		if values is None:
+			values = table[key] = [0] * len(deltas)
+		for i, delta in enumerate(deltas):
+			values[i] += delta
+		if not any(values):
+			del table[key]
+	
+	def _encode_words(self, text: str) -> bytes:
+		codes = bytearray()
+		for word in tokenize(text):
+			code = self._word_codes.get(word)
+			if code is None:
+				code = self._word_codes[word] = len(self._vocabulary)
+				self._vocabulary.append(word)
+			while code > 0x7f:
+				codes.append(code & 0x7f | 0x80)
+				code >>= 7
+			codes.append(code)
+		return bytes(codes)
+	
+	def _add_words(self, codes: bytes, sign: int):
+		words, vocabulary = self.words, self._vocabulary
+		code, shift = 0, 0
+		for byte in codes:
+			code |= (byte & 0x7f) << shift
+			shift += 7
+			if byte & 0x80: continue
+			word = vocabulary[code]
+			words[word] += sign
+			if not words[word]:
+				del words[word]
+			code, shift = 0, 0
+	
+	def _add_pair(self, poster: str, is_incognito: bool, commenter: str, comments: int, threads: int):
+		self._add(self.incognito_pairs if is_incognito else self.public_pairs, (poster, commenter), (comments, threads))
+	
+	def _apply_thread(self, yak_id: str, poster: tuple[Optional[str], int, int, bool, bytes], sign: int):
+		# the parts of a thread's comments that depend on its yak
+		poster_id, _, _, is_incognito, _ = poster
+		for hour, (comments,) in self._thread_hours.get(yak_id, {}).items():
+			self._add(self.hours, hour, (0, sign * comments))
+		# NOTE: most_active_users skips the comments on a yak without a user id
+		if poster_id is None: return
+		for commenter, (comments, upvotes) in self._thread_users.get(yak_id, {}).items():
+			self._add(self.users, commenter, (0, sign * comments, 0, sign * upvotes))
+			self._add_pair(poster_id, is_incognito, commenter, sign * comments, sign)
+	
+	def _apply_yak(self, yak_id: str, snapshot: tuple[Optional[str], int, int, bool, bytes], sign: int):
+		user_id, votes, hour, _, words = snapshot
+		if user_id is not None:
+			self._add(self.users, user_id, (sign, 0, sign * votes, 0))
+		self._add(self.hours, hour, (sign, 0))
+		self._add_words(words, sign)
+		self._apply_thread(yak_id, snapshot, sign)
+	
+	def _apply_comment(self, yak_id: str, snapshot: tuple[Optional[str], int, int, bytes], sign: int):
+		user_id, votes, hour, words = snapshot
+		self._add_words(words, sign)
+		
+		thread_hours = self._thread_hours.setdefault(yak_id, {})
+		self._add(thread_hours, hour, (sign,))
+		if not thread_hours:
+			del self._thread_hours[yak_id]
+		was_commenter = is_commenter = False
+		if user_id is not None:
+			thread_users = self._thread_users.setdefault(yak_id, {})
+			was_commenter = user_id in thread_users
+			self._add(thread_users, user_id, (sign, sign * votes))
+			is_commenter = user_id in thread_users
+			if not thread_users:
+				del self._thread_users[yak_id]
+		
+		poster = self._yaks.get(yak_id)
+		if poster is None: return # counted when the yak is added
+		self._add(self.hours, hour, (0, sign))
+		if poster[0] is None or user_id is None: return
+		self._add(self.users, user_id, (0, sign, 0, sign * votes))
+		self._add_pair(poster[0], poster[3], user_id, sign, is_commenter - was_commenter)
+	
+	def add_yak(self, yak: Yak):
+		old = self._yaks.pop(yak.id, None)
+		if old is not None:
+			self._apply_yak(yak.id, old, -1)
+		
+		snapshot = (yak.user_id, yak.vote_count, _hour_bucket(yak.created_at), yak.is_incognito, self._encode_words(yak.text))
+		self._yaks[yak.id] = snapshot
+		self._apply_yak(yak.id, snapshot, 1)
+	
+	def add_comment(self, yak_id: str, comment: Comment):
+		# keyed by yak too, since iterating the archive counts a comment
+		# filed under two yaks twice
+		key = (yak_id, comment.id)
+		old = self._comments.get(key)
+		if old is not None:
+			self._apply_comment(yak_id, old, -1)
+		
+		snapshot = (comment.user_id, comment.vote_count, _hour_bucket(comment.created_at), self._encode_words(comment.text))
+		self._comments[key] = snapshot
+		self._apply_comment(yak_id, snapshot, 1)
+	
+	def user_activity(self, sort: bool = True) -> dict[str, UserActivity]:
+		"""Like `yak_data.most_active_users` over the whole archive"""
+		result = {
+			user_id: {
+				'posts': posts,
+				'comments': comments,
+				'total': posts + comments,
+				'post_upvotes': post_upvotes,
+				'comment_upvotes': comment_upvotes,
+				'total_upvotes': post_upvotes + comment_upvotes,
+			}
+			for user_id, (posts, comments, post_upvotes, comment_upvotes) in self.users.items()
+		} # type: dict[str, UserActivity]
+		if sort:
+			return dict(sorted(result.items(), key=lambda x:x[1]['total'], reverse=True))
+		return result
+	
+	def hour_counts(self,
+		timezone: datetime.tzinfo,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+	) -> dict[int, TotalYakData]:
+		"""Posts and comments by hour of the day, optionally limited to the
+		hours overlapping [start_time, end_time]"""
+		first = _hour_bucket(start_time) if start_time is not None else None
+		last = _hour_bucket(end_time) if end_time is not None else None
+		
+		result = {} # type: dict[int, TotalYakData]
+		for bucket, (posts, comments) in self.hours.items():
+			if first is not None and bucket < first: continue
+			if last is not None and bucket > last: continue
+			hour = datetime.datetime.fromtimestamp(bucket * _HOUR, timezone).hour
+			counts = result.setdefault(hour, {'posts': 0, 'comments': 0, 'total': 0})
+			counts['posts'] += posts
+			counts['comments'] += comments
+			counts['total'] += posts + comments
+		return result
+	
+	def coupled_users(self,
+		include_self: bool = False,
+		repeat_comments_per_thread: bool = True,
+		only_anonymous: bool = True,
+	) -> dict[tuple[str, str], int]:
+		"""Like `yak_data.common_coupled_users` over the whole archive"""
+		column = 0 if repeat_comments_per_thread else 1
+		
+		coupled_users = {} # type: dict[tuple[str, str], int]
+		for pairs in ((self.incognito_pairs,) if only_anonymous else (self.incognito_pairs, self.public_pairs)):
+			for (poster, commenter), counts in pairs.items():
+				if not include_self and poster == commenter: continue
+				if counts[column]:
+					coupled_users[(poster, commenter)] = coupled_users.get((poster, commenter), 0) + counts[column]
+		
+		return dict(sorted(coupled_users.items(), key=lambda x:x[1], reverse=True))
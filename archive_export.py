@@ -0,0 +1,327 @@
+"""Streams an archive out as NDJSON or Parquet for loading into a warehouse,
+with the same time window and user filters as the `yak_data` functions.
+
+Yaks and comments go to separate tables (comments get a `yak_id` column),
+written `chunk_size` rows at a time (one Parquet row group per chunk), so
+memory use is bounded by the chunk size and the archive block size rather
+than by the archive. With `partition_by`, each table is split into one file
+per month or day of `created_at`, and the files are written in parallel.
+	
+	directory/yaks.ndjson, directory/comments.ndjson
+	directory/yaks/2023-01.parquet, ...              (partition_by="month")
+
+Parquet needs pyarrow.
+	
+	python archive_export.py <archive> <directory> [--format ndjson|parquet] [--partition-by month|day]
+	                         [--start 2023-01-01] [--end 2023-02-01] [--user USER_ID]
+"""
+from __future__ import annotations
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import dataclasses
+import datetime
+import gzip
+import json
+import os
+import threading
+from typing import Any, Iterable, Literal, Optional, Protocol
+
+from archive_format import iter_blocks
+from comment import Comment
+from yak import Yak
+from yak_archive import TIMEZONE
+
+CHUNK_SIZE = 20_000 # rows per write (and per parquet row group)
+
+YAK_COLUMNS = tuple(field.name for field in dataclasses.fields(Yak))
+COMMENT_COLUMNS = ('yak_id',) + tuple(field.name for field in dataclasses.fields(Comment))
+
+# everything else is a (nullable) string
+_COLUMN_TYPES = {
+	'created_at': 'timestamp',
+	'interest_areas': 'list',
+	'distance': 'int64',
+	'comment_count': 'int64',
+	'vote_count': 'int64',
+	'is_incognito': 'bool',
+	'is_mine': 'bool',
+	'is_reported': 'bool',
+}
+
+_Row = dict[str, Any]
+
+
+def yak_row(yak: Yak) -> _Row:
+	return {name: getattr(yak, name) for name in YAK_COLUMNS}
+
+def comment_row(yak_id: str, comment: Comment) -> _Row:
+	row = {name: getattr(comment, name) for name in COMMENT_COLUMNS[1:]}
+	row['yak_id'] = yak_id
+	return row
+
+
+class _Writer(Protocol):
+	def write(self, rows: list[_Row]) -> None: ...
+	def close(self) -> None: ...
+
+def _json_default(value: object) -> str:
+	if isinstance(value, datetime.datetime):
+		return value.isoformat()
+	raise TypeError(f"Can't export {type(value).__name__} values")
+
+class _NdjsonWriter:
+	def __init__(self, path: str, columns: tuple[str, ...], compression: Optional[str]):
+		if compression not in (None, 'gzip'):
+			raise ValueError(f"Unsupported ndjson compression {compression!r} (available: gzip)")
+		self._file = gzip.open(path, 'wt', encoding='utf-8') if compression else open(path, 'w', encoding='utf-8')
+	
+	def write(self, rows: list[_Row]):
+		self._file.write(''.join(json.dumps(row, ensure_ascii=False, default=_json_default) + '\n' for row in rows))
+	
+	def close(self):
+		self._file.close()
+
+class _ParquetWriter:
+	def __init__(self, path: str, columns: tuple[str, ...], compression: Optional[str]):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+		
+		types = {
+			'timestamp': pa.timestamp('us', tz='UTC'),
+			'list': pa.list_(pa.string()),
+			'int64': pa.int64(),
+			'bool': pa.bool_(),
+		}
+		self._schema = pa.schema([(name, types.get(_COLUMN_TYPES.get(name, ''), pa.string())) for name in columns])
+		self._pa = pa
+		self._writer = pq.ParquetWriter(path, self._schema, compression=compression or 'zstd')
+	
+	def write(self, rows: list[_Row]):
+		# arrow does the conversion and compression without the GIL
+		self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+	
+	def close(self):
+		self._writer.close()
+
+_WRITERS = {
+	'ndjson': (_NdjsonWriter, '.ndjson'),
+	'parquet': (_ParquetWriter, '.parquet'),
+}
+
+
+class _OutputFile:
+	"""One file being written, with chunks queued to be written in order by
+	whichever pool thread gets to them first"""
+	
+	def __init__(self, path: str, writer: _Writer):
+		self.path = path
+		self.writer = writer
+		self.buffer = [] # type: list[_Row]
+		self.queue = deque() # type: deque[list[_Row]]
+		self.lock = threading.Lock()
+		self.writing = False
+
+
+class ArchiveExporter:
+	"""Writes yaks and comments out in chunks as they're added.
+	
+	Chunks are written on a thread pool, at most `2 * threads` queued at a
+	time, and every file is written to a temporary path and moved into
+	place by `close`. Rows within a file are in the order they were added."""
+	
+	def __init__(self,
+		directory: str,
+		format: Literal["ndjson", "parquet"] = "ndjson",
+		partition_by: Optional[Literal["month", "day"]] = None,
+		chunk_size: int = CHUNK_SIZE,
+		compression: Optional[str] = None,
+		threads: Optional[int] = None,
+	):
+		if format not in _WRITERS:
+			raise ValueError(f"Unsupported export format {format!r} (available: {', '.join(_WRITERS)})")
+		self.directory = directory
+		self.format = format
+		self.partition_by = partition_by
+		self.chunk_size = chunk_size
+		self.compression = compression
+		self.rows = {'yaks': 0, 'comments': 0}
+		
+		self._files = {} # type: dict[tuple[str, str], _OutputFile]
+		self._buffered = 0
+		threads = threads or min(8, os.cpu_count() or 1)
+		self._executor = ThreadPoolExecutor(threads)
+		self._slots = threading.BoundedSemaphore(2 * threads)
+		self._error = None # type: Optional[BaseException]
+		os.makedirs(directory, exist_ok=True)
+	
+	def _partition(self, created_at: datetime.datetime) -> str:
+		if self.partition_by is None:
+			return ''
+		return created_at.astimezone(TIMEZONE).strftime("%Y-%m-%d" if self.partition_by == "day" else "%Y-%m")
+	
+	def _file(self, table: str, partition: str) -> _OutputFile:
+		output = self._files.get((table, partition))
+		if output is None:
+			writer_class, extension = _WRITERS[self.format]
+			if partition:
+				os.makedirs(os.path.join(self.directory, table), exist_ok=True)
+				path = os.path.join(self.directory, table, partition + extension)
+			else:
+				path = os.path.join(self.directory, table + extension)
+			if self.format == 'ndjson' and self.compression:
+				path += '.gz'
+			columns = YAK_COLUMNS if table == 'yaks' else COMMENT_COLUMNS
+			output = self._files[table, partition] = _OutputFile(path, writer_class(path + '.tmp', columns, self.compression))
+		return output
+	
+	def _add_row(self, table: str, created_at: datetime.datetime, row: _Row):
+		output = self._file(table, self._partition(created_at))
+		output.buffer.append(row)
+		self.rows[table] += 1
+		self._buffered += 1
+		if len(output.buffer) >= self.chunk_size:
+			self._flush(output)
+		elif self._buffered >= 4 * self.chunk_size:
+			# lots of partitions part way through a chunk at once
+			self._flush(max(self._files.values(), key=lambda output: len(output.buffer)))
+	
+	def add(self, yak: Yak, comments: Iterable[Comment] = ()):
+		self._add_row('yaks', yak.created_at, yak_row(yak))
+		self.add_comments(yak.id, comments)
+	
+	def add_comments(self, yak_id: str, comments: Iterable[Comment]):
+		for comment in comments:
+			self._add_row('comments', comment.created_at, comment_row(yak_id, comment))
+	
+	def _flush(self, output: _OutputFile):
+		if not output.buffer:
+			return
+		if self._error is not None:
+			raise self._error
+		
+		self._slots.acquire()
+		self._buffered -= len(output.buffer)
+		with output.lock:
+			output.queue.append(output.buffer)
+			start = not output.writing
+			output.writing = True
+		output.buffer = []
+		if start:
+			self._executor.submit(self._drain, output)
+	
+	def _drain(self, output: _OutputFile):
+		while True:
+			with output.lock:
+				if not output.queue:
+					output.writing = False
+					return
+				rows = output.queue.popleft()
+			try:
+				if self._error is None:
+					output.writer.write(rows)
+			except BaseException as error:
+				self._error = error
+			finally:
+				self._slots.release()
+	
+	def close(self):
+		if self._error is None:
+			for output in self._files.values():
+				self._flush(output)
+		self._executor.shutdown()
+		for output in self._files.values():
+			output.writer.close()
+		
+		if self._error is not None:
+			self._discard()
+			raise self._error
+		for output in self._files.values():
+			os.replace(output.path + '.tmp', output.path)
+	
+	def _discard(self):
+		for output in self._files.values():
+			if os.path.exists(output.path + '.tmp'):
+				os.remove(output.path + '.tmp')
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self._executor.shutdown(cancel_futures=True)
+			for output in self._files.values():
+				output.writer.close()
+			self._discard()
+		return False
+
+
+def export(
+	blocks: Iterable[tuple[list[Yak], dict[str, list[Comment]]]],
+	directory: str,
+	format: Literal["ndjson", "parquet"] = "ndjson",
+	start_time: Optional[datetime.datetime] = None,
+	end_time: Optional[datetime.datetime] = None,
+	user_id: Optional[str] = None,
+	partition_by: Optional[Literal["month", "day"]] = None,
+	chunk_size: int = CHUNK_SIZE,
+	compression: Optional[str] = None,
+	threads: Optional[int] = None,
+) -> dict[str, int]:
+	"""Export every yak and comment created in [start_time, end_time] (and
+	by `user_id`, if given) from (yaks, yak id -> comments) blocks, like
+	the ones `archive_format.iter_blocks` yields. Returns the number of rows
+	written to each table."""
+	def keep(item: Yak | Comment) -> bool:
+		return (
+			(start_time is None or item.created_at >= start_time)
+			and (end_time is None or item.created_at <= end_time)
+			and (user_id is None or item.user_id == user_id)
+		)
+	
+	with ArchiveExporter(directory, format, partition_by, chunk_size, compression, threads) as exporter:
+		for yaks, comments in blocks:
+			for yak in yaks:
+				if keep(yak):
+					exporter.add(yak)
+			for yak_id, thread in comments.items():
+				exporter.add_comments(yak_id, filter(keep, thread))
+	return exporter.rows
+
+def export_archive(path: str, directory: str, **options) -> dict[str, int]:
+	"""`export` straight from an archive file, one block at a time, without
+	loading the whole archive"""
+	return export(iter_blocks(path), directory, **options)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("archive")
+	parser.add_argument("directory")
+	parser.add_argument("--format", choices=list(_WRITERS), default="ndjson")
+	parser.add_argument("--partition-by", choices=["month", "day"])
+	parser.add_argument("--start", type=datetime.datetime.fromisoformat, help="ISO date/time (archive time zone if none given)")
+	parser.add_argument("--end", type=datetime.datetime.fromisoformat)
+	parser.add_argument("--user")
+	parser.add_argument("--compression")
+	parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+	args = parser.parse_args()
+	
+	start_time, end_time = (
+		time.replace(tzinfo=TIMEZONE) if time is not None and time.tzinfo is None else time
+		for time in (args.start, args.end)
+	)
+	rows = export_archive(args.archive, args.directory,
+		format=args.format,
+		start_time=start_time,
+		end_time=end_time,
+		user_id=args.user,
+		partition_by=args.partition_by,
+		chunk_size=args.chunk_size,
+		compression=args.compression,
+	)
+	print(f"Exported {rows['yaks']} yaks and {rows['comments']} comments to {args.directory}")
+
+if __name__ == '__main__': main()
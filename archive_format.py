@@ -0,0 +1,234 @@
+"""Versioned, block-compressed on-disk format for yak archives.
+
+Layout (all integers little endian):
+	
+	magic          8 bytes, b"YAKARCH\\x00"
+	version        u16
+	header length  u32
+	header         utf-8 json: {"codec": ..., "blocks": [[offset, length, num_yaks], ...]}
+	blocks         each one an independently compressed pickle of
+	               (list[Yak], dict[yak_id, list[Comment]])
+
+Blocks can be decompressed independently (and in parallel). Files without
+the magic bytes are treated as version 0, a bare pickled `Archive`.
+	
+	python archive_format.py compact <archive> [output] [--codec zlib|lzma|zstd]
+"""
+from __future__ import annotations
+
+import argparse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import lzma
+import os
+import pickle
+import shutil
+import struct
+from typing import Callable, Iterator, Optional
+import zlib
+
+from comment import Comment
+from yak import Yak
+
+MAGIC = b"YAKARCH\x00"
+FORMAT_VERSION = 1
+BLOCK_SIZE = 2000 # yaks per block
+
+_PREAMBLE = struct.Struct("<8sHI")
+
+
+_CODECS = {
+	'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+	'lzma': (lzma.compress, lzma.decompress),
+} # type: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]
+
+try:
+	import zstandard
+except ImportError:
+	DEFAULT_CODEC = 'zlib'
+else:
+	_CODECS['zstd'] = (
+		lambda data: zstandard.ZstdCompressor(level=10).compress(data),
+		lambda data: zstandard.ZstdDecompressor().decompress(data),
+	)
+	DEFAULT_CODEC = 'zstd'
+
+
+def _get_codec(name: str) -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+	if name not in _CODECS:
+		raise ValueError(f"Unsupported archive codec {name!r} (available: {', '.join(_CODECS)})")
+	return _CODECS[name]
+
+
+class ArchiveWriter:
+	"""Writes an archive block by block, so memory use is bounded by the
+	block size rather than the archive size.
+	
+	Blocks are compressed on a thread pool (zlib, lzma and zstd all release
+	the GIL) and written to a temporary body file; `close` writes the header
+	and swaps the finished file into place, so a crash mid-save never leaves
+	a truncated archive behind."""
+	
+	def __init__(self, path: str, codec: Optional[str] = None, block_size: int = BLOCK_SIZE):
+		self.path = path
+		self.codec = codec or DEFAULT_CODEC
+		self.block_size = block_size
+		self._compress, _ = _get_codec(self.codec)
+		
+		self._yaks = [] # type: list[Yak]
+		self._comments = {} # type: dict[str, list[Comment]]
+		self._orphans = {} # type: dict[str, list[Comment]]
+		
+		self._index = [] # type: list[list[int]]
+		self._offset = 0
+		self._body = open(path + ".body.tmp", 'wb')
+		self._executor = ThreadPoolExecutor()
+		self._pending = deque() # type: deque[tuple[Future[bytes], int]]
+		self._max_pending = 2 * (os.cpu_count() or 1)
+	
+	def add(self, yak: Yak, comments: list[Comment]):
+		self._yaks.append(yak)
+		if comments:
+			self._comments[yak.id] = comments
+		if len(self._yaks) >= self.block_size:
+			self._flush_block()
+	
+	def add_orphans(self, comments: dict[str, list[Comment]]):
+		# comments whose yak isn't in the archive go in a block of their own
+		self._orphans.update(comments)
+	
+	def _flush_block(self):
+		block = (self._yaks, self._comments)
+		self._pending.append((self._executor.submit(self._compress, pickle.dumps(block, pickle.HIGHEST_PROTOCOL)), len(self._yaks)))
+		self._yaks, self._comments = [], {}
+		
+		while len(self._pending) > self._max_pending:
+			self._write_pending()
+	
+	def _write_pending(self):
+		future, num_yaks = self._pending.popleft()
+		data = future.result()
+		self._body.write(data)
+		self._index.append([self._offset, len(data), num_yaks])
+		self._offset += len(data)
+	
+	def close(self):
+		if self._yaks:
+			self._flush_block()
+		if self._orphans:
+			self._yaks, self._comments = [], self._orphans
+			self._flush_block()
+		while self._pending:
+			self._write_pending()
+		self._executor.shutdown()
+		self._body.close()
+		
+		header = json.dumps({'codec': self.codec, 'blocks': self._index}).encode()
+		temp_path = self.path + ".tmp"
+		with open(temp_path, 'wb') as file_handle, open(self.path + ".body.tmp", 'rb') as body:
+			file_handle.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+			file_handle.write(header)
+			shutil.copyfileobj(body, file_handle)
+			file_handle.flush()
+			os.fsync(file_handle.fileno())
+		os.replace(temp_path, self.path)
+		os.remove(self.path + ".body.tmp")
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self._executor.shutdown(cancel_futures=True)
+			self._body.close()
+			os.remove(self.path + ".body.tmp")
+		return False
+
+
+def save_archive(path: str, archive, codec: Optional[str] = None, block_size: int = BLOCK_SIZE) -> None:
+	with ArchiveWriter(path, codec, block_size) as writer:
+		for yak in archive.yaks:
+			writer.add(yak, archive.comments.get(yak.id, []))
+		yak_ids = {yak.id for yak in archive.yaks}
+		writer.add_orphans({yak_id: thread for yak_id, thread in archive.comments.items() if yak_id not in yak_ids})
+
+def read_version(path: str) -> int:
+	with open(path, 'rb') as file_handle:
+		preamble = file_handle.read(_PREAMBLE.size)
+	if len(preamble) < _PREAMBLE.size or preamble[:len(MAGIC)] != MAGIC:
+		return 0
+	return _PREAMBLE.unpack(preamble)[1]
+
+def iter_blocks(path: str, orphans_only: bool = False) -> Iterator[tuple[list[Yak], dict[str, list[Comment]]]]:
+	"""Yield an archive's blocks one at a time without loading the rest.
+	
+	With `orphans_only`, blocks holding yaks are skipped without being read.
+	A version 0 archive is a single pickle, so it always comes back as one
+	block."""
+	with open(path, 'rb') as file_handle:
+		preamble = file_handle.read(_PREAMBLE.size)
+		
+		if len(preamble) < _PREAMBLE.size or preamble[:len(MAGIC)] != MAGIC:
+			file_handle.seek(0)
+			archive = pickle.load(file_handle)
+			yield archive.yaks, archive.comments
+			return
+		
+		_, version, header_length = _PREAMBLE.unpack(preamble)
+		if version > FORMAT_VERSION:
+			raise ValueError(f"Archive {path} has format version {version}, but only versions up to {FORMAT_VERSION} are supported")
+		header = json.loads(file_handle.read(header_length))
+		_, decompress = _get_codec(header['codec'])
+		
+		body_start = file_handle.tell()
+		blocks = [(offset, length) for offset, length, num_yaks in header['blocks'] if not (orphans_only and num_yaks)]
+		
+		# blocks are decompressed a few ahead on a thread pool, but only that
+		# many are ever held at once
+		max_pending = 2 * (os.cpu_count() or 1)
+		with ThreadPoolExecutor() as executor:
+			pending = deque() # type: deque[Future[bytes]]
+			for offset, length in blocks:
+				file_handle.seek(body_start + offset)
+				pending.append(executor.submit(decompress, file_handle.read(length)))
+				if len(pending) >= max_pending:
+					yield pickle.loads(pending.popleft().result())
+			while pending:
+				yield pickle.loads(pending.popleft().result())
+
+def load_archive(path: str):
+	from yak_archive import Archive
+	
+	archive = Archive([], {})
+	for block_yaks, block_comments in iter_blocks(path):
+		archive.yaks.extend(block_yaks)
+		archive.comments.update(block_comments)
+	return archive
+
+def compact(path: str, output_path: Optional[str] = None, codec: Optional[str] = None) -> None:
+	"""Rewrite an archive (of any version) in the current format, dropping
+	duplicate yaks and comments (the last copy of each one wins)"""
+	archive = load_archive(path)
+	
+	yaks = {yak.id: yak for yak in archive.yaks}
+	archive.yaks = sorted(yaks.values(), key=lambda yak: yak.created_at, reverse=True)
+	for yak_id, comments in archive.comments.items():
+		archive.comments[yak_id] = list({comment.id: comment for comment in comments}.values())
+	
+	save_archive(output_path or path, archive, codec=codec)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	commands = parser.add_subparsers(dest="command", required=True)
+	compact_parser = commands.add_parser("compact", help="rewrite an archive in the current format")
+	compact_parser.add_argument("archive")
+	compact_parser.add_argument("output", nargs="?", help="defaults to rewriting the archive in place")
+	compact_parser.add_argument("--codec", choices=list(_CODECS), help=f"defaults to {DEFAULT_CODEC}")
+	args = parser.parse_args()
+	
+	compact(args.archive, args.output, codec=args.codec)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,172 @@
+"""Merge and diff archives from several crawlers without loading them.
+
+Saved archives are sorted newest first, so the inputs are merged as sorted
+streams: copies of the same yak share a `created_at`, which means dedupe
+only has to look at one timestamp's worth of yaks at a time. Memory is
+bounded by a few blocks per input, plus the inputs' vote histories (which
+pick between copies) and any comments whose yak isn't in the archive.
+	
+	python archive_merge.py merge <output> <archive> [<archive> ...]
+	python archive_merge.py diff <old archive> <new archive>
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass, field
+import heapq
+from itertools import groupby
+from typing import Iterable, Iterator, Optional
+
+from archive_format import ArchiveWriter, iter_blocks
+from comment import Comment
+from interning import get_field_state
+from vote_history import VoteHistory, load_history, save_history
+from yak import Yak
+
+
+def _iter_sorted(path: str, source: int) -> Iterator[tuple[int, Yak, list[Comment]]]:
+	previous = None
+	for yaks, comments in iter_blocks(path):
+		for yak in yaks:
+			if previous is not None and yak.created_at > previous:
+				raise ValueError(f"{path} isn't sorted by time, run `python archive_format.py compact {path}` first")
+			previous = yak.created_at
+			yield source, yak, comments.get(yak.id, [])
+
+def _read_orphans(path: str) -> dict[str, list[Comment]]:
+	orphans = {} # type: dict[str, list[Comment]]
+	for yaks, comments in iter_blocks(path, orphans_only=True):
+		yak_ids = {yak.id for yak in yaks}
+		orphans.update((yak_id, thread) for yak_id, thread in comments.items() if yak_id not in yak_ids)
+	return orphans
+
+def _observed(history: VoteHistory, item_id: str) -> int:
+	"""When `history` last saw `item_id` (epoch seconds), or -1 if never"""
+	row = history.rows.get(item_id)
+	return history.last_time[row] if row is not None else -1
+
+def _merge_threads(threads: Iterable[tuple[int, list[Comment]]], histories: list[VoteHistory]) -> list[Comment]:
+	# the most recently observed copy of a comment wins (the later input's,
+	# if that's a tie), but keep the order comments first appeared in
+	merged = {} # type: dict[str, tuple[tuple[int, int], Comment]]
+	for source, thread in sorted(threads, key=lambda item: item[0]):
+		for comment in thread:
+			key = (_observed(histories[source], comment.id), source)
+			current = merged.get(comment.id)
+			if current is None or key >= current[0]:
+				merged[comment.id] = (key, comment)
+	return [comment for _, comment in merged.values()]
+
+def _grouped(paths: list[str]) -> Iterator[dict[str, list[tuple[int, Yak, list[Comment]]]]]:
+	"""Every copy of each yak across all the inputs, tagged with the index of
+	the input it came from, one timestamp at a time"""
+	streams = [_iter_sorted(path, source) for source, path in enumerate(paths)]
+	# heapq.merge is stable, so copies from later inputs come later
+	merged = heapq.merge(*streams, key=lambda item: item[1].created_at, reverse=True)
+	for _, group in groupby(merged, key=lambda item: item[1].created_at):
+		copies = {} # type: dict[str, list[tuple[int, Yak, list[Comment]]]]
+		for item in group:
+			copies.setdefault(item[1].id, []).append(item)
+		yield copies
+
+
+def merge_archives(paths: list[str], output_path: str, codec: Optional[str] = None) -> int:
+	"""Merge archives into one, deduping yaks and comments by id.
+	
+	When the same yak or comment is in several archives, the copy that was
+	observed most recently according to each archive's vote history wins,
+	so crawls from several hosts can be merged in any order (copies nobody
+	recorded an observation of fall back to the last archive in `paths`).
+	The inputs' vote histories are merged too. Returns the number of yaks
+	written."""
+	histories = [load_history(path) for path in paths]
+	
+	orphans = {} # type: dict[str, list[tuple[int, list[Comment]]]]
+	for source, path in enumerate(paths):
+		for yak_id, thread in _read_orphans(path).items():
+			orphans.setdefault(yak_id, []).append((source, thread))
+	
+	num_yaks = 0
+	with ArchiveWriter(output_path, codec) as writer:
+		for copies in _grouped(paths):
+			for yak_id, items in copies.items():
+				newest = max(range(len(items)), key=lambda i: (_observed(histories[items[i][0]], yak_id), items[i][0], i))
+				threads = [(source, comments) for source, _, comments in items] + orphans.pop(yak_id, [])
+				writer.add(items[newest][1], _merge_threads(threads, histories))
+				num_yaks += 1
+		writer.add_orphans({yak_id: _merge_threads(threads, histories) for yak_id, threads in orphans.items()})
+	
+	history = VoteHistory()
+	for other in histories:
+		history.merge(other)
+	save_history(output_path, history)
+	
+	return num_yaks
+
+
+@dataclass
+class ArchiveDiff:
+	new_yaks: list[str] = field(default_factory=list)
+	updated_yaks: list[str] = field(default_factory=list)
+	deleted_yaks: list[str] = field(default_factory=list)
+	new_comments: list[str] = field(default_factory=list)
+	updated_comments: list[str] = field(default_factory=list)
+	deleted_comments: list[str] = field(default_factory=list)
+	
+	def _diff_threads(self, old: list[Comment], new: list[Comment]):
+		old_by_id = {comment.id: comment for comment in old}
+		for comment in new:
+			old_comment = old_by_id.pop(comment.id, None)
+			if old_comment is None:
+				self.new_comments.append(comment.id)
+			elif get_field_state(old_comment) != get_field_state(comment):
+				self.updated_comments.append(comment.id)
+		self.deleted_comments.extend(old_by_id)
+
+def diff_archives(old_path: str, new_path: str) -> ArchiveDiff:
+	"""Ids of the yaks and comments added, changed or removed between two
+	snapshots of an archive"""
+	diff = ArchiveDiff()
+	
+	old_orphans, new_orphans = _read_orphans(old_path), _read_orphans(new_path)
+	
+	for copies in _grouped([old_path, new_path]):
+		for yak_id, items in copies.items():
+			old = next((item for item in items if item[0] == 0), None)
+			new = next((item for item in reversed(items) if item[0] == 1), None)
+			old_thread = (old[2] if old else []) + old_orphans.pop(yak_id, [])
+			new_thread = (new[2] if new else []) + new_orphans.pop(yak_id, [])
+			
+			if old is None:
+				diff.new_yaks.append(yak_id)
+			elif new is None:
+				diff.deleted_yaks.append(yak_id)
+			elif get_field_state(old[1]) != get_field_state(new[1]):
+				diff.updated_yaks.append(yak_id)
+			diff._diff_threads(old_thread, new_thread)
+	
+	for yak_id in old_orphans.keys() | new_orphans.keys():
+		diff._diff_threads(old_orphans.get(yak_id, []), new_orphans.get(yak_id, []))
+	
+	return diff
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	commands = parser.add_subparsers(dest="command", required=True)
+	merge_parser = commands.add_parser("merge", help="merge archives into a new one")
+	merge_parser.add_argument("output")
+	merge_parser.add_argument("archives", nargs="+")
+	diff_parser = commands.add_parser("diff", help="count what changed between two snapshots of an archive")
+	diff_parser.add_argument("old")
+	diff_parser.add_argument("new")
+	args = parser.parse_args()
+	
+	if args.command == "merge":
+		num_yaks = merge_archives(args.archives, args.output)
+		print(f"Merged {len(args.archives)} archives ({num_yaks} yaks) into {args.output}")
+	else:
+		diff = diff_archives(args.old, args.new)
+		for name, ids in vars(diff).items():
+			print(f"{name}: {len(ids)}")
+
+if __name__ == '__main__': main()
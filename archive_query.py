@@ -0,0 +1,319 @@
+"""Declarative queries over a `YakArchive`, instead of hand-written loops
+over `get_yaks()`:
+	
+	archive.query().where(user=user_id, since=start, incognito=True, min_votes=5).comments().group_by("hour").count()
+
+Each query is planned against what the archive already has: the yak id
+lookup, the text index, or a sorted index over the column view's
+`created_at` or `user_id` (whichever leaves the fewest candidate rows).
+Whatever that doesn't settle is checked over just the candidates with numpy,
+and a full column scan is only used when no predicate has an index.
+`explain()` shows the plan, with row counts and timings. Needs numpy.
+"""
+from __future__ import annotations
+
+import datetime
+import time
+from typing import TYPE_CHECKING, Any, Hashable, Literal, Optional
+
+from comment import Comment
+from yak import Yak
+from yak_archive import TIMEZONE, YakArchive
+from yak_columns import ArchiveColumns, epoch_microseconds
+
+if TYPE_CHECKING:
+	import numpy
+
+_Grouping = Literal["hour", "day", "weekday", "user", "yak"]
+_Order = Literal["newest", "oldest", "votes"]
+
+_HOUR = 3_600_000_000 # microseconds
+_DAY = 24 * _HOUR
+_EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+class _Plan:
+	"""The steps a query took, for explain()"""
+	
+	def __init__(self, description: str):
+		self.description = description
+		self.steps = [] # type: list[str]
+		self._started = time.perf_counter()
+	
+	def step(self, description: str, rows: Optional[int] = None):
+		elapsed = (time.perf_counter() - self._started) * 1000
+		self._started = time.perf_counter()
+		rows_text = f": {rows:,} rows" if rows is not None else ""
+		self.steps.append(f"{description}{rows_text} ({elapsed:.1f} ms)")
+	
+	def __str__(self):
+		return "\n".join([self.description] + [f"  {i}. {step}" for i, step in enumerate(self.steps, 1)])
+
+
+class Query:
+	"""An immutable query; every method returns a new one, until one of
+	`count`, `sum`, `ids`, `all` (or iterating) runs it"""
+	
+	def __init__(self,
+		archive: YakArchive,
+		table: Literal["yaks", "comments"] = "yaks",
+		filters: Optional[dict[str, Any]] = None,
+		grouping: Optional[_Grouping] = None,
+		order: _Order = "newest",
+		limit: Optional[int] = None,
+	):
+		self.archive = archive
+		self.table = table
+		self.filters = filters or {}
+		self.grouping = grouping
+		self.order = order
+		self.max_rows = limit
+	
+	def _replace(self, **changes) -> Query:
+		options = dict(table=self.table, filters=self.filters, grouping=self.grouping, order=self.order, limit=self.max_rows)
+		options.update(changes)
+		return Query(self.archive, **options)
+	
+	def where(self, *,
+		yak: Optional[str] = None,
+		user: Optional[str] = None,
+		since: Optional[datetime.datetime] = None,
+		until: Optional[datetime.datetime] = None,
+		incognito: Optional[bool] = None,
+		min_votes: Optional[int] = None,
+		max_votes: Optional[int] = None,
+		text: Optional[str] = None,
+	) -> Query:
+		"""Narrow the query (adding to any earlier `where`s).
+		
+		`yak` is a yak id (for comments, the yak they're on); `user` is the
+		poster or commenter; `since`/`until` bound `created_at` inclusively;
+		`incognito` is the yak's (for comments, their yak's); `text` is a
+		`TextIndex` query."""
+		new_filters = {
+			'yak': yak, 'user': user, 'since': since, 'until': until, 'incognito': incognito,
+			'min_votes': min_votes, 'max_votes': max_votes, 'text': text,
+		}
+		return self._replace(filters={**self.filters, **{name: value for name, value in new_filters.items() if value is not None}})
+	
+	def yaks(self) -> Query:
+		return self._replace(table="yaks")
+	
+	def comments(self) -> Query:
+		return self._replace(table="comments")
+	
+	def group_by(self, key: _Grouping) -> Query:
+		"""Makes `count` and `sum` return a dict per hour of day (0-23), day,
+		weekday (0 is monday), user, or yak (for comments, the yak they're on)"""
+		if key not in ("hour", "day", "weekday", "user", "yak"):
+			raise ValueError(f"Can't group by {key!r}")
+		return self._replace(grouping=key)
+	
+	def order_by(self, key: _Order) -> Query:
+		if key not in ("newest", "oldest", "votes"):
+			raise ValueError(f"Can't order by {key!r}")
+		return self._replace(order=key)
+	
+	def limit(self, count: int) -> Query:
+		return self._replace(limit=count)
+	
+	def _describe(self) -> str:
+		conditions = []
+		for name, value in self.filters.items():
+			operator = {'since': '>=', 'until': '<=', 'min_votes': '>=', 'max_votes': '<='}.get(name, '=')
+			conditions.append(f"{name} {operator} {value!r}" if not isinstance(value, datetime.datetime) else f"{name} {operator} {value.isoformat()}")
+		description = self.table + (" where " + ", ".join(conditions) if conditions else "")
+		if self.grouping is not None:
+			description += f" group by {self.grouping}"
+		return description
+	
+	def _candidates(self, columns: ArchiveColumns, plan: _Plan) -> tuple[numpy.ndarray, set[str]]:
+		"""Rows picked out by the best index, and the filters that settles"""
+		import numpy as np
+		
+		filters = self.filters
+		table = columns.yaks if self.table == "yaks" else columns.comments
+		
+		if 'yak' in filters:
+			if self.table == "yaks":
+				rows = [table.rows[filters['yak']]] if filters['yak'] in table.rows else []
+			else:
+				rows = [table.rows[(filters['yak'], comment.id)] for comment in self.archive.archive.comments.get(filters['yak'], [])]
+			plan.step(f"id lookup yak = {filters['yak']!r}", len(rows))
+			return np.array(rows, dtype=np.int64), {'yak'}
+		
+		if 'text' in filters:
+			index = self.archive.text_index()
+			doc_ids = index.search(filters['text'], filters.get('user'), filters.get('since'), filters.get('until'))
+			# comment rows are keyed by (yak id, comment id)
+			if self.table == "yaks":
+				keys = [doc_id for doc_id in doc_ids if index.documents[doc_id][2] is None] # type: list[Hashable]
+			else:
+				keys = [(index.documents[doc_id][2], doc_id) for doc_id in doc_ids if index.documents[doc_id][2] is not None]
+			rows = [table.rows[key] for key in keys if key in table.rows]
+			plan.step(f"text index search {filters['text']!r}", len(rows))
+			return np.array(rows, dtype=np.int64), {'text', 'user', 'since', 'until'}
+		
+		# every sorted index that applies, narrowest first
+		ranges = []
+		if 'since' in filters or 'until' in filters:
+			order, values = table.sorted_by('created_at')
+			first = np.searchsorted(values, epoch_microseconds(filters['since'])) if 'since' in filters else 0
+			last = np.searchsorted(values, epoch_microseconds(filters['until']), side='right') if 'until' in filters else len(values)
+			ranges.append((max(last - first, 0), "created_at", order[first:last], {'since', 'until'}))
+		if 'user' in filters:
+			order, values = table.sorted_by('user_id')
+			code = columns.users.get_code(filters['user'])
+			first, last = 0, 0
+			if code is not None:
+				# NOTE: searching for a python int would convert every (int32)
+				#       value to int64 first
+				code = values.dtype.type(code)
+				first, last = np.searchsorted(values, code), np.searchsorted(values, code, side='right')
+			ranges.append((last - first, "user_id", order[first:last], {'user'}))
+		
+		if ranges:
+			ranges.sort(key=lambda candidate: candidate[0])
+			size, column, rows, settled = ranges[0]
+			others = "".join(f" (an index on {other[1]} would leave {other[0]:,})" for other in ranges[1:])
+			plan.step(f"sorted index on {column}, {size:,} of {len(table):,} rows{others}")
+			return np.sort(rows), settled
+		
+		plan.step(f"full scan of {len(table):,} {self.table}")
+		return np.arange(len(table), dtype=np.int64), set()
+	
+	def _run(self) -> tuple[numpy.ndarray, ArchiveColumns, _Plan]:
+		"""The matching rows of the yak or comment columns, in query order"""
+		import numpy as np
+		
+		plan = _Plan(self._describe())
+		columns = self.archive.to_columns()
+		table_columns = columns.yaks if self.table == "yaks" else columns.comments
+		plan.step(f"column view of {self.table}", len(table_columns))
+		rows, settled = self._candidates(columns, plan)
+		filters = self.filters
+		
+		table = table_columns.to_numpy()
+		residual = [name for name in filters if name not in settled]
+		if residual and len(rows):
+			mask = np.ones(len(rows), dtype=bool)
+			if 'user' in residual:
+				code = columns.users.get_code(filters['user'])
+				mask &= table['user_id'][rows] == (code if code is not None else -2)
+			if 'since' in residual:
+				mask &= table['created_at'][rows] >= epoch_microseconds(filters['since'])
+			if 'until' in residual:
+				mask &= table['created_at'][rows] <= epoch_microseconds(filters['until'])
+			if 'min_votes' in residual:
+				mask &= table['vote_count'][rows] >= filters['min_votes']
+			if 'max_votes' in residual:
+				mask &= table['vote_count'][rows] <= filters['max_votes']
+			if 'incognito' in residual:
+				if self.table == "yaks":
+					mask &= (table['is_incognito'][rows] != 0) == filters['incognito']
+				else:
+					# the parent yak's, and comments whose yak isn't archived never match
+					parents = columns.yak_rows()[table['yak'][rows]]
+					mask &= (parents >= 0) & ((columns.yaks.to_numpy()['is_incognito'][parents] != 0) == filters['incognito'])
+			rows = rows[mask]
+			plan.step(f"filter {', '.join(residual)} with numpy", len(rows))
+		
+		if self.grouping is None:
+			if self.order == "votes":
+				rows = rows[np.argsort(-table['vote_count'][rows], kind='stable')]
+			else:
+				rows = rows[np.argsort(table['created_at'][rows], kind='stable')]
+				if self.order == "newest":
+					rows = rows[::-1]
+			if self.max_rows is not None:
+				rows = rows[:self.max_rows]
+			plan.step(f"order by {self.order}" + (f", limit {self.max_rows}" if self.max_rows is not None else ""), len(rows))
+		return rows, columns, plan
+	
+	def _group_key(self, code: int, columns: ArchiveColumns) -> Hashable:
+		if self.grouping == "day":
+			return _EPOCH_DATE + datetime.timedelta(days=code)
+		if self.grouping == "user":
+			return columns.users.values[code] if code < len(columns.users) else None
+		if self.grouping == "yak":
+			return columns.yak_ids.values[code]
+		return code
+	
+	def _aggregate(self, weights: Optional[str]) -> tuple[int | dict, _Plan]:
+		import numpy as np
+		
+		rows, columns, plan = self._run()
+		table = (columns.yaks if self.table == "yaks" else columns.comments).to_numpy()
+		values = table[weights][rows] if weights is not None else None
+		if self.grouping is None:
+			return (int(values.sum()) if values is not None else len(rows)), plan
+		
+		# a code per row, for just the matching rows
+		if self.grouping in ("hour", "day", "weekday"):
+			local_time = table['created_at'][rows] + TIMEZONE.utcoffset(None) // datetime.timedelta(microseconds=1)
+			if self.grouping == "hour":
+				codes = (local_time // _HOUR) % 24
+			elif self.grouping == "weekday":
+				codes = (local_time // _DAY + 3) % 7 # 1970-01-01 was a thursday
+			else:
+				codes = local_time // _DAY
+		elif self.grouping == "user":
+			# None (-1) goes last
+			codes = table['user_id'][rows].astype(np.int64) % (len(columns.users) + 1)
+		else:
+			codes = (table['id'] if self.table == "yaks" else table['yak'])[rows]
+		groups, group_of_row = np.unique(codes, return_inverse=True)
+		totals = np.bincount(group_of_row, weights=values, minlength=len(groups)).astype(np.int64)
+		order = np.arange(len(groups))
+		if self.grouping in ("user", "yak"):
+			# biggest first, like yak_data's rankings
+			order = np.argsort(-totals, kind='stable')
+			if self.max_rows is not None:
+				order = order[:self.max_rows]
+		result = {self._group_key(int(groups[group]), columns): int(totals[group]) for group in order.tolist()}
+		plan.step(f"group by {self.grouping}", len(result))
+		return result, plan
+	
+	def count(self) -> int | dict[Any, int]:
+		"""How many yaks/comments match (per group, if grouped)"""
+		return self._aggregate(None)[0]
+	
+	def sum(self, column: Literal["votes", "comments"] = "votes") -> int | dict[Any, int]:
+		"""Total votes (or, for yaks, comment counts) of what matches"""
+		if column == "comments" and self.table != "yaks":
+			raise ValueError("Only yaks have comment counts")
+		return self._aggregate({'votes': 'vote_count', 'comments': 'comment_count'}[column])[0]
+	
+	def _keys(self) -> tuple[list[Hashable], _Plan]:
+		rows, columns, plan = self._run()
+		keys = (columns.yaks if self.table == "yaks" else columns.comments).keys
+		return [keys[row] for row in rows.tolist()], plan
+	
+	def ids(self) -> list[str]:
+		keys, _ = self._keys()
+		if self.table == "yaks":
+			return keys # type: ignore
+		return [comment_id for _, comment_id in keys] # type: ignore
+	
+	def _records(self) -> tuple[list[Yak | Comment], _Plan]:
+		keys, plan = self._keys()
+		if self.table == "yaks":
+			records = [self.archive.yak_hash[yak_id] for yak_id in keys] # type: list[Yak | Comment]
+		else:
+			records = [self.archive.get_comment(yak_id, comment_id) for yak_id, comment_id in keys] # type: ignore
+		plan.step(f"look up {self.table}", len(records))
+		return records, plan
+	
+	def all(self) -> list[Yak | Comment]:
+		"""The matching yaks/comments, in order"""
+		return self._records()[0]
+	
+	def __iter__(self):
+		return iter(self.all())
+	
+	def explain(self) -> str:
+		"""Run the query (`count` if it's grouped, `all` if not) and describe
+		how: which index picked the candidate rows (and what the others would
+		have left), what was filtered after, and how long each step took"""
+		_, plan = self._aggregate(None) if self.grouping is not None else self._records()
+		return str(plan)
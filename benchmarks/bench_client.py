@@ -0,0 +1,119 @@
+"""Throughput and latency of `YikYakClient` against the local fake server,
+at a few levels of concurrency (one client per worker thread).
+	
+	python benchmarks/bench_client.py [--concurrency 1 4 16] [--latency 0.05] [--error-rate 0.01]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Iterable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import client as client_module
+from client import YikYakClient
+from fake_server import FakeServer, FakeYikYak
+
+
+class RequestTimer:
+	"""Times every `requests.post` the client makes while it's active"""
+	
+	def __init__(self):
+		self.latencies = [] # type: list[float]
+		self.errors = 0
+		self._lock = threading.Lock()
+	
+	def failed(self):
+		with self._lock:
+			self.errors += 1
+	
+	@contextlib.contextmanager
+	def patch(self):
+		post = client_module.requests.post
+		
+		def timed_post(*args, **kwargs):
+			start = time.perf_counter()
+			response = post(*args, **kwargs)
+			elapsed = time.perf_counter() - start
+			with self._lock:
+				self.latencies.append(elapsed)
+			return response
+		
+		client_module.requests.post = timed_post
+		try:
+			yield self
+		finally:
+			client_module.requests.post = post
+
+def _percentile(values: list[float], percent: float) -> float:
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def run(server: FakeServer, concurrency: int, jobs: Iterable, work: Callable[[YikYakClient, object], int]) -> dict[str, float]:
+	"""Spread `jobs` over `concurrency` clients; `work` returns how many
+	items (yaks, comments, messages) one job fetched"""
+	timer = RequestTimer()
+	local = threading.local()
+	
+	def do_job(job) -> int:
+		try:
+			# injected errors can hit the token refresh too
+			if not hasattr(local, "client"):
+				local.client = YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url)
+			return work(local.client, job)
+		except Exception:
+			timer.failed()
+			return 0
+	
+	# the client prints cursors and responses as it goes
+	with timer.patch(), contextlib.redirect_stdout(io.StringIO()):
+		start = time.perf_counter()
+		with ThreadPoolExecutor(concurrency) as executor:
+			items = sum(executor.map(do_job, jobs))
+		elapsed = time.perf_counter() - start
+	
+	latencies = timer.latencies or [0.0]
+	return {
+		'seconds': elapsed,
+		'requests_per_second': len(timer.latencies) / elapsed,
+		'items_per_second': items / elapsed,
+		'p50_ms': statistics.median(latencies) * 1000,
+		'p99_ms': _percentile(latencies, 99) * 1000,
+		'failed_jobs': timer.errors,
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 16])
+	parser.add_argument("--yaks", type=int, default=5_000)
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+	parser.add_argument("--jitter", type=float, default=0.0)
+	parser.add_argument("--error-rate", type=float, default=0.0)
+	args = parser.parse_args()
+	
+	fake = FakeYikYak(args.yaks, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+	yak_ids = list(fake.yaks)
+	thread_ids = list(fake.threads)
+	
+	with FakeServer(fake) as server:
+		for concurrency in args.concurrency:
+			results = {
+				# one full walk of the feed per worker
+				'posts': run(server, concurrency, range(concurrency), lambda client, _: sum(1 for _ in client.posts())),
+				'comments': run(server, concurrency, yak_ids[:1000], lambda client, yak_id: sum(1 for _ in client.comments(yak_id))),
+				'messages': run(server, concurrency, thread_ids, lambda client, thread_id: sum(1 for _ in client.messages(thread_id))),
+			}
+			for name, result in results.items():
+				print(
+					f"{name:<9} x{concurrency:<3} {result['requests_per_second']:8.1f} pages/s {result['items_per_second']:9.1f} items/s"
+					f"  p50 {result['p50_ms']:6.1f}ms  p99 {result['p99_ms']:6.1f}ms  {result['failed_jobs']} failed"
+				)
+
+if __name__ == "__main__":
+	main()
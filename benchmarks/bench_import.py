@@ -0,0 +1,52 @@
+"""Cold-start cost of importing client, yak_archive and yak_data, each
+measured in a fresh interpreter.
+	
+	python benchmarks/bench_import.py [repeats]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["client", "yak_archive", "yak_data"]
+HEAVY_MODULES = ["matplotlib", "nltk", "numpy", "requests"]
+
+# run in the child: time the import and report peak rss (kB on linux) and
+# which heavy dependencies it pulled in
+_CHILD = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ','.join(loaded))
+"""
+
+
+def measure(module: str) -> tuple[float, int, str]:
+	result = subprocess.run(
+		[sys.executable, "-c", _CHILD.format(module=module, heavy=HEAVY_MODULES)],
+		cwd=ROOT, capture_output=True, text=True,
+	)
+	if result.returncode != 0:
+		raise ImportError(result.stderr.strip().splitlines()[-1])
+	elapsed, max_rss, loaded = result.stdout.split(' ')
+	return float(elapsed), int(max_rss), loaded.strip()
+
+def main():
+	repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+	
+	for module in MODULES:
+		try:
+			runs = [measure(module) for _ in range(repeats)]
+		except ImportError as e:
+			print(f"{module:<12} couldn't be imported ({e})")
+			continue
+		
+		elapsed = statistics.median(run[0] for run in runs)
+		max_rss = statistics.median(run[1] for run in runs)
+		print(f"{module:<12} {elapsed * 1000:7.1f}ms  {max_rss / 1024:6.1f}MB peak rss  loads: {runs[0][2] or 'nothing heavy'}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,97 @@
+"""Compare the memory used by plain dataclass records against the slotted,
+interned Yak and Comment classes.
+	
+	python benchmarks/bench_memory.py [num_yaks] [comments_per_yak]
+"""
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+from dataclasses import fields, make_dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comment import Comment
+from yak import Yak
+
+
+COLORS = [('#00CBFE', '#00CBFE'), ('#15FF46', '#3FC0FF'), ('#FA81FF', '#FF1885'), ('#FFD815', '#FFD815')]
+EMOJIS = ['🐸', '🦊', '🐙', '🌵', '🍕']
+
+
+def fake_nodes(num_yaks: int, comments_per_yak: int, seed: int = 0) -> tuple[str, str]:
+	rng = random.Random(seed)
+	start = datetime.datetime(2022, 10, 13, tzinfo=datetime.timezone.utc)
+	yak_nodes, comment_nodes = [], []
+	for i in range(num_yaks):
+		color, secondary_color = rng.choice(COLORS)
+		created_at = start + datetime.timedelta(seconds=rng.randrange(90 * 24 * 3600))
+		yak_nodes.append({
+			"id": f"Yak:{i}", "userId": f"user{rng.randrange(num_yaks // 10 + 1)}",
+			"videoId": "", "videoPlaybackDashUrl": "", "videoPlaybackHlsUrl": "",
+			"videoDownloadMp4Url": "", "videoThumbnailUrl": "", "videoState": "NONE",
+			"text": f"yak number {i}", "userEmoji": rng.choice(EMOJIS),
+			"userColor": color, "secondaryUserColor": secondary_color,
+			"distance": rng.randrange(5), "geohash": None, "interestAreas": ["local"],
+			"createdAt": created_at.isoformat(), "commentCount": comments_per_yak,
+			"voteCount": rng.randrange(-5, 100), "isIncognito": rng.random() < 0.8,
+			"isMine": False, "isReported": False, "myVote": "NONE",
+		})
+		for j in range(comments_per_yak):
+			color, secondary_color = rng.choice(COLORS)
+			comment_nodes.append({
+				"id": f"Comment:{i}:{j}", "userId": f"user{rng.randrange(num_yaks // 10 + 1)}",
+				"text": f"comment {j}", "createdAt": (created_at + datetime.timedelta(minutes=j)).isoformat(),
+				"userEmoji": rng.choice(EMOJIS), "userColor": color, "secondaryUserColor": secondary_color,
+				"isMine": False, "isReported": False, "voteCount": rng.randrange(-5, 20), "myVote": "NONE",
+			})
+	
+	return json.dumps(yak_nodes), json.dumps(comment_nodes)
+
+def plain_class(cls: type) -> type:
+	# what Yak/Comment looked like before: a plain dataclass with a __dict__
+	return make_dataclass(f"Plain{cls.__name__}", [(field.name, field.type) for field in fields(cls)])
+
+def plain_from_json(plain_cls: type, node: dict):
+	values = {}
+	for field in fields(plain_cls):
+		head, *rest = field.name.split('_')
+		values[field.name] = node.get(head + ''.join(word.title() for word in rest))
+	values['created_at'] = datetime.datetime.fromisoformat(values['created_at'])
+	return plain_cls(**values)
+
+def measure(raw_nodes: str, build) -> int:
+	# parse inside the traced region so the strings the records keep alive
+	# from the json are counted too
+	gc.collect()
+	tracemalloc.start()
+	nodes = json.loads(raw_nodes)
+	records = [build(node) for node in nodes]
+	del nodes
+	gc.collect()
+	current, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del records
+	return current
+
+def main():
+	num_yaks = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+	comments_per_yak = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+	raw_yaks, raw_comments = fake_nodes(num_yaks, comments_per_yak)
+	
+	PlainYak, PlainComment = plain_class(Yak), plain_class(Comment)
+	
+	before = measure(raw_yaks, lambda node: plain_from_json(PlainYak, node)) \
+		+ measure(raw_comments, lambda node: plain_from_json(PlainComment, node))
+	after = measure(raw_yaks, Yak.from_json) + measure(raw_comments, Comment.from_json)
+	
+	num_records = num_yaks * (1 + comments_per_yak)
+	print(f"{num_records} records ({num_yaks} yaks, {num_yaks * comments_per_yak} comments)")
+	print(f"before: {before / 2**20:8.1f} MiB ({before / num_records:.0f} B/record)")
+	print(f"after:  {after / 2**20:8.1f} MiB ({after / num_records:.0f} B/record)")
+	print(f"saved:  {1 - after / before:8.1%}")
+
+if __name__ == '__main__': main()
@@ -0,0 +1,148 @@
+"""Time and peak memory of the archive and yak_data hot paths on synthetic
+archives, optionally written out as json to compare between commits.
+	
+	python benchmarks/bench_suite.py [--sizes 10000 100000] [--seed 0] [--json results.json] [--only most_active]
+
+Sizes are numbers of yaks; there are ~5 comments per yak on top of that.
+Every case runs twice: once untraced for the time, then again under
+tracemalloc for the peak memory.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SyntheticArchive
+from yak_archive import Archive, YakArchive
+import yak_data
+
+# (name, setup, run): setup builds fresh inputs for each run, so cases that
+# change the archive always start from the same state
+Case = tuple[str, Callable[[], Any], Callable[[Any], Any]]
+
+
+def archive_cases(path: str, archive: Archive, threads: list) -> list[Case]:
+	def loaded() -> YakArchive:
+		return YakArchive(path, Archive(list(archive.yaks), dict(archive.comments)))
+	
+	def add_yaks(target: YakArchive):
+		for yak, _ in threads:
+			target.add_yak(yak)
+	
+	def add_comments(target: YakArchive):
+		for yak, comments in threads:
+			target.add_comments(yak.id, comments)
+	
+	def with_yaks() -> YakArchive:
+		target = YakArchive(os.devnull, Archive([], {}))
+		add_yaks(target)
+		return target
+	
+	def iterate(target: YakArchive):
+		for _ in target: pass
+	
+	return [
+		("save", loaded, YakArchive.save),
+		("load", lambda: path, YakArchive),
+		("add_yak", lambda: YakArchive(os.devnull, Archive([], {})), add_yaks),
+		("add_comments", with_yaks, add_comments),
+		("iterate", loaded, iterate),
+	]
+
+def analysis_cases(archive: YakArchive) -> list[Case]:
+	top_user = next(iter(yak_data.most_active_users(archive)))
+	
+	def clear_caches() -> YakArchive:
+		archive.token_cache.clear()
+		archive._indexes.pop('emojis', None)
+		return archive
+	
+	return [
+		("avg_yaks_per_hour", lambda: archive, yak_data.avg_yaks_per_hour),
+		("avg_yaks_per_hour_vectorized", lambda: archive, yak_data.avg_yaks_per_hour_vectorized),
+		("most_common_words", clear_caches, yak_data.most_common_words),
+		("most_active_users", lambda: archive, yak_data.most_active_users),
+		("most_active_users_vectorized", lambda: archive, yak_data.most_active_users_vectorized),
+		("common_coupled_users", lambda: archive, yak_data.common_coupled_users),
+		("approx_most_active_users", lambda: archive, yak_data.approx_most_active_users),
+		("approx_common_coupled_users", lambda: archive, yak_data.approx_common_coupled_users),
+		("approx_distinct_users", lambda: archive, yak_data.approx_distinct_users),
+		("get_emojis", clear_caches, lambda archive: yak_data.get_emojis(archive, top_user)),
+		("all_emojis", clear_caches, yak_data.all_emojis),
+		("yaks_by_user", lambda: archive, yak_data.yaks_by_user),
+		("comments_by_user", lambda: archive, yak_data.comments_by_user),
+	]
+
+def run_case(setup: Callable[[], Any], run: Callable[[Any], Any]) -> dict[str, Any]:
+	# the archive classes print progress, which would drown out the results
+	with contextlib.redirect_stdout(io.StringIO()):
+		try:
+			inputs = setup()
+			gc.collect()
+			start = time.perf_counter()
+			run(inputs)
+			seconds = time.perf_counter() - start
+			
+			inputs = setup()
+			gc.collect()
+			tracemalloc.start()
+			run(inputs)
+			_, peak = tracemalloc.get_traced_memory()
+		except Exception as e:
+			return {'error': f"{type(e).__name__}: {e}"}
+		finally:
+			tracemalloc.stop()
+	return {'seconds': seconds, 'peak_bytes': peak}
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 100_000])
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--json", help="also write the results to this file")
+	parser.add_argument("--only", help="only run cases with this in their name")
+	args = parser.parse_args()
+	
+	results = []
+	for size in args.sizes:
+		synthetic = SyntheticArchive(size, seed=args.seed)
+		threads = list(synthetic.threads())
+		archive = Archive(sorted((yak for yak, _ in threads), key=lambda yak: yak.created_at, reverse=True), {yak.id: comments for yak, comments in threads if comments})
+		num_comments = sum(len(comments) for _, comments in threads)
+		print(f"{size} yaks, {num_comments} comments, {synthetic.num_users} users")
+		
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "bench.yakarchive")
+			with contextlib.redirect_stdout(io.StringIO()):
+				YakArchive(path, archive).save()
+				analysed = YakArchive(path, archive)
+			
+			for name, setup, run in archive_cases(path, archive, threads) + analysis_cases(analysed):
+				if args.only and args.only not in name: continue
+				result = {'case': name, 'yaks': size, 'comments': num_comments, **run_case(setup, run)}
+				results.append(result)
+				if 'error' in result:
+					print(f"  {name:<30} failed ({result['error']})")
+				else:
+					print(f"  {name:<30} {result['seconds']:8.3f}s  {result['peak_bytes'] / 2**20:8.1f}MB peak")
+	
+	if args.json:
+		with open(args.json, 'w') as file_handle:
+			json.dump({
+				'python': platform.python_version(),
+				'platform': platform.platform(),
+				'seed': args.seed,
+				'results': results,
+			}, file_handle, indent='\t')
+
+if __name__ == "__main__":
+	main()
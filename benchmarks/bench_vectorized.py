@@ -0,0 +1,46 @@
+"""Time the python-loop and numpy versions of avg_yaks_per_hour and
+most_active_users on a synthetic archive, and check they agree.
+	
+	python benchmarks/bench_vectorized.py [num_yaks] [comments_per_yak]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_memory import fake_nodes
+from comment import Comment
+from yak import Yak
+from yak_archive import Archive, YakArchive
+import yak_data
+
+
+def timed(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return result, time.perf_counter() - start
+
+def main():
+	num_yaks = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+	comments_per_yak = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+	
+	raw_yaks, raw_comments = fake_nodes(num_yaks, comments_per_yak)
+	archive = YakArchive(os.devnull, Archive([Yak.from_json(node) for node in json.loads(raw_yaks)], {}))
+	for comment in map(Comment.from_json, json.loads(raw_comments)):
+		archive.archive.comments.setdefault("Yak:" + comment.id.split(':')[1], []).append(comment)
+	
+	_, build_time = timed(archive.to_columns)
+	print(f"{num_yaks} yaks, {num_yaks * comments_per_yak} comments (column view built in {build_time:.2f}s)")
+	
+	for loop, vectorized in [
+		(yak_data.avg_yaks_per_hour, yak_data.avg_yaks_per_hour_vectorized),
+		(yak_data.most_active_users, yak_data.most_active_users_vectorized),
+	]:
+		expected, loop_time = timed(loop, archive)
+		result, vectorized_time = timed(vectorized, archive)
+		assert result == expected and list(result) == list(expected), f"{vectorized.__name__} disagrees with {loop.__name__}"
+		print(f"{loop.__name__:20} loop {loop_time:7.3f}s   numpy {vectorized_time:7.3f}s   ({loop_time / vectorized_time:.0f}x)")
+
+if __name__ == '__main__': main()
@@ -0,0 +1,355 @@
+"""A local stand-in for api.yikyak.com/graphql and securetoken, serving a
+synthetic archive so `YikYakClient` can be load tested.
+
+Operations are told apart by `operationName` (the server doesn't parse
+GraphQL) and answered in the shape the client's queries ask for, with
+cursor pagination. Latency and errors (401, 429, 5xx) can be injected.
+	
+	python benchmarks/fake_server.py [port] [num_yaks]
+"""
+import base64
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comment import Comment
+from synthetic import EMOJIS, SyntheticArchive
+from yak import Yak
+from yak_data import COLOR_CODES
+
+
+def yak_node(yak: Yak) -> dict[str, Any]:
+	return {
+		"__typename": "Yak",
+		"id": yak.id,
+		"userId": yak.user_id,
+		"videoId": yak.video_id or "",
+		"videoPlaybackDashUrl": yak.video_playback_dash_url or "",
+		"videoPlaybackHlsUrl": yak.video_playback_hls_url or "",
+		"videoDownloadMp4Url": yak.video_download_mp4_url or "",
+		"videoThumbnailUrl": yak.video_thumbnail_url or "",
+		"videoState": yak.video_state,
+		"text": yak.text,
+		"userEmoji": yak.user_emoji or "",
+		"userColor": yak.user_color or "",
+		"secondaryUserColor": yak.secondary_user_color or "",
+		"distance": yak.distance,
+		"geohash": yak.geohash,
+		"interestAreas": list(yak.interest_areas),
+		"createdAt": yak.created_at.isoformat(),
+		"commentCount": yak.comment_count,
+		"voteCount": yak.vote_count,
+		"isIncognito": yak.is_incognito,
+		"isMine": yak.is_mine,
+		"isReported": yak.is_reported,
+		"myVote": yak.my_vote,
+	}
+
+def comment_node(comment: Comment) -> dict[str, Any]:
+	return {
+		"__typename": "Comment",
+		"id": comment.id,
+		"userId": comment.user_id,
+		"text": comment.text,
+		"createdAt": comment.created_at.isoformat(),
+		"userEmoji": "" if comment.user_emoji == "OP" else comment.user_emoji,
+		"userColor": comment.user_color or "",
+		"secondaryUserColor": comment.secondary_user_color or "",
+		"isMine": comment.is_mine,
+		"isReported": comment.is_reported,
+		"voteCount": comment.vote_count,
+		"myVote": comment.my_vote,
+	}
+
+def _base64url(data: bytes) -> str:
+	return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def fake_jwt(user_id: str, lifetime: int = 3600) -> str:
+	# the client only decodes access tokens (without checking the
+	# signature), so the signature is junk
+	now = int(time.time())
+	header = {"alg": "RS256", "typ": "JWT"}
+	payload = {
+		"iss": "https://securetoken.google.com/yikyak-fake",
+		"aud": "yikyak-fake",
+		"auth_time": now,
+		"user_id": user_id,
+		"sub": user_id,
+		"iat": now,
+		"exp": now + lifetime,
+		"phone_number": "+15555550100",
+		"firebase": {"identities": {"phone": ["+15555550100"]}, "sign_in_provider": "phone"},
+	}
+	return '.'.join(_base64url(json.dumps(part).encode()) for part in (header, payload)) + '.' + _base64url(b"fake")
+
+def _page(items: list, variables: dict[str, Any]) -> tuple[list, dict[str, Any]]:
+	# cursors are just the (encoded) offset of the next item
+	cursor = variables.get("cursor")
+	start = int(base64.b64decode(cursor)) if cursor else 0
+	end = start + (variables.get("pageLimit") or 100)
+	page_info = {
+		"__typename": "PageInfo",
+		"endCursor": base64.b64encode(str(end).encode()).decode() if end < len(items) else None,
+		"hasNextPage": end < len(items),
+	}
+	return items[start:end], page_info
+
+def _edges(nodes: list[dict[str, Any]], typename: str) -> list[dict[str, Any]]:
+	return [{"__typename": typename, "node": node} for node in nodes]
+
+
+class FakeYikYak:
+	"""The data and fault injection behind the fake server.
+	
+	`latency` is the base delay of every response in seconds, plus up to
+	`jitter` more. Each request fails with probability `error_rate`, with a
+	status picked from `error_statuses`."""
+	
+	def __init__(self,
+		num_yaks: int = 10_000,
+		num_threads: int = 100,
+		messages_per_thread: int = 250,
+		seed: int = 0,
+		latency: float = 0.0,
+		jitter: float = 0.0,
+		error_rate: float = 0.0,
+		error_statuses: tuple[int, ...] = (401, 429, 500, 502, 503),
+	):
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.error_statuses = error_statuses
+		self.rng = random.Random(seed)
+		self._lock = threading.Lock()
+		
+		synthetic = SyntheticArchive(num_yaks, seed=seed)
+		self.yaks = {} # type: dict[str, Yak]
+		self.comments = {} # type: dict[str, list[Comment]]
+		for yak, comments in synthetic.threads():
+			self.yaks[yak.id] = yak
+			self.comments[yak.id] = comments
+		self.new_feed = sorted(self.yaks.values(), key=lambda yak: yak.created_at, reverse=True)
+		self.top_feed = sorted(self.yaks.values(), key=lambda yak: yak.vote_count, reverse=True)
+		
+		self.threads = dict(self._fake_thread(i, messages_per_thread) for i in range(num_threads))
+		self.access_tokens = set() # type: set[str]
+		self.requests = 0
+	
+	def _fake_thread(self, i: int, num_messages: int) -> tuple[str, dict[str, Any]]:
+		rng = self.rng
+		created_at = datetime.datetime(2022, 10, 13, tzinfo=datetime.timezone.utc) + datetime.timedelta(minutes=rng.randrange(90 * 24 * 60))
+		participants = []
+		for j, is_self in enumerate((True, False)):
+			color, secondary_color = rng.choice(list(COLOR_CODES))
+			participants.append({
+				"__typename": "Participant", "id": f"Participant:{i}:{j}", "emoji": rng.choice(EMOJIS),
+				"color": color, "secondaryColor": secondary_color, "isOp": j == 0,
+				"isSelf": is_self, "isReported": False, "hasUnreadMessages": False,
+			})
+		messages = []
+		for j in range(num_messages):
+			created_at += datetime.timedelta(seconds=rng.randrange(1, 600))
+			sender = rng.randrange(2)
+			messages.append({
+				"__typename": "Message", "id": f"Message:{i}:{j}", "text": f"message {j}",
+				"isMine": sender == 0, "isOp": sender == 0,
+				"participantId": participants[sender]["id"], "createdAt": created_at.isoformat(),
+			})
+		messages.reverse() # newest first, like orderBy: -created_at
+		thread = {
+			"__typename": "Thread", "id": f"Thread:{i}", "title": f"thread {i}",
+			"isDisabled": False, "isDraft": False,
+			"participants": {"__typename": "ParticipantConnection", "edges": _edges(participants, "ParticipantEdge")},
+			"createdAt": messages[-1]["createdAt"] if messages else created_at.isoformat(),
+			"lastActiveAt": created_at.isoformat(),
+			"instance": f"Yak:{i}", "instanceDisplayType": "Yak",
+			"messages": messages,
+		}
+		return thread["id"], thread
+	
+	def fault(self) -> Optional[int]:
+		"""Sleep for the configured latency, then maybe pick an error status"""
+		with self._lock:
+			self.requests += 1
+			delay = self.latency + self.rng.random() * self.jitter
+			failed = self.rng.random() < self.error_rate
+			status = self.rng.choice(self.error_statuses) if failed else None
+		if delay:
+			time.sleep(delay)
+		return status
+	
+	def issue_token(self, refresh_token: str) -> str:
+		token = fake_jwt(f"user-{refresh_token[:8]}")
+		with self._lock:
+			self.access_tokens.add(token)
+		return token
+	
+	def graphql(self, operation: str, variables: dict[str, Any]) -> dict[str, Any]:
+		handler = getattr(self, f"_op_{operation}", None)
+		if handler is None:
+			return {"data": None, "errors": [{"message": f"Unknown operation {operation}"}]}
+		return {"data": handler(variables or {})}
+	
+	def _op_Feed(self, variables: dict[str, Any]) -> dict[str, Any]:
+		feed = self.top_feed if variables.get("feedOrder") == "TOP" else self.new_feed
+		yaks, page_info = _page(feed, variables)
+		return {"feed": {"__typename": "YakConnection", "edges": _edges(list(map(yak_node, yaks)), "YakEdge"), "pageInfo": page_info}}
+	
+	def _op_YakComments(self, variables: dict[str, Any]) -> dict[str, Any]:
+		if variables["id"] not in self.yaks:
+			return {"yak": None}
+		comments, page_info = _page(self.comments[variables["id"]], variables)
+		return {"yak": {"__typename": "Yak", "comments": {
+			"__typename": "CommentConnection", "edges": _edges(list(map(comment_node, comments)), "CommentEdge"), "pageInfo": page_info,
+		}}}
+	
+	def _op_Yak(self, variables: dict[str, Any]) -> dict[str, Any]:
+		yak = self.yaks.get(variables["id"])
+		return {"yak": yak_node(yak) if yak is not None else None}
+	
+	def _op_Messages(self, variables: dict[str, Any]) -> dict[str, Any]:
+		thread = self.threads.get(variables["threadId"])
+		if thread is None:
+			return {"node": None}
+		messages, page_info = _page(thread["messages"], variables)
+		return {"node": {**thread, "messages": {
+			"__typename": "MessageConnection", "edges": _edges(messages, "MessageEdge"), "pageInfo": page_info,
+		}}}
+	
+	def _op_SingleThread(self, variables: dict[str, Any]) -> dict[str, Any]:
+		thread = self.threads.get(variables["id"])
+		if thread is None:
+			return {"thread": None}
+		return {"thread": {key: value for key, value in thread.items() if key != "messages"}}
+	
+	def _op_GetYakarma(self, variables: dict[str, Any]) -> dict[str, Any]:
+		return {"me": {"__typename": "Me", "yakarmaScore": 1000}}
+	
+	def _op_GetMe(self, variables: dict[str, Any]) -> dict[str, Any]:
+		return {"me": {
+			"__typename": "Me", "username": "fake", "completedTutorial": True, "emoji": "🐸",
+			"color": "#15FF46", "secondaryColor": "#15FF46", "yakarmaScore": 1000,
+			"muteDetails": {"__typename": "MuteDetails", "isMuted": False, "expiration": None, "instance": None, "text": None},
+		}}
+	
+	def _op_CreateYak(self, variables: dict[str, Any]) -> dict[str, Any]:
+		node = variables["input"]
+		with self._lock:
+			yak_id = f"Yak:new{len(self.yaks)}"
+		return {"createYak": {"__typename": "CreateYakPayload", "errors": None, "yak": {
+			"__typename": "Yak", "id": yak_id, "text": node["text"], "interestAreas": node.get("interestAreas", []),
+			"distance": 0, "userColor": node.get("userColor"), "secondaryUserColor": node.get("secondaryUserColor"),
+			"userEmoji": node.get("userEmoji"),
+		}}}
+	
+	def _op_CreateComment(self, variables: dict[str, Any]) -> dict[str, Any]:
+		node = variables["input"]
+		return {"createComment": {"__typename": "CreateCommentPayload", "errors": None, "comment": {
+			"__typename": "Comment", "id": f"Comment:new:{node['yakId']}", "text": node["text"],
+			"userColor": "#15FF46", "secondaryUserColor": "#15FF46", "userEmoji": "🐸",
+			"createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(), "voteCount": 0, "myVote": "NONE",
+		}}}
+	
+	def _op_ResetConversationIcon(self, variables: dict[str, Any]) -> dict[str, Any]:
+		color, secondary_color = self.rng.choice(list(COLOR_CODES))
+		return {"resetConversationIcon": {
+			"__typename": "ResetConversationIconPayload", "emoji": self.rng.choice(EMOJIS),
+			"color": color, "secondaryColor": secondary_color, "errors": None,
+		}}
+	
+	def _op_RemoveYak(self, variables: dict[str, Any]) -> dict[str, Any]:
+		return {"removeYak": {"__typename": "RemoveYakPayload", "errors": None}}
+	
+	def _op_RemoveComment(self, variables: dict[str, Any]) -> dict[str, Any]:
+		return {"removeComment": {"__typename": "RemoveCommentPayload", "errors": None}}
+	
+	def _op_UnblockAll(self, variables: dict[str, Any]) -> dict[str, Any]:
+		return {"unblockAll": {"__typename": "UnblockAllPayload", "errors": None}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+	server: "FakeServer"
+	protocol_version = "HTTP/1.1" # keep-alive, like the real api
+	
+	def log_message(self, format, *args):
+		pass
+	
+	def _send(self, status: int, body: Any):
+		data = json.dumps(body).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		if status == 429:
+			self.send_header("Retry-After", "1")
+		self.end_headers()
+		self.wfile.write(data)
+	
+	def do_POST(self):
+		fake = self.server.fake
+		body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+		
+		status = fake.fault()
+		if status is not None:
+			self._send(status, {"errors": [{"message": f"Injected {status}"}]})
+		elif self.path.startswith("/v1/token"):
+			token = fake.issue_token(body["refresh_token"])
+			self._send(200, {"access_token": token, "expires_in": "3600", "token_type": "Bearer", "refresh_token": body["refresh_token"]})
+		elif self.path.startswith("/graphql"):
+			if self.headers.get("Authorization") not in fake.access_tokens:
+				self._send(401, {"errors": [{"message": "Unauthorized"}]})
+			else:
+				self._send(200, fake.graphql(body["operationName"], body.get("variables")))
+		else:
+			self._send(404, {"errors": [{"message": "Not found"}]})
+
+
+class FakeServer(ThreadingHTTPServer):
+	"""Serves a `FakeYikYak` on localhost in a background thread.
+	
+	Use as a context manager; `api_url` and `token_url` go straight into
+	`YikYakClient`."""
+	
+	daemon_threads = True
+	
+	def __init__(self, fake: FakeYikYak, port: int = 0):
+		super().__init__(("127.0.0.1", port), _Handler)
+		self.fake = fake
+		self._thread = None # type: Optional[threading.Thread]
+	
+	@property
+	def api_url(self) -> str:
+		return f"http://127.0.0.1:{self.server_address[1]}/graphql/"
+	
+	@property
+	def token_url(self) -> str:
+		return f"http://127.0.0.1:{self.server_address[1]}/v1/token?key=fake"
+	
+	def __enter__(self):
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+	
+	def __exit__(self, *exc_info):
+		self.shutdown()
+		self.server_close()
+		return False
+
+
+def main():
+	port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+	num_yaks = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+	
+	server = FakeServer(FakeYikYak(num_yaks), port)
+	print(f"Serving {num_yaks} yaks at {server.api_url} (tokens at {server.token_url})")
+	server.serve_forever()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,168 @@
+"""Seeded synthetic archives for benchmarks, shaped roughly like the real
+thing: a few users post most of the yaks (zipf), posting follows the time
+of day, a handful of threads get most of the comments, and comment colors
+and emojis come from `yak_data.COLOR_CODES`.
+	
+	python benchmarks/synthetic.py <num_yaks> <output path> [seed]
+"""
+import datetime
+from itertools import accumulate
+import os
+import random
+import sys
+from typing import Generator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comment import Comment
+from interning import shared_tuple
+from yak import Yak
+from yak_archive import ARCHIVE_START, Archive
+from yak_data import COLOR_CODES
+
+
+# relative number of posts in each hour of the day (quiet overnight, busiest
+# late evening)
+HOURLY_WEIGHTS = [6, 4, 2, 1, 1, 1, 2, 3, 5, 6, 7, 8, 9, 9, 9, 10, 10, 11, 12, 13, 14, 14, 12, 9]
+
+# the two tone (gradient) colors are much rarer than the solid ones
+COLORS = list(COLOR_CODES)
+COLOR_WEIGHTS = [1 if primary == secondary else 0.15 for primary, secondary in COLORS]
+EMOJIS = ['🐸', '🦊', '🐙', '🌵', '🍕', '🐝', '🦄', '🐼', '🍉', '🌈', '🐢', '🐧', '🍄', '🦋', '🐳', '🌻']
+
+VOCABULARY = (
+	"the i you a to and is it that of in my this for so be on just like not what "
+	"do are have me but was with anyone if at why can people how get your who he "
+	"class here she all they when one no we know someone there up yak out about "
+	"campus dining hall tonight party professor exam library dorm roommate week "
+	"love hate wait lol actually really literally today tomorrow again going think"
+).split()
+
+
+class SyntheticArchive:
+	"""Makes the same archive every time for the same arguments"""
+	
+	def __init__(self,
+		num_yaks: int,
+		comments_per_yak: float = 5.0,
+		num_users: int | None = None,
+		days: int = 90,
+		seed: int = 0,
+	):
+		self.num_yaks = num_yaks
+		self.comments_per_yak = comments_per_yak
+		self.num_users = num_users or max(num_yaks // 5, 1)
+		self.days = days
+		self.rng = random.Random(seed)
+		
+		self.users = [f"user{i}" for i in range(self.num_users)]
+		self._user_weights = list(accumulate(1 / rank**1.1 for rank in range(1, self.num_users + 1)))
+		self._word_weights = list(accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+		self._hour_weights = list(accumulate(HOURLY_WEIGHTS))
+		self._color_weights = list(accumulate(COLOR_WEIGHTS))
+		
+		# most people stick to a favorite color and emoji, which is what
+		# yak_data.get_emojis picks up on
+		self._favorites = {} # type: dict[str, tuple[tuple[str, str], str]]
+	
+	def _user(self) -> str:
+		return self.rng.choices(self.users, cum_weights=self._user_weights)[0]
+	
+	def _text(self) -> str:
+		return ' '.join(self.rng.choices(VOCABULARY, cum_weights=self._word_weights, k=self.rng.randint(3, 30)))
+	
+	def _look(self, user_id: str) -> tuple[tuple[str, str], str]:
+		rng = self.rng
+		favorite = self._favorites.get(user_id)
+		if favorite is None:
+			favorite = self._favorites[user_id] = (rng.choices(COLORS, cum_weights=self._color_weights)[0], rng.choice(EMOJIS))
+		if rng.random() < 0.7:
+			return favorite
+		return rng.choices(COLORS, cum_weights=self._color_weights)[0], rng.choice(EMOJIS)
+	
+	def _created_at(self) -> datetime.datetime:
+		rng = self.rng
+		hour = rng.choices(range(24), cum_weights=self._hour_weights)[0]
+		return ARCHIVE_START + datetime.timedelta(days=rng.randrange(self.days), hours=hour, seconds=rng.randrange(3600))
+	
+	def _yak(self, i: int) -> Yak:
+		rng = self.rng
+		user_id = self._user()
+		(color, secondary_color), emoji = self._look(user_id)
+		return Yak(
+			id=f"Yak:{i}",
+			video_id=None, video_playback_dash_url=None, video_playback_hls_url=None,
+			video_download_mp4_url=None, video_thumbnail_url=None, video_state="NONE",
+			text=self._text(),
+			user_emoji=emoji, user_color=color, secondary_user_color=secondary_color, # type: ignore
+			distance=rng.randrange(5), geohash=None, interest_areas=shared_tuple(["local"]),
+			created_at=self._created_at(),
+			comment_count=0,
+			vote_count=int(rng.paretovariate(1.2)) - 1 - rng.randrange(3),
+			is_incognito=rng.random() < 0.8,
+			is_mine=False, is_reported=False, my_vote="NONE",
+			user_id=user_id,
+		)
+	
+	def _comments(self, yak: Yak) -> list[Comment]:
+		rng = self.rng
+		# heavy tailed: most threads get a few comments, a few get hundreds
+		num_comments = int(self.comments_per_yak * (rng.paretovariate(2.0) - 1))
+		
+		comments = []
+		created_at = yak.created_at
+		for j in range(num_comments):
+			created_at += datetime.timedelta(seconds=int(rng.expovariate(1 / 600)))
+			if rng.random() < 0.15:
+				# the original poster replying
+				user_id, color, secondary_color, emoji = yak.user_id, None, None, "OP"
+			else:
+				user_id = self._user()
+				(color, secondary_color), emoji = self._look(user_id)
+			comments.append(Comment(
+				id=f"Comment:{yak.id[4:]}:{j}",
+				text=self._text(),
+				created_at=created_at,
+				user_emoji=emoji,
+				user_color=color,
+				secondary_user_color=secondary_color,
+				is_mine=False, is_reported=False,
+				vote_count=int(rng.paretovariate(1.5)) - 1 - rng.randrange(2),
+				my_vote="NONE",
+				user_id=user_id,
+			))
+		yak.comment_count = len(comments)
+		return comments
+	
+	def threads(self) -> Generator[tuple[Yak, list[Comment]], None, None]:
+		"""Each yak with its comments, one at a time (in id order, not time
+		order, like a crawler adding them)"""
+		for i in range(self.num_yaks):
+			yak = self._yak(i)
+			yield yak, self._comments(yak)
+	
+	def archive(self) -> Archive:
+		yaks, comments = [], {}
+		for yak, thread in self.threads():
+			yaks.append(yak)
+			if thread:
+				comments[yak.id] = thread
+		yaks.sort(key=lambda yak: yak.created_at, reverse=True)
+		return Archive(yaks, comments)
+
+
+def generate_archive(num_yaks: int, comments_per_yak: float = 5.0, seed: int = 0) -> Archive:
+	return SyntheticArchive(num_yaks, comments_per_yak, seed=seed).archive()
+
+def main():
+	from archive_format import save_archive
+	
+	num_yaks, path = int(sys.argv[1]), sys.argv[2]
+	seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+	
+	archive = generate_archive(num_yaks, seed=seed)
+	save_archive(path, archive)
+	print(f"{len(archive.yaks)} yaks and {sum(map(len, archive.comments.values()))} comments written to {path}")
+
+if __name__ == "__main__":
+	main()
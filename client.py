@@ -1,8 +1,9 @@
 from dataclasses import dataclass
-from typing import Generator, Iterator, Literal, Optional
+from typing import Any, Generator, Iterator, Literal, Optional
 import requests
 import jwt
 from dm_thread import Message, Thread
+from lazy_records import LazyComment, LazyYak
 from yak import Yak
 from comment import Comment
 
@@ -35,16 +36,73 @@ class YikYakAuthToken:
     def encode(self) -> str:
         return self._jwt
 
+FEED_QUERY_GRAPHQL = """query Feed($feedType: FeedType, $feedOrder: FeedOrder, $pageLimit: Int, $cursor: String, $point: FixedPointScalar) {
+  feed(
+    feedType: $feedType
+    feedOrder: $feedOrder
+    first: $pageLimit
+    after: $cursor
+    point: $point
+  ) {
+    __typename
+    edges {
+      __typename
+      node {
+        __typename
+        id
+        userId
+        videoId
+        videoPlaybackDashUrl
+        videoPlaybackHlsUrl
+        videoDownloadMp4Url
+        videoThumbnailUrl
+        videoState
+        text
+        userEmoji
+        userColor
+        secondaryUserColor
+        distance
+        geohash
+        interestAreas
+        createdAt
+        commentCount
+        voteCount
+        isIncognito
+        isMine
+        isReported
+        myVote
+      }
+    }
+    pageInfo {
+      __typename
+      endCursor
+      hasNextPage
+    }
+  }
+}"""
+
+COMMENT_QUERY_GRAPHQL = """query YakComments($id: ID!, $pageLimit: Int, $cursor: String) {\n  yak(id: $id) {\n   __typename\n   comments(first: $pageLimit, after: $cursor) {\n     __typename\n     edges {\n       __typename\n       node {\n         __typename\n         id\n         userId\n         text\n         createdAt\n         userEmoji\n         userColor\n         secondaryUserColor\n         isMine\n         isReported\n         voteCount\n         myVote\n       }\n      }\n      pageInfo {\n        __typename\n        endCursor\n        hasNextPage\n      }\n    }\n  }\n}"""
+
+class NotFoundError(ValueError):
+    """The yak or thread asked for doesn't exist (or has been deleted)"""
+
+
 class YikYakClient:
     def __init__(self, refresh_token: str, 
         location: tuple[float, float],
         client_name: str = "com.yikyak.2", 
         user_agent: str = "Yik%20Yak/96 CFNetwork/1335.0.3 Darwin/21.6.0",
+        api_url: str = "https://api.yikyak.com/graphql/",
+        token_url: str = "https://securetoken.googleapis.com/v1/token?key=REDACTED",
     ):
         self.refresh_token = refresh_token
         self.location = f"POINT({location[0]} {location[1]})"
         self.client_name = client_name
         self.user_agent = user_agent
+        # overridable so the client can be pointed at a local stand-in
+        # (see benchmarks/fake_server.py)
+        self.api_url = api_url
+        self.token_url = token_url
         
         self.refresh_access_token()
     
@@ -53,7 +111,7 @@ class YikYakClient:
     
     def get_access_token(self) -> YikYakAuthToken:
         response = requests.post(
-            "https://securetoken.googleapis.com/v1/token?key=REDACTED",
+            self.token_url,
             headers={
                 'Content-Type': 'application/json',
                 'X-Client-Version': 'iOS/FirebaseSDK/9.0.0/FirebaseCore-iOS',
@@ -87,7 +145,7 @@ class YikYakClient:
     
     def yakarma(self) -> int:
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'GetYakarma'),
             json={
                 "operationName": "GetYakarma",
@@ -100,59 +158,15 @@ class YikYakClient:
         
         return response_json['data']['me']['yakarmaScore']
     
-    def posts(self, 
-        num_posts: Optional[int] = None,
+    def feed_page(self,
         cursor_position: Optional[str] = None,
+        page_limit: int = 100,
         feed_order: Literal["NEW", "TOP"] = "NEW",
         feed_type: Literal["SELF", "LOCAL", "NATIONWIDE"] = "LOCAL"
-    ) -> Generator[Yak, None, None]:
-        """Get posts from the feed"""
-        FEED_QUERY_GRAPHQL = """query Feed($feedType: FeedType, $feedOrder: FeedOrder, $pageLimit: Int, $cursor: String, $point: FixedPointScalar) {
-  feed(
-    feedType: $feedType
-    feedOrder: $feedOrder
-    first: $pageLimit
-    after: $cursor
-    point: $point
-  ) {
-    __typename
-    edges {
-      __typename
-      node {
-        __typename
-        id
-        userId
-        videoId
-        videoPlaybackDashUrl
-        videoPlaybackHlsUrl
-        videoDownloadMp4Url
-        videoThumbnailUrl
-        videoState
-        text
-        userEmoji
-        userColor
-        secondaryUserColor
-        distance
-        geohash
-        interestAreas
-        createdAt
-        commentCount
-        voteCount
-        isIncognito
-        isMine
-        isReported
-        myVote
-      }
-    }
-    pageInfo {
-      __typename
-      endCursor
-      hasNextPage
-    }
-  }
-}"""
+    ) -> dict[str, Any]:
+        """One page of the feed, undecoded: `{"edges": [{"node": ...}], "pageInfo": ...}`"""
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'Feed'),
             json={
                 "operationName": "Feed",
@@ -161,62 +175,47 @@ class YikYakClient:
                     "cursor": cursor_position,
                     "feedOrder": feed_order,
                     "feedType": feed_type,
-                    "pageLimit": min(num_posts, 100) if num_posts is not None else 100,
+                    "pageLimit": page_limit,
                     "point": self.location
                 }
             }
         )
         response.raise_for_status()
-        response_json = response.json()
-        
-        posts = [Yak.from_json(yak_edge["node"]) for yak_edge in response_json['data']['feed']['edges']]
-        if num_posts is not None: num_posts -= len(posts)
-        yield from posts
-        
-        page_info = response_json['data']['feed']['pageInfo']
-        cursor_position = page_info['endCursor']
-        has_next_page = page_info['hasNextPage']
-        
-        print(f"Cursor: {cursor_position}")
+        return response.json()['data']['feed']
+    
+    def posts(self, 
+        num_posts: Optional[int] = None,
+        cursor_position: Optional[str] = None,
+        feed_order: Literal["NEW", "TOP"] = "NEW",
+        feed_type: Literal["SELF", "LOCAL", "NATIONWIDE"] = "LOCAL",
+        lazy: bool = False,
+    ) -> Generator[Yak, None, None]:
+        """Get posts from the feed
         
+        With `lazy`, yields `LazyYak`s that only decode the fields that are read"""
+        decode = LazyYak if lazy else Yak.from_json
+        has_next_page = True
         while has_next_page and (num_posts is None or num_posts > 0):
-            response = requests.post(
-                'https://api.yikyak.com/graphql/',
-                headers=self.request_headers('query', 'Feed'),
-                json={
-                    "operationName": "Feed",
-                    "query": FEED_QUERY_GRAPHQL,
-                    "variables": {
-                        "cursor": cursor_position,
-                        "feedOrder": feed_order,
-                        "feedType": feed_type,
-                        "pageLimit": min(num_posts, 100) if num_posts is not None else 100,
-                        "point": self.location
-                    }
-                }
-            )
-            response.raise_for_status()
-            response_json = response.json()
+            feed = self.feed_page(cursor_position, min(num_posts, 100) if num_posts is not None else 100, feed_order, feed_type)
             
-            posts = [Yak.from_json(yak_edge["node"]) for yak_edge in response_json['data']['feed']['edges']]
+            posts = [decode(yak_edge["node"]) for yak_edge in feed['edges']]
             if num_posts is not None: num_posts -= len(posts)
             yield from posts
             
-            page_info = response_json['data']['feed']['pageInfo']
+            page_info = feed['pageInfo']
             cursor_position = page_info['endCursor']
             has_next_page = page_info['hasNextPage']
             
             print(f"Cursor: {cursor_position}")
     
-    def comments(self, 
-        yak_id: str, 
+    def comment_page(self,
+        yak_id: str,
         cursor_position: Optional[str] = None,
-        num_comments: Optional[int] = None,
-    ) -> Generator[Comment, None, None]:
-        COMMENT_QUERY_GRAPHQL = """query YakComments($id: ID!, $pageLimit: Int, $cursor: String) {\n  yak(id: $id) {\n   __typename\n   comments(first: $pageLimit, after: $cursor) {\n     __typename\n     edges {\n       __typename\n       node {\n         __typename\n         id\n         userId\n         text\n         createdAt\n         userEmoji\n         userColor\n         secondaryUserColor\n         isMine\n         isReported\n         voteCount\n         myVote\n       }\n      }\n      pageInfo {\n        __typename\n        endCursor\n        hasNextPage\n      }\n    }\n  }\n}"""
-        
+        page_limit: int = 100,
+    ) -> dict[str, Any]:
+        """One page of a yak's comments, undecoded: `{"edges": [{"node": ...}], "pageInfo": ...}`"""
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'Comments'),
             json={
                 "operationName": "YakComments",
@@ -224,7 +223,7 @@ class YikYakClient:
                 "variables": {
                     "cursor": cursor_position,
                     "id": yak_id,
-                    "pageLimit": min(num_comments, 100) if num_comments is not None else 100
+                    "pageLimit": page_limit
                 }
             }
         )
@@ -233,38 +232,26 @@ class YikYakClient:
         
         if response_json['data']['yak'] is None:
             print(yak_id, response_json)
-            raise ValueError(f"Yak with ID {yak_id} does not exist")
-        
-        comments = [Comment.from_json(comment_edge["node"]) for comment_edge in response_json['data']['yak']['comments']['edges']]
-        if num_comments is not None: num_comments -= len(comments)
-        yield from comments
-        
-        page_info = response_json['data']['yak']['comments']['pageInfo']
-        cursor_position = page_info['endCursor']
-        has_next_page = page_info['hasNextPage']
+            raise NotFoundError(f"Yak with ID {yak_id} does not exist")
         
+        return response_json['data']['yak']['comments']
+    
+    def comments(self, 
+        yak_id: str, 
+        cursor_position: Optional[str] = None,
+        num_comments: Optional[int] = None,
+        lazy: bool = False,
+    ) -> Generator[Comment, None, None]:
+        decode = LazyComment if lazy else Comment.from_json
+        has_next_page = True
         while has_next_page and (num_comments is None or num_comments > 0):
-            response = requests.post(
-                'https://api.yikyak.com/graphql/',
-                headers=self.request_headers('query', 'Comments'),
-                json={
-                    "operationName": "YakComments",
-                    "query": COMMENT_QUERY_GRAPHQL,
-                    "variables": {
-                        "cursor": cursor_position,
-                        "id": yak_id,
-                        "pageLimit": min(num_comments, 100) if num_comments is not None else 100
-                    }
-                }
-            )
-            response.raise_for_status()
-            response_json = response.json()
+            page = self.comment_page(yak_id, cursor_position, min(num_comments, 100) if num_comments is not None else 100)
             
-            comments = [Comment.from_json(comment_edge["node"]) for comment_edge in response_json['data']['yak']['comments']['edges']]
+            comments = [decode(comment_edge["node"]) for comment_edge in page['edges']]
             if num_comments is not None: num_comments -= len(comments)
             yield from comments
             
-            page_info = response_json['data']['yak']['comments']['pageInfo']
+            page_info = page['pageInfo']
             cursor_position = page_info['endCursor']
             has_next_page = page_info['hasNextPage']
     
@@ -327,7 +314,7 @@ class YikYakClient:
 }"""
         
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'Messages'),
             json={
                 "operationName": "Messages",
@@ -345,7 +332,7 @@ class YikYakClient:
         response_json = response.json()
         
         if response_json['data']['node'] is None:
-            raise ValueError(f"Thread with ID {thread_id} does not exist")
+            raise NotFoundError(f"Thread with ID {thread_id} does not exist")
         
         messages = [
             Message.from_json(message_edge["node"])
@@ -360,7 +347,7 @@ class YikYakClient:
         
         while has_next_page:
             response = requests.post(
-                'https://api.yikyak.com/graphql/',
+                self.api_url,
                 headers=self.request_headers('query', 'Messages'),
                 json={
                     "operationName": "Messages",
@@ -389,7 +376,7 @@ class YikYakClient:
     
     def yak(self, yak_id: str) -> Yak | None:
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'Yak'),
             json={
                 "operationName": "Yak",
@@ -435,7 +422,7 @@ class YikYakClient:
     
     def thread(self, thread_id: str, fetch_messages = True) -> Thread:
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'Thread'),
             json={
                 "operationName":"SingleThread",
@@ -479,7 +466,7 @@ class YikYakClient:
         response_json = response.json()
         
         if response_json['data']['thread'] is None:
-            raise ValueError(f"Thread with ID {thread_id} does not exist")
+            raise NotFoundError(f"Thread with ID {thread_id} does not exist")
         
         thread = Thread.from_json(response_json['data']['thread'])
         
@@ -499,7 +486,7 @@ class YikYakClient:
         
     ):
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'Post'),
             json={
                 "operationName": "CreateYak",
@@ -527,7 +514,7 @@ class YikYakClient:
         point: Optional[str] = None,
     ):
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'Comment'),
             json={
                 "operationName": "CreateComment",
@@ -547,7 +534,7 @@ class YikYakClient:
     
     def reset_conversation_icon(self) -> dict[str, str]:
         response = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'ResetConversationIcon'),
             json={
                 "operationName": "ResetConversationIcon",
@@ -566,7 +553,7 @@ class YikYakClient:
     
     def delete_yak(self, id: str):
         request = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'DeleteYak'),
             json={
                 "operationName":"RemoveYak",
@@ -584,7 +571,7 @@ class YikYakClient:
     
     def delete_comment(self, id: str):
         request = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'DeleteComment'),
             json={
                 "operationName":"RemoveComment",
@@ -605,7 +592,7 @@ class YikYakClient:
     def me(self):
         # {"operationName":"GetMe","query":"query GetMe {\n  me {\n    __typename\n    completedTutorial\n    emoji\n    color\n    secondaryColor\n    yakarmaScore\n  }\n}","variables":null}
         request = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('query', 'GetMe'),
             json={
                 "operationName":"GetMe",
@@ -640,7 +627,7 @@ class YikYakClient:
     
     def unblock(self):
         request = requests.post(
-            'https://api.yikyak.com/graphql/',
+            self.api_url,
             headers=self.request_headers('mutation', 'UnblockAll'),
             json= {
                 "operationName":"UnblockAll",
@@ -651,7 +638,7 @@ class YikYakClient:
         request.raise_for_status()
         response_json = request.json()
         print(response_json)
-            
+
 
 # TODO:
 # updateYak (UpdateYakInput!)
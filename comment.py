@@ -2,8 +2,10 @@ from dataclasses import dataclass
 import datetime
 from typing import Any, Literal, Optional
 
+from interning import get_field_state, intern_optional, set_field_state
 
-@dataclass
+
+@dataclass(slots=True)
 class Comment:
 	id: str
 	text: str
@@ -24,16 +26,28 @@ class Comment:
 			id=comment_json["id"],
 			text=comment_json["text"],
 			created_at=datetime.datetime.fromisoformat(comment_json["createdAt"]),
-			user_emoji=comment_json["userEmoji"] or "OP",
-			user_color=comment_json["userColor"] or None,
-			secondary_user_color=comment_json["secondaryUserColor"] or None,
+			user_emoji=intern_optional(comment_json["userEmoji"] or "OP"), # type: ignore
+			user_color=intern_optional(comment_json["userColor"] or None),
+			secondary_user_color=intern_optional(comment_json["secondaryUserColor"] or None),
 			is_mine=comment_json["isMine"],
 			is_reported=comment_json["isReported"],
 			vote_count=comment_json["voteCount"],
-			my_vote=comment_json["myVote"],
+			my_vote=intern_optional(comment_json["myVote"]), # type: ignore
 			user_id=comment_json.get("userId"),
 		)
 	
+	def __getstate__(self) -> dict[str, Any]:
+		return get_field_state(self)
+	
+	def __setstate__(self, state) -> None:
+		set_field_state(self, state)
+		
+		# archives pickled before Comment was slotted have uninterned strings
+		self.user_emoji = intern_optional(self.user_emoji) # type: ignore
+		self.user_color = intern_optional(self.user_color)
+		self.secondary_user_color = intern_optional(self.secondary_user_color)
+		self.my_vote = intern_optional(self.my_vote) # type: ignore
+	
 	def __hash__(self):
 		return hash(self.id)
 	
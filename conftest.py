@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from synthetic import SyntheticArchive
+from yak_archive import YakArchive
+
+
+@pytest.fixture
+def synthetic():
+	"""A small seeded archive, the same every time"""
+	return SyntheticArchive(300, seed=1)
+
+@pytest.fixture
+def archive(synthetic, tmp_path):
+	"""The synthetic archive as a YakArchive, stored under tmp_path"""
+	return YakArchive(str(tmp_path / "archive.yaks"), synthetic.archive())
@@ -0,0 +1,352 @@
+"""Crawls the feed and the comments on every new or changed yak into an
+archive, with fetching, decoding and archiving overlapped:
+	
+	fetch    one thread walking the feed, `fetchers` threads fetching comments
+	decode   `decoders` threads running Yak/Comment.from_json
+	archive  one thread adding to the YakArchive (which isn't thread safe)
+
+The stages are connected by bounded queues, so a slow stage holds back the
+ones before it instead of piling pages up in memory.
+	
+	python crawler.py <archive> --location LAT LON [--refresh-token TOKEN] [--fetchers 4] [--decoders 2]
+	                  [--num-posts N] [--feed-type LOCAL] [--feed-order NEW] [--stats-interval 10]
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import datetime
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Literal, Optional
+
+import requests
+
+from client import NotFoundError, YikYakClient
+from comment import Comment
+from vote_history import VoteHistory
+from yak import Yak
+from yak_archive import YakArchive
+
+QUEUE_SIZE = 64 # pages (up to 100 yaks or comments each) per queue
+RETRIES = 3
+
+# end of a queue's input
+_DONE = None
+
+class _Stopped(Exception):
+	"""A later stage failed, so this one is giving up"""
+
+
+class StageStats:
+	"""Counts for one stage, updated from any of its threads"""
+	
+	def __init__(self, name: str):
+		self.name = name
+		self.pages = 0
+		self.items = 0
+		self.errors = 0
+		# jobs given up on after an error that doesn't stop the crawl, and
+		# the last such error
+		self.skipped = 0
+		self.last_skipped = None # type: Optional[BaseException]
+		self.busy = 0.0 # seconds spent working, summed over threads
+		self._lock = threading.Lock()
+	
+	def record(self, items: int, seconds: float):
+		with self._lock:
+			self.pages += 1
+			self.items += items
+			self.busy += seconds
+	
+	def failed(self):
+		with self._lock:
+			self.errors += 1
+	
+	def skip(self, error: BaseException):
+		with self._lock:
+			self.skipped += 1
+			self.last_skipped = error
+
+
+class Crawler:
+	"""One crawl of the feed into `archive`.
+	
+	`make_client` is called once per fetch thread. Yaks whose comment count
+	hasn't changed since they were archived don't have their comments
+	fetched again (unless `refresh_comments`)."""
+	
+	def __init__(self,
+		archive: YakArchive,
+		make_client: Callable[[], YikYakClient],
+		fetchers: int = 4,
+		decoders: int = 2,
+		queue_size: int = QUEUE_SIZE,
+		num_posts: Optional[int] = None,
+		feed_order: Literal["NEW", "TOP"] = "NEW",
+		feed_type: Literal["SELF", "LOCAL", "NATIONWIDE"] = "LOCAL",
+		refresh_comments: bool = False,
+	):
+		self.archive = archive
+		self.make_client = make_client
+		self.fetchers = fetchers
+		self.decoders = decoders
+		self.num_posts = num_posts
+		self.feed_order = feed_order
+		self.feed_type = feed_type
+		self.refresh_comments = refresh_comments
+		
+		# yak ids whose comments need fetching
+		self.comment_jobs = queue.Queue(queue_size) # type: queue.Queue[Optional[str]]
+		# ("yak", nodes, fetched at) or (yak id, nodes, fetched at)
+		self.to_decode = queue.Queue(queue_size) # type: queue.Queue[Optional[tuple[str, list[dict[str, Any]], datetime.datetime]]]
+		# (None, yaks, fetched at) or (yak id, comments, fetched at)
+		self.to_archive = queue.Queue(queue_size) # type: queue.Queue[Optional[tuple[Optional[str], list[Any], datetime.datetime]]]
+		self.queues = {'comment_jobs': self.comment_jobs, 'to_decode': self.to_decode, 'to_archive': self.to_archive}
+		self.max_depth = dict.fromkeys(self.queues, 0)
+		
+		# yak id -> the comment count archived before this crawl (0 if none),
+		# for yaks whose comments are queued but not all fetched yet
+		self._unfetched = {} # type: dict[str, int]
+		self._unfetched_lock = threading.Lock()
+		
+		self.stats = {name: StageStats(name) for name in ('feed', 'comments', 'decode', 'archive')}
+		self.started = None # type: Optional[float]
+		self._stop = threading.Event()
+		self._error = None # type: Optional[BaseException]
+	
+	def _put(self, name: str, item: Any):
+		# blocks while the queue is full (the backpressure), but gives up if
+		# another stage has failed
+		target = self.queues[name]
+		while not self._stop.is_set():
+			try:
+				target.put(item, timeout=0.1)
+			except queue.Full:
+				continue
+			self.max_depth[name] = max(self.max_depth[name], target.qsize())
+			return
+		raise _Stopped()
+	
+	def _get(self, name: str) -> Any:
+		source = self.queues[name]
+		while not self._stop.is_set():
+			try:
+				return source.get(timeout=0.1)
+			except queue.Empty:
+				continue
+		raise _Stopped()
+	
+	def _run_stage(self, work: Callable[[], None], stop_on_error: bool = True):
+		try:
+			work()
+		except _Stopped:
+			pass
+		except BaseException as error:
+			if self._error is None:
+				self._error = error
+			# a failed fetch still lets everything already fetched through,
+			# but nothing upstream of a failed stage could ever finish
+			if stop_on_error:
+				self._stop.set()
+	
+	def _fetch(self, stats: StageStats, client: YikYakClient, fetch: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+		attempt, refresh_token = 0, False
+		while True:
+			start = time.perf_counter()
+			try:
+				if refresh_token:
+					client.refresh_access_token()
+					refresh_token = False
+				page = fetch()
+			except Exception as error:
+				stats.failed()
+				attempt += 1
+				# only network errors (requests' are OSErrors) are worth retrying
+				if not isinstance(error, OSError) or attempt == RETRIES:
+					raise
+				if isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 401:
+					# the access token expired, and retrying with it won't help
+					refresh_token = True
+				else:
+					time.sleep(2 ** attempt)
+				continue
+			stats.record(len(page['edges']), time.perf_counter() - start)
+			return page
+	
+	def _walk_feed(self):
+		client = self.make_client()
+		stats = self.stats['feed']
+		cursor, num_posts, has_next_page = None, self.num_posts, True
+		while has_next_page and (num_posts is None or num_posts > 0):
+			page_limit = min(num_posts, 100) if num_posts is not None else 100
+			page = self._fetch(stats, client, lambda: client.feed_page(cursor, page_limit, self.feed_order, self.feed_type))
+			fetched_at = datetime.datetime.now(datetime.timezone.utc)
+			nodes = [edge['node'] for edge in page['edges']]
+			
+			# NOTE: has to be checked before the page is passed on (or the new
+			#       yaks could already be archived). read while the archive
+			#       thread is writing, which is fine for single dict lookups
+			with_new_comments = []
+			for node in nodes:
+				archived = self.archive.yak_hash.get(node['id'])
+				if node['commentCount'] and (self.refresh_comments or archived is None or archived.comment_count != node['commentCount']):
+					with_new_comments.append(node['id'])
+					with self._unfetched_lock:
+						self._unfetched.setdefault(node['id'], archived.comment_count if archived is not None else 0)
+			
+			self._put('to_decode', ("yak", nodes, fetched_at))
+			for yak_id in with_new_comments:
+				self._put('comment_jobs', yak_id)
+			
+			if num_posts is not None: num_posts -= len(nodes)
+			cursor, has_next_page = page['pageInfo']['endCursor'], page['pageInfo']['hasNextPage']
+	
+	def _fetch_comments(self):
+		client = self.make_client()
+		stats = self.stats['comments']
+		while (yak_id := self._get('comment_jobs')) is not _DONE:
+			cursor, has_next_page = None, True
+			while has_next_page:
+				try:
+					page = self._fetch(stats, client, lambda: client.comment_page(yak_id, cursor))
+				except (NotFoundError, OSError) as error:
+					# deleted since it was in the feed, or still failing after
+					# retries; the rest of the crawl carries on without it
+					stats.skip(error)
+					break
+				fetched_at = datetime.datetime.now(datetime.timezone.utc)
+				self._put('to_decode', (yak_id, [edge['node'] for edge in page['edges']], fetched_at))
+				cursor, has_next_page = page['pageInfo']['endCursor'], page['pageInfo']['hasNextPage']
+			else:
+				with self._unfetched_lock:
+					self._unfetched.pop(yak_id, None)
+	
+	def _decode(self):
+		stats = self.stats['decode']
+		while (job := self._get('to_decode')) is not _DONE:
+			kind, nodes, fetched_at = job
+			start = time.perf_counter()
+			if kind == "yak":
+				decoded = (None, [Yak.from_json(node) for node in nodes], fetched_at)
+			else:
+				decoded = (kind, [Comment.from_json(node) for node in nodes], fetched_at)
+			stats.record(len(nodes), time.perf_counter() - start)
+			self._put('to_archive', decoded)
+	
+	def _archive(self):
+		stats = self.stats['archive']
+		while (job := self._get('to_archive')) is not _DONE:
+			yak_id, items, fetched_at = job
+			start = time.perf_counter()
+			if yak_id is None:
+				for yak in items:
+					self.archive.add_yak(yak, fetched_at)
+			else:
+				self.archive.add_comments(yak_id, items, fetched_at)
+			stats.record(len(items), time.perf_counter() - start)
+	
+	def run(self, report: Optional[Callable[[Crawler], None]] = None, report_interval: float = 10.0):
+		"""Crawl until the feed runs out (or `num_posts` have been seen),
+		calling `report` every `report_interval` seconds"""
+		self.started = time.perf_counter()
+		
+		def start(work: Callable[[], None], count: int = 1, stop_on_error: bool = True) -> list[threading.Thread]:
+			threads = [threading.Thread(target=self._run_stage, args=(work, stop_on_error), daemon=True) for _ in range(count)]
+			for thread in threads:
+				thread.start()
+			return threads
+		
+		def finish(threads: list[threading.Thread], name: Optional[str] = None):
+			# wait for a stage, then tell the next one that's all there is
+			for thread in threads:
+				while thread.is_alive():
+					thread.join(report_interval)
+					if report is not None and thread.is_alive():
+						report(self)
+			if name is not None:
+				consumers = {'comment_jobs': self.fetchers, 'to_decode': self.decoders, 'to_archive': 1}[name]
+				for _ in range(consumers):
+					self._run_stage(lambda: self._put(name, _DONE))
+		
+		archiver = start(self._archive)
+		decoders = start(self._decode, self.decoders)
+		comment_fetchers = start(self._fetch_comments, self.fetchers)
+		feed = start(self._walk_feed, stop_on_error=False)
+		
+		finish(feed, 'comment_jobs')
+		finish(comment_fetchers, 'to_decode')
+		finish(decoders, 'to_archive')
+		finish(archiver)
+		self._keep_unfetched()
+		
+		if self._error is not None:
+			raise self._error
+	
+	def _keep_unfetched(self):
+		# yaks whose comments weren't all fetched (skipped, or the crawl
+		# stopped) go back to the comment count they were archived with, so
+		# the next crawl sees a changed count and fetches them again
+		# NOTE: passing an empty history keeps this out of the vote history,
+		#       which still has the count the feed showed
+		for yak_id, comment_count in self._unfetched.items():
+			yak = self.archive.yak_hash.get(yak_id)
+			if yak is not None and yak.comment_count != comment_count:
+				self.archive.add_yak(dataclasses.replace(yak, comment_count=comment_count), history=VoteHistory())
+		self._unfetched.clear()
+	
+	def summary(self) -> str:
+		elapsed = time.perf_counter() - (self.started or time.perf_counter())
+		lines = [f"{elapsed:.1f}s elapsed"]
+		for stats in self.stats.values():
+			lines.append(
+				f"  {stats.name:<9} {stats.pages:7} pages {stats.items:9} items {stats.items / max(elapsed, 1e-9):9.1f} items/s"
+				f"  {stats.busy:8.1f}s busy  {stats.errors} errors  {stats.skipped} skipped"
+			)
+			if stats.last_skipped is not None:
+				lines.append(f"            last skipped: {stats.last_skipped!r}")
+		depths = ", ".join(f"{name} {target.qsize()} (max {self.max_depth[name]})" for name, target in self.queues.items())
+		lines.append(f"  queues    {depths}")
+		return "\n".join(lines)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("archive")
+	parser.add_argument("--location", type=float, nargs=2, metavar=("LAT", "LON"), required=True)
+	parser.add_argument("--refresh-token", default=os.environ.get("YIKYAK_REFRESH_TOKEN"), help="defaults to $YIKYAK_REFRESH_TOKEN")
+	parser.add_argument("--fetchers", type=int, default=4, help="threads fetching comments")
+	parser.add_argument("--decoders", type=int, default=2)
+	parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+	parser.add_argument("--num-posts", type=int)
+	parser.add_argument("--feed-type", choices=["SELF", "LOCAL", "NATIONWIDE"], default="LOCAL")
+	parser.add_argument("--feed-order", choices=["NEW", "TOP"], default="NEW")
+	parser.add_argument("--refresh-comments", action="store_true", help="refetch comments on yaks whose comment count hasn't changed")
+	parser.add_argument("--stats-interval", type=float, default=10.0)
+	parser.add_argument("--api-url")
+	parser.add_argument("--token-url")
+	args = parser.parse_args()
+	if not args.refresh_token:
+		parser.error("a refresh token is needed (--refresh-token or $YIKYAK_REFRESH_TOKEN)")
+	
+	urls = {name: url for name, url in (('api_url', args.api_url), ('token_url', args.token_url)) if url}
+	with YakArchive(args.archive) as archive:
+		crawler = Crawler(
+			archive,
+			lambda: YikYakClient(args.refresh_token, tuple(args.location), **urls),
+			fetchers=args.fetchers,
+			decoders=args.decoders,
+			queue_size=args.queue_size,
+			num_posts=args.num_posts,
+			feed_order=args.feed_order,
+			feed_type=args.feed_type,
+			refresh_comments=args.refresh_comments,
+		)
+		try:
+			crawler.run(lambda crawler: print(crawler.summary()), args.stats_interval)
+		finally:
+			print(crawler.summary())
+
+if __name__ == '__main__': main()
@@ -3,7 +3,7 @@ import datetime
 from typing import Any, Literal, Optional, Self
 
 
-@dataclass
+@dataclass(slots=True)
 class Participant:
 	id: str
 	emoji: str
@@ -27,7 +27,7 @@ class Participant:
 			has_unread_messages=json['hasUnreadMessages'],
 		)
 
-@dataclass
+@dataclass(slots=True)
 class Message:
 	id: str
 	text: str
@@ -38,7 +38,14 @@ class Message:
 	
 	@classmethod
 	def from_json(cls, json: dict[str, Any]) -> Self:
-		raise NotImplementedError(json)
+		return cls(
+			id=json['id'],
+			text=json['text'],
+			is_mine=json['isMine'],
+			is_op=json['isOp'],
+			participant_id=json['participantId'],
+			created_at=datetime.datetime.fromisoformat(json['createdAt']),
+		)
 
 @dataclass
 class Thread:
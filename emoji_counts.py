@@ -0,0 +1,57 @@
+"""How often each user shows up as each color + emoji, kept up to date as
+comments are added (the data behind `yak_data.get_emojis`).
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from comment import Comment
+from yak import Yak
+
+# (user color, secondary user color, emoji)
+Look = tuple[Optional[str], Optional[str], str]
+
+
+class EmojiCounts:
+	"""Per-user counts of every look (colors + emoji) commented under.
+	
+	Like iterating the archive, comments only count once their yak is in
+	the archive, and OP replies (which don't get a look) and comments
+	without a user id never do. Re-adding a comment replaces its old look."""
+	
+	def __init__(self):
+		# user id -> look -> number of comments, in the order looks were first seen
+		self.counts = {} # type: dict[str, dict[Look, int]]
+		# yak id -> comment id -> (user id, look) for every countable comment
+		self._threads = {} # type: dict[str, dict[str, tuple[str, Look]]]
+		self._yak_ids = set() # type: set[str]
+	
+	def _count(self, user_id: str, look: Look, delta: int):
+		counts = self.counts.setdefault(user_id, {})
+		counts[look] = counts.get(look, 0) + delta
+		if not counts[look]:
+			del counts[look]
+			if not counts:
+				del self.counts[user_id]
+	
+	def add_yak(self, yak: Yak):
+		if yak.id in self._yak_ids:
+			return
+		self._yak_ids.add(yak.id)
+		for user_id, look in self._threads.get(yak.id, {}).values():
+			self._count(user_id, look, 1)
+	
+	def add_comment(self, yak_id: str, comment: Comment):
+		thread = self._threads.setdefault(yak_id, {})
+		counted = yak_id in self._yak_ids
+		
+		old = thread.pop(comment.id, None)
+		if old is not None and counted:
+			self._count(*old, -1)
+		
+		if comment.user_id is None or comment.user_emoji in (None, 'OP'):
+			return
+		look = (comment.user_color, comment.secondary_user_color, comment.user_emoji) # type: Look
+		thread[comment.id] = (comment.user_id, look)
+		if counted:
+			self._count(comment.user_id, look, 1)
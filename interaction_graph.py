@@ -0,0 +1,257 @@
+"""Who comments on whose yaks, as a sparse (CSR) matrix over integer user
+codes, for graph analyses that would otherwise rebuild a graph from
+`yak_data.common_coupled_users` in python.
+
+Edges point from a poster to a commenter and are weighted by the number of
+comments, with the same filters as `common_coupled_users`. Building a
+`UserGraph` needs numpy.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING, Literal, Optional
+
+from comment import Comment
+from yak import Yak
+from yak_columns import ColumnTable, StringPool, epoch_microseconds
+
+if TYPE_CHECKING:
+	import numpy
+
+
+class UserGraph:
+	"""One snapshot of the interaction graph.
+	
+	Row `u` of the CSR matrix (`indptr[u]:indptr[u+1]` of `commenters` and
+	`weights`) holds everyone who commented on user code `u`'s yaks; the
+	transpose (who a user commented on) is built the first time it's needed."""
+	
+	def __init__(self, users: StringPool, indptr: numpy.ndarray, commenters: numpy.ndarray, weights: numpy.ndarray):
+		self.users = users
+		self.indptr = indptr
+		self.commenters = commenters
+		self.weights = weights
+		self._transpose = None # type: Optional[tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]
+	
+	@property
+	def num_users(self) -> int:
+		return len(self.indptr) - 1
+	
+	@property
+	def num_edges(self) -> int:
+		return len(self.commenters)
+	
+	def transpose(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+		"""(indptr, posters, weights) with one row per commenter"""
+		if self._transpose is None:
+			import numpy as np
+			posters = np.repeat(np.arange(self.num_users), np.diff(self.indptr))
+			order = np.argsort(self.commenters, kind='stable')
+			indptr = np.zeros(self.num_users + 1, dtype=np.int64)
+			np.cumsum(np.bincount(self.commenters, minlength=self.num_users), out=indptr[1:])
+			self._transpose = indptr, posters[order], self.weights[order]
+		return self._transpose
+	
+	def _matrix(self, direction: Literal["out", "in"]) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+		return (self.indptr, self.commenters, self.weights) if direction == "out" else self.transpose()
+	
+	def _row(self, user_id: str, direction: Literal["out", "in"]) -> tuple[numpy.ndarray, numpy.ndarray]:
+		code = self.users.get_code(user_id)
+		if code is None or code < 0 or code >= self.num_users:
+			return self.commenters[:0], self.weights[:0]
+		indptr, neighbors, weights = self._matrix(direction)
+		return neighbors[indptr[code]:indptr[code + 1]], weights[indptr[code]:indptr[code + 1]]
+	
+	def neighbors(self, user_id: str, direction: Literal["out", "in"] = "out") -> dict[str, int]:
+		"""Comment counts between `user_id` and everyone they're connected to:
+		commenters on their yaks ("out") or posters they commented on ("in")"""
+		neighbors, weights = self._row(user_id, direction)
+		return {self.users.values[neighbor]: int(weight) for neighbor, weight in zip(neighbors.tolist(), weights.tolist())}
+	
+	def degree(self, user_id: str, direction: Literal["out", "in"] = "out", weighted: bool = False) -> int:
+		neighbors, weights = self._row(user_id, direction)
+		return int(weights.sum()) if weighted else len(neighbors)
+	
+	def degrees(self, direction: Literal["out", "in"] = "out", weighted: bool = False) -> numpy.ndarray:
+		"""Degree of every user code at once"""
+		import numpy as np
+		indptr, _, weights = self._matrix(direction)
+		if not weighted:
+			return np.diff(indptr)
+		rows = np.repeat(np.arange(self.num_users), np.diff(indptr))
+		return np.bincount(rows, weights=weights, minlength=self.num_users).astype(np.int64)
+	
+	def weight(self, poster: str, commenter: str) -> int:
+		return self.neighbors(poster).get(commenter, 0)
+	
+	def pairs(self) -> dict[tuple[str, str], int]:
+		"""Every edge as `common_coupled_users` would return it (same counts;
+		ties are ordered by user code rather than by when they were first seen)"""
+		import numpy as np
+		posters = np.repeat(np.arange(self.num_users), np.diff(self.indptr))
+		order = np.argsort(-self.weights, kind='stable')
+		values = self.users.values
+		return {
+			(values[poster], values[commenter]): weight
+			for poster, commenter, weight in zip(posters[order].tolist(), self.commenters[order].tolist(), self.weights[order].tolist())
+		}
+
+
+class InteractionGraph:
+	"""Who commented on whose yaks, kept up to date as yaks and comments are
+	added, with `UserGraph` snapshots built from it when asked for.
+	
+	Every (yak, commenter) pair is a row of numpy-readable columns with the
+	yak's poster, time and incognito flag and the number of comments, so a
+	graph is a few vectorized passes over those rows. For a time window,
+	the rows are kept sorted by their yak's `created_at` and the window is
+	found by binary search, so only the rows in it are looked at."""
+	
+	MAX_CACHED = 8
+	
+	THREAD_COLUMNS = {
+		'created_at': 'q', # the yak's, in microseconds
+		'poster': 'i', # -1 if the yak has no user id, or isn't archived yet
+		'commenter': 'i',
+		'is_incognito': 'b',
+		'comments': 'q', # 0 once every comment has moved elsewhere
+	}
+	
+	def __init__(self):
+		self.users = StringPool()
+		# yak id -> (poster code, is incognito, created_at in microseconds)
+		self._yaks = {} # type: dict[str, tuple[int, bool, int]]
+		# yak id -> comment id -> commenter code, for comments with a user id
+		self._comments = {} # type: dict[str, dict[str, int]]
+		# yak id -> commenter code -> number of comments
+		self._threads = {} # type: dict[str, dict[int, int]]
+		# one row per (yak id, commenter code) ever seen
+		self._rows = ColumnTable(self.THREAD_COLUMNS)
+		# (number of rows, row order, sorted created_at) of _rows, which rows
+		# added since are merged into
+		self._sorted = None # type: Optional[tuple[int, numpy.ndarray, numpy.ndarray]]
+		
+		self._version = 0
+		self._cache = {} # type: dict[tuple, tuple[int, UserGraph]]
+	
+	def _update_row(self, yak_id: str, commenter: int):
+		poster, is_incognito, created_at = self._yaks.get(yak_id, (-1, False, 0))
+		row = self._rows.rows.get((yak_id, commenter))
+		if row is not None and self._rows.columns['created_at'][row] != created_at:
+			# moved, so the sorted order has to be rebuilt
+			self._sorted = None
+		self._rows.upsert((yak_id, commenter), {
+			'created_at': created_at,
+			'poster': poster,
+			'commenter': commenter,
+			'is_incognito': is_incognito,
+			'comments': self._threads[yak_id].get(commenter, 0),
+		})
+	
+	def add_yak(self, yak: Yak):
+		old = self._yaks.get(yak.id)
+		new = self._yaks[yak.id] = (self.users.code(yak.user_id), bool(yak.is_incognito), epoch_microseconds(yak.created_at))
+		if new == old:
+			return
+		for commenter in self._threads.get(yak.id, {}):
+			self._update_row(yak.id, commenter)
+		self._version += 1
+	
+	def _count_comment(self, yak_id: str, commenter: int, sign: int):
+		thread = self._threads.setdefault(yak_id, {})
+		thread[commenter] = thread.get(commenter, 0) + sign
+		self._update_row(yak_id, commenter)
+		if not thread[commenter]:
+			del thread[commenter]
+	
+	def add_comment(self, yak_id: str, comment: Comment):
+		comments = self._comments.setdefault(yak_id, {})
+		commenter = self.users.code(comment.user_id)
+		old_commenter = comments.get(comment.id, -1)
+		if commenter == old_commenter:
+			return # a new vote count doesn't change the graph
+		
+		if old_commenter >= 0:
+			del comments[comment.id]
+			self._count_comment(yak_id, old_commenter, -1)
+		if commenter >= 0:
+			comments[comment.id] = commenter
+			self._count_comment(yak_id, commenter, 1)
+		self._version += 1
+	
+	def graph(self,
+		include_self: bool = False,
+		repeat_comments_per_thread: bool = True,
+		only_anonymous: bool = True,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+	) -> UserGraph:
+		"""The graph of comments on yaks posted in [start_time, end_time]
+		(every yak by default)"""
+		key = (include_self, repeat_comments_per_thread, only_anonymous, start_time, end_time)
+		cached = self._cache.get(key)
+		if cached is not None and cached[0] == self._version:
+			return cached[1]
+		
+		graph = self._build(*key)
+		self._cache.pop(key, None)
+		self._cache[key] = (self._version, graph)
+		while len(self._cache) > self.MAX_CACHED:
+			del self._cache[next(iter(self._cache))]
+		return graph
+	
+	def _window(self, start_time: Optional[datetime.datetime], end_time: Optional[datetime.datetime]) -> numpy.ndarray:
+		"""The rows of yaks posted in [start_time, end_time]"""
+		import numpy as np
+		
+		created_at = self._rows.to_numpy()['created_at']
+		if self._sorted is None:
+			order = np.argsort(created_at, kind='stable')
+			self._sorted = (len(created_at), order, created_at[order])
+		elif self._sorted[0] < len(created_at):
+			num_sorted, order, times = self._sorted
+			new = num_sorted + np.argsort(created_at[num_sorted:], kind='stable')
+			positions = np.searchsorted(times, created_at[new], side='right')
+			self._sorted = (len(created_at), np.insert(order, positions, new), np.insert(times, positions, created_at[new]))
+		_, order, times = self._sorted
+		first = np.searchsorted(times, epoch_microseconds(start_time)) if start_time is not None else 0
+		last = np.searchsorted(times, epoch_microseconds(end_time), side='right') if end_time is not None else len(times)
+		return order[first:last]
+	
+	def _build(self,
+		include_self: bool,
+		repeat_comments_per_thread: bool,
+		only_anonymous: bool,
+		start_time: Optional[datetime.datetime],
+		end_time: Optional[datetime.datetime],
+	) -> UserGraph:
+		import numpy as np
+		
+		columns = self._rows.to_numpy()
+		if start_time is None and end_time is None:
+			rows = slice(None)
+		else:
+			rows = self._window(start_time, end_time)
+		posters, commenters, comments = columns['poster'][rows], columns['commenter'][rows], columns['comments'][rows]
+		
+		mask = (posters >= 0) & (comments > 0)
+		if only_anonymous:
+			mask &= columns['is_incognito'][rows] != 0
+		if not include_self:
+			mask &= posters != commenters
+		# each commenter counts once per thread without repeats
+		weights = comments[mask] if repeat_comments_per_thread else np.ones(int(mask.sum()), dtype=np.int64)
+		return self._to_csr(posters[mask], commenters[mask], weights)
+	
+	def _to_csr(self, posters: numpy.ndarray, commenters: numpy.ndarray, weights: numpy.ndarray) -> UserGraph:
+		import numpy as np
+		
+		# sum the weights of each (poster, commenter) pair, sorted by poster
+		# and then commenter
+		num_users = len(self.users)
+		pairs, pair_of_row = np.unique(posters.astype(np.int64) * num_users + commenters, return_inverse=True)
+		weights = np.bincount(pair_of_row, weights=weights, minlength=len(pairs)).astype(np.int64)
+		
+		indptr = np.zeros(num_users + 1, dtype=np.int64)
+		np.cumsum(np.bincount(pairs // num_users, minlength=num_users), out=indptr[1:])
+		return UserGraph(self.users, indptr, pairs % num_users, weights)
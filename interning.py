@@ -0,0 +1,30 @@
+import sys
+from dataclasses import fields
+from typing import Any, Iterable, Optional
+
+
+# every distinct interest_areas tuple we've seen, so identical lists across
+# yaks share one object (there are only a handful of distinct values)
+_shared_tuples = {} # type: dict[tuple[str, ...], tuple[str, ...]]
+
+
+def intern_optional(value: Optional[str]) -> Optional[str]:
+	if value is None:
+		return None
+	return sys.intern(value)
+
+def shared_tuple(values: Iterable[str]) -> tuple[str, ...]:
+	key = tuple(sys.intern(value) for value in values)
+	return _shared_tuples.setdefault(key, key)
+
+def get_field_state(obj: Any) -> dict[str, Any]:
+	# same shape as the __dict__ a plain dataclass pickles, so archives written
+	# by slotted classes can still be read by older code (and vice versa)
+	return {field.name: getattr(obj, field.name) for field in fields(obj)}
+
+def set_field_state(obj: Any, state: dict[str, Any] | tuple[Any, dict[str, Any]]) -> None:
+	if isinstance(state, tuple):
+		# (dict_state, slot_state) from the default object.__getstate__
+		state = {**(state[0] or {}), **state[1]}
+	for name, value in state.items():
+		object.__setattr__(obj, name, value)
@@ -0,0 +1,129 @@
+"""Yaks and comments that keep the raw api node and only decode a field the
+first time it's read, for sweeps that look at `id` (say, to check
+`YakArchive.yak_hash`) and throw most of what they fetch away.
+
+`LazyYak` and `LazyComment` are subclasses of `Yak` and `Comment`, so
+they compare, hash and format the same way. A decoded field is stored in
+the dataclass's own slot, so reading it again costs nothing extra. They
+refuse to be pickled: call `materialize()` to get a plain `Yak`/`Comment`
+(`YakArchive.add_yak` and `add_comments` do this themselves).
+"""
+from __future__ import annotations
+
+import dataclasses
+import datetime
+from typing import Any, Callable
+
+from comment import Comment
+from interning import intern_optional, shared_tuple
+from yak import Yak
+
+_Node = dict[str, Any]
+
+# the same conversions as Yak.from_json and Comment.from_json, one field at a time
+_YAK_DECODERS = {
+	'id': lambda node: node["id"],
+	'video_id': lambda node: node["videoId"] or None,
+	'video_playback_dash_url': lambda node: node["videoPlaybackDashUrl"] or None,
+	'video_playback_hls_url': lambda node: node["videoPlaybackHlsUrl"] or None,
+	'video_download_mp4_url': lambda node: node["videoDownloadMp4Url"] or None,
+	'video_thumbnail_url': lambda node: node["videoThumbnailUrl"] or None,
+	'video_state': lambda node: intern_optional(node["videoState"]),
+	'text': lambda node: node["text"],
+	'user_emoji': lambda node: intern_optional(node["userEmoji"] or None),
+	'user_color': lambda node: intern_optional(node["userColor"] or None),
+	'secondary_user_color': lambda node: intern_optional(node["secondaryUserColor"] or None),
+	'distance': lambda node: node["distance"],
+	'geohash': lambda node: node["geohash"] or None,
+	'interest_areas': lambda node: shared_tuple(node["interestAreas"] or ()),
+	'created_at': lambda node: datetime.datetime.fromisoformat(node["createdAt"]),
+	'comment_count': lambda node: node["commentCount"],
+	'vote_count': lambda node: node["voteCount"],
+	'is_incognito': lambda node: node["isIncognito"],
+	'is_mine': lambda node: node["isMine"],
+	'is_reported': lambda node: node["isReported"],
+	'my_vote': lambda node: intern_optional(node["myVote"]),
+	'user_id': lambda node: node.get("userId"),
+} # type: dict[str, Callable[[_Node], Any]]
+
+_COMMENT_DECODERS = {
+	'id': lambda node: node["id"],
+	'text': lambda node: node["text"],
+	'created_at': lambda node: datetime.datetime.fromisoformat(node["createdAt"]),
+	'user_emoji': lambda node: intern_optional(node["userEmoji"] or "OP"),
+	'user_color': lambda node: intern_optional(node["userColor"] or None),
+	'secondary_user_color': lambda node: intern_optional(node["secondaryUserColor"] or None),
+	'is_mine': lambda node: node["isMine"],
+	'is_reported': lambda node: node["isReported"],
+	'vote_count': lambda node: node["voteCount"],
+	'my_vote': lambda node: intern_optional(node["myVote"]),
+	'user_id': lambda node: node.get("userId"),
+} # type: dict[str, Callable[[_Node], Any]]
+
+assert set(_YAK_DECODERS) == {field.name for field in dataclasses.fields(Yak)}
+assert set(_COMMENT_DECODERS) == {field.name for field in dataclasses.fields(Comment)}
+
+
+def _decode_field(record: LazyYak | LazyComment, name: str, decoders: dict[str, Callable[[_Node], Any]]) -> Any:
+	# only called for slots that haven't been set yet
+	decode = decoders.get(name)
+	if decode is None:
+		raise AttributeError(f"{type(record).__name__!r} object has no attribute {name!r}")
+	value = decode(record._node)
+	object.__setattr__(record, name, value)
+	return value
+
+def _set_field(record: LazyYak | LazyComment, name: str, value: Any):
+	# fields set by hand (rather than decoded) have to survive materialize()
+	if record._changed is None:
+		object.__setattr__(record, '_changed', set())
+	record._changed.add(name)
+	object.__setattr__(record, name, value)
+
+def _materialize(record: LazyYak | LazyComment, from_json: Callable[[_Node], Any]) -> Any:
+	# decoding everything at once is much faster than field by field, and
+	# gives the same values as any fields that were already decoded
+	materialized = from_json(record._node)
+	for name in record._changed or ():
+		setattr(materialized, name, getattr(record, name))
+	return materialized
+
+
+class LazyYak(Yak):
+	__slots__ = ('_node', '_changed')
+	
+	def __init__(self, node: _Node):
+		object.__setattr__(self, '_node', node)
+		object.__setattr__(self, '_changed', None)
+	
+	def __getattr__(self, name: str) -> Any:
+		return _decode_field(self, name, _YAK_DECODERS)
+	
+	def __setattr__(self, name: str, value: Any):
+		_set_field(self, name, value)
+	
+	def materialize(self) -> Yak:
+		return _materialize(self, Yak.from_json)
+	
+	def __reduce_ex__(self, protocol):
+		raise TypeError("LazyYak can't be pickled, materialize() it first")
+
+
+class LazyComment(Comment):
+	__slots__ = ('_node', '_changed')
+	
+	def __init__(self, node: _Node):
+		object.__setattr__(self, '_node', node)
+		object.__setattr__(self, '_changed', None)
+	
+	def __getattr__(self, name: str) -> Any:
+		return _decode_field(self, name, _COMMENT_DECODERS)
+	
+	def __setattr__(self, name: str, value: Any):
+		_set_field(self, name, value)
+	
+	def materialize(self) -> Comment:
+		return _materialize(self, Comment.from_json)
+	
+	def __reduce_ex__(self, protocol):
+		raise TypeError("LazyComment can't be pickled, materialize() it first")
@@ -0,0 +1,197 @@
+"""Rolling versions of `yak_data`'s hour, word and user analyses, kept over
+the last hour (or any window) of a live feed.
+
+Feed it yaks and comments as `YikYakClient.posts()` / `comments()` yield
+them; time is bucketed into a ring buffer, and whole buckets fall out of
+the window as newer items arrive, so each update only costs as much as
+what was added or evicted.
+"""
+from __future__ import annotations
+
+from collections import Counter
+import datetime
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+
+from comment import Comment
+from yak import Yak
+from yak_columns import epoch_microseconds
+
+if TYPE_CHECKING:
+	from yak_data import SupportsRichComparison, TotalYakData, UserActivity
+
+_MICROSECONDS = datetime.timedelta(microseconds=1)
+_HOUR = datetime.timedelta(hours=1)
+
+
+# what a yak or comment contributes: (is comment, user id, votes, words)
+_Item = tuple[bool, Optional[str], int, tuple[str, ...]]
+
+
+class LiveStats:
+	"""Posts, comments, words and per-user activity over a sliding window.
+	
+	The window ends at the newest `created_at` seen (or whatever `advance`
+	was last given) and is split into buckets of `resolution`, so items
+	leave the window up to one bucket late. An item seen again (say with
+	a new vote count) replaces its old self; items already older than the
+	window are ignored."""
+	
+	def __init__(self,
+		window: datetime.timedelta = _HOUR,
+		resolution: datetime.timedelta = datetime.timedelta(minutes=1),
+		track_words: bool = True,
+	):
+		self.window = window
+		self.resolution = resolution
+		self.track_words = track_words
+		
+		self._bucket_size = resolution // _MICROSECONDS
+		# ring buffer of yak/comment id -> _Item, one dict per bucket
+		self._buckets = [None] * -(-window // resolution) # type: list[Optional[dict[str, _Item]]]
+		self._newest = None # type: Optional[int]
+		# the oldest bucket seen, for how much of the window has been covered
+		self._first = None # type: Optional[int]
+		# which bucket each item in the window is in
+		self._where = {} # type: dict[str, int]
+		
+		# running totals over every bucket in the window
+		self.posts = 0
+		self.comments = 0
+		self.words = Counter() # type: Counter[str]
+		# user id -> [posts, comments, post upvotes, comment upvotes]
+		self.users = {} # type: dict[str, list[int]]
+	
+	def _apply(self, item: _Item, sign: int):
+		is_comment, user_id, votes, words = item
+		if is_comment:
+			self.comments += sign
+		else:
+			self.posts += sign
+		
+		for word in words:
+			self.words[word] += sign
+			if not self.words[word]:
+				del self.words[word]
+		
+		if user_id is not None:
+			counts = self.users.setdefault(user_id, [0, 0, 0, 0])
+			counts[is_comment] += sign
+			counts[2 + is_comment] += sign * votes
+			if not counts[0] and not counts[1]:
+				del self.users[user_id]
+	
+	def _evict(self, bucket: dict[str, _Item]):
+		for item_id, item in bucket.items():
+			self._apply(item, -1)
+			del self._where[item_id]
+	
+	def _advance_to(self, key: int):
+		# evicts every bucket that the window has moved past (at most all of
+		# them, however far time jumps)
+		num_buckets = len(self._buckets)
+		if self._newest is not None:
+			for old_key in range(max(self._newest + 1, key - num_buckets + 1), key + 1):
+				bucket = self._buckets[old_key % num_buckets]
+				if bucket is not None:
+					self._evict(bucket)
+					self._buckets[old_key % num_buckets] = None
+		else:
+			self._first = key
+		self._newest = key
+	
+	def advance(self, now: datetime.datetime):
+		"""Move the end of the window forward without adding anything (e.g.
+		to wall clock time when the feed is quiet)"""
+		key = epoch_microseconds(now) // self._bucket_size
+		if self._newest is None or key > self._newest:
+			self._advance_to(key)
+	
+	def _add(self, item_id: str, created_at: datetime.datetime, item: _Item):
+		key = epoch_microseconds(created_at) // self._bucket_size
+		if self._newest is None or key > self._newest:
+			self._advance_to(key)
+		elif key <= self._newest - len(self._buckets):
+			return # already outside the window
+		assert self._first is not None
+		self._first = min(self._first, key)
+		
+		old_key = self._where.pop(item_id, None)
+		if old_key is not None:
+			old_bucket = self._buckets[old_key % len(self._buckets)]
+			assert old_bucket is not None
+			self._apply(old_bucket.pop(item_id), -1)
+		
+		bucket = self._buckets[key % len(self._buckets)]
+		if bucket is None:
+			bucket = self._buckets[key % len(self._buckets)] = {}
+		bucket[item_id] = item
+		self._where[item_id] = key
+		self._apply(item, 1)
+	
+	def _words(self, text: str) -> tuple[str, ...]:
+		if not self.track_words:
+			return ()
+		# same tokens as yak_data.most_common_words
+		from yak_data import tokenize
+		return tokenize([text])[0]
+	
+	def add_yak(self, yak: Yak):
+		self._add(yak.id, yak.created_at, (False, yak.user_id, yak.vote_count, self._words(yak.text)))
+	
+	def add_comment(self, comment: Comment):
+		self._add(comment.id, comment.created_at, (True, comment.user_id, comment.vote_count, self._words(comment.text)))
+	
+	def update(self, items: Iterable[Yak | Comment]):
+		"""Add everything a feed or comment generator yields"""
+		for item in items:
+			if isinstance(item, Yak):
+				self.add_yak(item)
+			elif isinstance(item, Comment):
+				self.add_comment(item)
+			else:
+				raise TypeError(f"Expected a Yak or Comment, got {type(item).__name__}")
+	
+	def yaks_per_hour(self) -> TotalYakData:
+		"""Posts, comments and both per hour over the window (or as much of
+		it as has been seen so far, until the window fills up)"""
+		if self._newest is None:
+			return {'posts': 0.0, 'comments': 0.0, 'total': 0.0}
+		assert self._first is not None
+		covered = min(self.window, (self._newest - self._first + 1) * self.resolution)
+		hours = covered / _HOUR
+		return {
+			'posts': self.posts / hours,
+			'comments': self.comments / hours,
+			'total': (self.posts + self.comments) / hours,
+		}
+	
+	def most_common_words(self, limit: Optional[int] = None) -> dict[str, int]:
+		"""Trending words, most common first, without stopwords"""
+		from yak_data import stopwords
+		excluded = stopwords()
+		
+		words = ((word, count) for word, count in self.words.most_common() if word and word not in excluded)
+		return dict(islice(words, limit))
+	
+	def most_active_users(self,
+		limit: Optional[int] = None,
+		sort_by: Optional[Callable[[UserActivity], SupportsRichComparison]] = None,
+	) -> dict[str, UserActivity]:
+		"""Like `yak_data.most_active_users` over the window"""
+		from yak_data import ranked
+		
+		user_activity = {
+			user_id: {
+				'posts': posts,
+				'comments': comments,
+				'total': posts + comments,
+				'post_upvotes': post_upvotes,
+				'comment_upvotes': comment_upvotes,
+				'total_upvotes': post_upvotes + comment_upvotes,
+			}
+			for user_id, (posts, comments, post_upvotes, comment_upvotes) in self.users.items()
+		} # type: dict[str, UserActivity]
+		
+		sort_by = sort_by or (lambda activity: activity['total']) # sort by total yaks by default
+		return ranked(user_activity, sort_by, limit)
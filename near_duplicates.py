@@ -0,0 +1,247 @@
+"""Near-duplicate (repost / copypasta) detection for yak and comment text
+with MinHash signatures and locality sensitive hashing.
+
+Each text becomes a set of character shingles, summarized by NUM_HASHES
+minhashes; texts whose signatures agree on every row of at least one band
+land in the same bucket, so finding candidates never means scanning the
+archive. Two texts with Jaccard similarity `s` share a bucket with
+probability 1 - (1 - s**ROWS)**BANDS: about 0.34 at s = 0.4, 0.64 at
+s = 0.5 and 0.9998 at s = 0.8. Needs numpy to compute signatures.
+"""
+from __future__ import annotations
+
+from array import array
+import datetime
+import random
+import re
+from typing import TYPE_CHECKING, Iterable, Optional
+import zlib
+
+from comment import Comment
+from text_index import normalize_text
+from yak import Yak
+from yak_columns import epoch_microseconds
+
+if TYPE_CHECKING:
+	import numpy
+
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+
+_PRIME = (1 << 31) - 1
+# fixed so signatures mean the same thing in every process (and after
+# the index is pickled)
+_rng = random.Random(0x5eed)
+_A = [_rng.randrange(1, _PRIME) for _ in range(NUM_HASHES)]
+_B = [_rng.randrange(0, _PRIME) for _ in range(NUM_HASHES)]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def shingles(text: str) -> set[int]:
+	"""crc32s of the overlapping SHINGLE_SIZE character pieces of `text`,
+	ignoring case, quote style and spacing"""
+	text = _WHITESPACE.sub(' ', normalize_text(text)).strip()
+	if len(text) <= SHINGLE_SIZE:
+		return {zlib.crc32(text.encode())} if text else set()
+	return {zlib.crc32(text[i:i+SHINGLE_SIZE].encode()) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def signature(text: str) -> Optional[array]:
+	"""NUM_HASHES minhashes of the text's shingles (None for empty text)"""
+	import numpy as np
+	
+	hashes = shingles(text)
+	if not hashes:
+		return None
+	values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+	# (a * x + b) mod p for every hash function at once; a, x < 2**32 so
+	# nothing overflows 64 bits
+	minhashes = ((np.array(_A, dtype=np.uint64)[:, None] * values + np.array(_B, dtype=np.uint64)[:, None]) % _PRIME).min(axis=1)
+	return array('I', minhashes.astype(np.uint32).tobytes())
+
+def similarity(first: array, second: array) -> float:
+	"""Estimated Jaccard similarity of the texts behind two signatures"""
+	return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+class NearDuplicateIndex:
+	"""MinHash/LSH index over every yak and comment in an archive, kept up
+	to date as they're added (an edited text is re-indexed)."""
+	
+	def __init__(self):
+		# one row per indexed yak/comment
+		self.ids = [] # type: list[str]
+		self.created_at = array('q') # epoch microseconds
+		self.signatures = array('I') # NUM_HASHES per row
+		self.rows = {} # type: dict[str, int]
+		# id -> crc32 of the text that was indexed
+		self._texts = {} # type: dict[str, int]
+		# band number + that band's minhashes -> rows (a dict as an ordered
+		# set, so rows can be taken out again in O(1))
+		self.buckets = {} # type: dict[bytes, dict[int, None]]
+		# (number of rows, row order, sorted created_at), which rows added
+		# since are merged into
+		self._sorted = None # type: Optional[tuple[int, numpy.ndarray, numpy.ndarray]]
+	
+	def __getstate__(self):
+		return {**self.__dict__, '_sorted': None}
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._sorted = None
+		# indexes saved when buckets were lists
+		self.buckets = {key: dict.fromkeys(rows) if isinstance(rows, list) else rows for key, rows in self.buckets.items()}
+	
+	def _signature(self, row: int) -> array:
+		return self.signatures[row * NUM_HASHES:(row + 1) * NUM_HASHES]
+	
+	@staticmethod
+	def _band_keys(sig: array) -> list[bytes]:
+		return [bytes([band]) + sig[band * ROWS:(band + 1) * ROWS].tobytes() for band in range(BANDS)]
+	
+	def add_document(self, doc_id: str, text: str, created_at: datetime.datetime):
+		text_hash = zlib.crc32(text.encode())
+		if self._texts.get(doc_id) == text_hash:
+			return # unchanged (only votes etc. changed)
+		
+		row = self.rows.get(doc_id)
+		# empty texts keep an all-zero signature and were never bucketed
+		if row is not None and any(self._signature(row)):
+			for key in self._band_keys(self._signature(row)):
+				del self.buckets[key][row]
+				if not self.buckets[key]:
+					del self.buckets[key]
+		
+		sig = signature(text)
+		bucketed = sig is not None
+		if sig is None:
+			sig = array('I', [0] * NUM_HASHES)
+		if row is None:
+			row = self.rows[doc_id] = len(self.ids)
+			self.ids.append(doc_id)
+			self.created_at.append(epoch_microseconds(created_at))
+			self.signatures.extend(sig)
+		else:
+			self.signatures[row * NUM_HASHES:(row + 1) * NUM_HASHES] = sig
+		self._texts[doc_id] = text_hash
+		
+		if bucketed:
+			for key in self._band_keys(sig):
+				self.buckets.setdefault(key, {})[row] = None
+	
+	def add_yak(self, yak: Yak):
+		self.add_document(yak.id, yak.text, yak.created_at)
+	
+	def add_comment(self, yak_id: str, comment: Comment):
+		self.add_document(comment.id, comment.text, comment.created_at)
+	
+	def _candidates(self, sig: array) -> set[int]:
+		candidates = set()
+		for key in self._band_keys(sig):
+			candidates.update(self.buckets.get(key, ()))
+		return candidates
+	
+	def _similar(self, sig: array, threshold: float, exclude: Optional[int] = None) -> list[tuple[str, float]]:
+		results = []
+		for row in self._candidates(sig):
+			if row == exclude: continue
+			score = similarity(sig, self._signature(row))
+			if score >= threshold:
+				results.append((self.ids[row], score))
+		results.sort(key=lambda x:x[1], reverse=True)
+		return results
+	
+	def near_duplicates(self, doc_id: str, threshold: float = 0.5) -> list[tuple[str, float]]:
+		"""Ids of the yaks/comments whose text is estimated to be at least
+		`threshold` similar to `doc_id`'s, most similar first"""
+		row = self.rows.get(doc_id)
+		if row is None:
+			raise KeyError(f"{doc_id} is not in the index")
+		return self._similar(self._signature(row), threshold, exclude=row)
+	
+	def similar_to(self, text: str, threshold: float = 0.5) -> list[tuple[str, float]]:
+		"""Like `near_duplicates`, for text that isn't in the archive"""
+		sig = signature(text)
+		if sig is None:
+			return []
+		return self._similar(sig, threshold)
+	
+	def _rows_between(self, start: Optional[int], end: Optional[int]) -> list[int]:
+		"""Rows created in [start, end] (epoch microseconds), by binary search"""
+		import numpy as np
+		
+		created_at = np.frombuffer(self.created_at, dtype=np.int64)
+		if self._sorted is None:
+			order = np.argsort(created_at, kind='stable')
+			self._sorted = (len(created_at), order, created_at[order])
+		elif self._sorted[0] < len(created_at):
+			# a row's created_at never changes, so only new rows need placing
+			num_sorted, order, times = self._sorted
+			new = num_sorted + np.argsort(created_at[num_sorted:], kind='stable')
+			positions = np.searchsorted(times, created_at[new], side='right')
+			self._sorted = (len(created_at), np.insert(order, positions, new), np.insert(times, positions, created_at[new]))
+		_, order, times = self._sorted
+		first = np.searchsorted(times, start) if start is not None else 0
+		last = np.searchsorted(times, end, side='right') if end is not None else len(times)
+		return order[first:last].tolist()
+	
+	def clusters(self,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+		threshold: float = 0.5,
+		min_size: int = 2,
+	) -> list[list[str]]:
+		"""Groups of near-duplicate texts posted in [start_time, end_time],
+		biggest first (each group oldest first). Only the buckets of texts in
+		the window are looked at."""
+		start = epoch_microseconds(start_time) if start_time is not None else None
+		end = epoch_microseconds(end_time) if end_time is not None else None
+		created_at = self.created_at
+		
+		if start is None and end is None:
+			buckets = self.buckets.values() # type: Iterable[dict[int, None]]
+		else:
+			keys = {} # type: dict[bytes, None]
+			for row in self._rows_between(start, end):
+				if any(self._signature(row)):
+					keys.update(dict.fromkeys(self._band_keys(self._signature(row))))
+			buckets = (self.buckets[key] for key in keys)
+		
+		def in_window(row: int) -> bool:
+			return (start is None or created_at[row] >= start) and (end is None or created_at[row] <= end)
+		
+		# union-find over rows, joining each bucket member to the first
+		# earlier member it's really similar to (not every pair in the bucket)
+		parent = {} # type: dict[int, int]
+		
+		def find(row: int) -> int:
+			while parent[row] != row:
+				parent[row] = parent[parent[row]]
+				row = parent[row]
+			return row
+		
+		for rows in buckets:
+			if len(rows) < 2: continue
+			members = [row for row in rows if in_window(row)]
+			for row in members:
+				parent.setdefault(row, row)
+			for i, row in enumerate(members[1:], 1):
+				sig = self._signature(row)
+				for other in members[:i]:
+					if find(other) == find(row): break
+					if similarity(sig, self._signature(other)) >= threshold:
+						parent[find(row)] = find(other)
+						break
+		
+		groups = {} # type: dict[int, list[int]]
+		for row in parent:
+			groups.setdefault(find(row), []).append(row)
+		
+		clusters = [
+			[self.ids[row] for row in sorted(rows, key=lambda row: created_at[row])]
+			for rows in groups.values() if len(rows) >= min_size
+		]
+		clusters.sort(key=len, reverse=True)
+		return clusters
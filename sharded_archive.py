@@ -0,0 +1,313 @@
+"""A yak archive split into one file per month (or week) of `created_at`.
+
+Each shard is an ordinary `YakArchive` file, so only the shards that overlap
+a query window ever get opened. Shards don't overlap in time, which means
+iterating them newest-first (or oldest-first) in key order already gives a
+global time order.
+
+Several processes (say, two crawlers) can write to the same directory at
+once. Saving a shard takes a lock on it, and if another process saved the
+shard since it was loaded, the changes made here are replayed on top of
+what's on disk instead of overwriting it. The index and manifest are
+merged with the copies on disk under a lock of their own.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import pickle
+from typing import Generator, Iterable, Literal, Optional
+
+from comment import Comment
+from vote_history import VoteHistory
+from yak import Yak
+from yak_archive import ARCHIVE_START, TIMEZONE, Archive, YakArchive
+
+SHARD_SUFFIX = ".yakarchive"
+
+try:
+	import fcntl
+except ImportError:
+	# windows
+	fcntl = None
+	import msvcrt
+
+
+@contextmanager
+def _file_lock(path: str):
+	"""Hold an exclusive lock on `path` (created if needed), blocking until
+	any other process holding it lets go"""
+	with open(path, 'a+b') as file_handle:
+		if fcntl is not None:
+			fcntl.flock(file_handle, fcntl.LOCK_EX)
+		else:
+			file_handle.seek(0)
+			msvcrt.locking(file_handle.fileno(), msvcrt.LK_LOCK, 1)
+		try:
+			yield
+		finally:
+			if fcntl is not None:
+				fcntl.flock(file_handle, fcntl.LOCK_UN)
+			else:
+				file_handle.seek(0)
+				msvcrt.locking(file_handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _file_signature(path: str) -> Optional[tuple[int, int, int]]:
+	# shards are always replaced (never written in place), which changes the inode
+	try:
+		stat = os.stat(path)
+	except FileNotFoundError:
+		return None
+	return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ShardedYakArchive:
+	def __init__(self, directory: str, period: Literal["month", "week"] = "month"):
+		self.directory = directory
+		os.makedirs(self.directory, exist_ok=True)
+		
+		manifest_path = os.path.join(self.directory, "manifest.json")
+		if os.path.exists(manifest_path):
+			with open(manifest_path) as file_handle:
+				manifest = json.load(file_handle)
+			self.period = manifest['period'] # type: Literal["month", "week"]
+			self.frozen = set(manifest['frozen']) # type: set[str]
+			self.orphans = manifest.get('orphans', {}) # type: dict[str, str]
+		else:
+			self.period = period
+			self.frozen = set()
+			# yak id -> shard key for comments added before their yak, which
+			# are kept in the shard of their earliest comment until it shows up
+			self.orphans = {}
+		
+		# yak id -> shard key, so comments and lookups go straight to the
+		# right shard without opening the others
+		index_path = os.path.join(self.directory, "index.pkl")
+		if os.path.exists(index_path):
+			with open(index_path, 'rb') as file_handle:
+				self.index = pickle.load(file_handle) # type: dict[str, str]
+		else:
+			self.index = {}
+		
+		self.shards = {} # type: dict[str, YakArchive]
+		# what's been added to each shard since it was last saved, as
+		# (None, yak, observed at, history) or (yak id, comments, observed
+		# at, history), with the arguments add_yak/add_comments were given
+		self._changes = {} # type: dict[str, list[tuple[Optional[str], Yak | list[Comment], datetime.datetime, Optional[VoteHistory]]]]
+		# each loaded shard's file as it was when loaded or last saved
+		self._signatures = {} # type: dict[str, Optional[tuple[int, int, int]]]
+	
+	def shard_key(self, created_at: datetime.datetime) -> str:
+		return f"{self.shard_start(created_at):%Y-%m-%d}"
+	
+	def shard_start(self, created_at: datetime.datetime) -> datetime.datetime:
+		created_at = created_at.astimezone(TIMEZONE)
+		if self.period == "month":
+			return datetime.datetime(created_at.year, created_at.month, 1, tzinfo=TIMEZONE)
+		weeks = (created_at - ARCHIVE_START) // datetime.timedelta(weeks=1)
+		return ARCHIVE_START + datetime.timedelta(weeks=weeks)
+	
+	def shard_range(self, key: str) -> tuple[datetime.datetime, datetime.datetime]:
+		start = datetime.datetime.strptime(key, "%Y-%m-%d").replace(tzinfo=TIMEZONE)
+		if self.period == "month":
+			end = datetime.datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=TIMEZONE)
+		else:
+			end = start + datetime.timedelta(weeks=1)
+		return start, end
+	
+	def shard_path(self, key: str) -> str:
+		return os.path.join(self.directory, key + SHARD_SUFFIX)
+	
+	def shard_keys(self,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+	) -> list[str]:
+		"""Keys of every shard overlapping [start_time, end_time], oldest first"""
+		keys = {name[:-len(SHARD_SUFFIX)] for name in os.listdir(self.directory) if name.endswith(SHARD_SUFFIX)}
+		keys.update(self.shards)
+		
+		result = []
+		for key in sorted(keys):
+			shard_start, shard_end = self.shard_range(key)
+			if start_time is not None and shard_end <= start_time: continue
+			if end_time is not None and shard_start > end_time: continue
+			result.append(key)
+		return result
+	
+	def shard(self, key: str) -> YakArchive:
+		if key not in self.shards:
+			path = self.shard_path(key)
+			# NOTE: the signature is taken before loading, so a save that
+			#       lands in between only costs an unneeded replay later
+			self._signatures[key] = _file_signature(path)
+			self.shards[key] = YakArchive(path)
+		return self.shards[key]
+	
+	def open_shards(self, keys: Iterable[str]) -> list[YakArchive]:
+		# NOTE: loading shards in worker processes was tried, but pickling
+		#       each loaded archive back to this process made it about 3x
+		#       slower than loading them here one at a time
+		return [self.shard(key) for key in keys]
+	
+	def _save_shard(self, key: str):
+		path = self.shard_path(key)
+		with _file_lock(path + ".lock"):
+			shard = self.shards[key]
+			if _file_signature(path) != self._signatures[key]:
+				# another process has saved this shard since it was loaded
+				shard = self.shards[key] = YakArchive(path)
+				for yak_id, records, observed_at, history in self._changes[key]:
+					if yak_id is None:
+						shard.add_yak(records, observed_at, history) # type: ignore
+					else:
+						shard.add_comments(yak_id, records, observed_at, history) # type: ignore
+			shard.save()
+			self._signatures[key] = _file_signature(path)
+		del self._changes[key]
+	
+	def save(self):
+		for key in sorted(self._changes):
+			self._save_shard(key)
+		
+		# another crawler may have added yaks to other shards since we loaded
+		# the index, so merge with whatever is on disk before replacing it
+		with _file_lock(os.path.join(self.directory, "index.lock")):
+			index_path = os.path.join(self.directory, "index.pkl")
+			if os.path.exists(index_path):
+				with open(index_path, 'rb') as file_handle:
+					self.index = {**pickle.load(file_handle), **self.index}
+			with open(index_path + ".tmp", 'wb') as file_handle:
+				pickle.dump(self.index, file_handle, pickle.HIGHEST_PROTOCOL)
+			os.replace(index_path + ".tmp", index_path)
+			
+			self._write_manifest()
+	
+	def _write_manifest(self):
+		# only called holding the index lock
+		manifest_path = os.path.join(self.directory, "manifest.json")
+		if os.path.exists(manifest_path):
+			with open(manifest_path) as file_handle:
+				manifest = json.load(file_handle)
+			self.frozen.update(manifest['frozen'])
+			self.orphans = {**manifest.get('orphans', {}), **self.orphans}
+		self.orphans = {yak_id: key for yak_id, key in self.orphans.items() if yak_id not in self.index}
+		
+		with open(manifest_path + ".tmp", 'w') as file_handle:
+			json.dump({'period': self.period, 'frozen': sorted(self.frozen), 'orphans': self.orphans}, file_handle)
+		os.replace(manifest_path + ".tmp", manifest_path)
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.save()
+		return False
+	
+	def _writable_shard(self, key: str) -> YakArchive:
+		if key in self.frozen:
+			raise ValueError(f"Shard {key} has been compacted and is read-only")
+		shard = self.shard(key)
+		self._changes.setdefault(key, [])
+		return shard
+	
+	def add_yak(self, yak: Yak, observed_at: Optional[datetime.datetime] = None, history: Optional[VoteHistory] = None):
+		"""See `YakArchive.add_yak`"""
+		# the time is pinned now, in case the yak has to be added again by a
+		# replay in save()
+		observed_at = observed_at or datetime.datetime.now(datetime.timezone.utc)
+		key = self.shard_key(yak.created_at)
+		self._writable_shard(key).add_yak(yak, observed_at, history)
+		self._changes[key].append((None, yak, observed_at, history))
+		self.index[yak.id] = key
+		
+		orphan_key = self.orphans.pop(yak.id, None)
+		if orphan_key is not None and orphan_key != key:
+			# its comments came first and went to another shard, so they
+			# (and their history) follow it here (compact() drops the old copies)
+			orphan_shard = self.shard(orphan_key)
+			self.add_comments(yak.id, orphan_shard.archive.comments.get(yak.id, []), history=orphan_shard.history)
+	
+	def add_comments(self, yak_id: str, comments: Iterable[Comment], observed_at: Optional[datetime.datetime] = None, history: Optional[VoteHistory] = None):
+		"""See `YakArchive.add_comments`"""
+		observed_at = observed_at or datetime.datetime.now(datetime.timezone.utc)
+		comments = list(comments)
+		# comments always live in the same shard as their yak
+		key = self.index.get(yak_id) or self.orphans.get(yak_id)
+		if key is None:
+			# like YakArchive, comments can be added before their yak
+			if not comments:
+				return
+			key = self.orphans[yak_id] = self.shard_key(min(comment.created_at for comment in comments))
+		self._writable_shard(key).add_comments(yak_id, comments, observed_at, history)
+		self._changes[key].append((yak_id, comments, observed_at, history))
+	
+	def compact(self, key: str):
+		"""Dedupe and sort a finished shard and mark it read-only"""
+		if key == self.shard_key(datetime.datetime.now(TIMEZONE)):
+			raise ValueError(f"Shard {key} is still being written to")
+		
+		if key in self._changes:
+			self._save_shard(key)
+		path = self.shard_path(key)
+		with _file_lock(path + ".lock"):
+			shard = YakArchive(path)
+			yaks = {yak.id: yak for yak in shard.archive.yaks}
+			comments = {
+				yak_id: list({comment.id: comment for comment in thread}.values())
+				for yak_id, thread in shard.archive.comments.items()
+				# orphans whose yak (and so the comments) has since gone to another shard
+				if self.index.get(yak_id, key) == key
+			}
+			self.shards[key] = YakArchive(path, Archive(list(yaks.values()), comments))
+			self.shards[key].save()
+			self._signatures[key] = _file_signature(path)
+		
+		self.frozen.add(key)
+		with _file_lock(os.path.join(self.directory, "index.lock")):
+			self._write_manifest()
+	
+	@staticmethod
+	def _sorted_yaks(shard: YakArchive, reverse: bool) -> Generator[tuple[Yak, list[Comment]], None, None]:
+		# shards are sorted when they're saved, so this is linear unless
+		# yaks were added since
+		for yak in sorted(shard.archive.yaks, key=lambda yak: yak.created_at, reverse=reverse):
+			yield yak, shard.archive.comments.get(yak.id, [])
+	
+	def get_yaks(self,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+	) -> Generator[tuple[Yak, list[Comment]], None, None]:
+		"""Yaks newest first, from only the shards overlapping the window.
+		
+		NOTE: this prunes whole shards, so yaks just outside the window can
+		      still be yielded; callers filter on created_at as usual."""
+		for shard in reversed(self.open_shards(self.shard_keys(start_time, end_time))):
+			yield from self._sorted_yaks(shard, reverse=True)
+	
+	def __iter__(self):
+		return self.get_yaks()
+	
+	def __reversed__(self):
+		for shard in self.open_shards(self.shard_keys()):
+			yield from self._sorted_yaks(shard, reverse=False)
+	
+	def __len__(self):
+		return len(self.index)
+	
+	def get_yak(self, yak_id: str) -> Optional[tuple[Yak, list[Comment]]]:
+		key = self.index.get(yak_id)
+		if key is None:
+			return None
+		return self.shard(key).get_yak(yak_id)
+	
+	@classmethod
+	def from_archive(cls, archive: YakArchive, directory: str, period: Literal["month", "week"] = "month") -> ShardedYakArchive:
+		"""Split a monolithic archive (and its vote history) into shards"""
+		sharded = cls(directory, period)
+		for yak, comments in archive:
+			sharded.add_yak(yak, history=archive.history)
+			sharded.add_comments(yak.id, comments, history=archive.history)
+		sharded.save()
+		return sharded
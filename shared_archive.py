@@ -0,0 +1,496 @@
+"""A read-only snapshot of an archive that any number of processes can
+share, instead of each one loading its own copy.
+
+One process `publish`es a `YakArchive` to a single file (on /dev/shm by
+default, which on linux is shared memory), and others open it with
+`SharedArchive`, which memory maps it. Attaching only reads a small header,
+and every process reads the same pages. Threads are pickled one by one and
+decoded as they're read, so a process only holds what it's looking at.
+They're kept in the archive's iteration order, so anything that iterates
+a snapshot sees exactly what it would iterating the archive. The column
+view (`to_columns`) and yak ids are stored too, as typed arrays that are
+read in place rather than rebuilt by every process.
+
+Layout (all integers little endian):
+	
+	magic          8 bytes, b"YAKSHARE"
+	version        u16
+	header offset  u64
+	header length  u32
+	threads        each one a pickled (Yak, list[Comment]), in iteration order
+	sections       8 byte aligned typed arrays (see _SECTION_TYPES), indexing
+	               the threads by id hash, created_at and user id hash, and
+	               holding the column view
+	header         utf-8 json: {"num_yaks": ..., "sections": {name: [offset, length]}, ...}
+
+A new snapshot is written next to the old one and renamed over it, so an
+attached process keeps a consistent view until it calls `refresh()`.
+Comments whose yak isn't in the archive are left out, as they are when
+iterating a `YakArchive`.
+	
+	python shared_archive.py <archive> [snapshot path] [--watch SECONDS]
+"""
+from __future__ import annotations
+
+from array import array
+import argparse
+import bisect
+import collections.abc
+import datetime
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+from typing import TYPE_CHECKING, Callable, Generator, Hashable, Iterable, Iterator, Optional, Sequence
+
+from comment import Comment
+from emoji_counts import EmojiCounts
+from sketches import hash64
+from yak import Yak
+from yak_archive import YakArchive
+from yak_columns import ArchiveColumns, ColumnTable, StringPool, epoch_microseconds
+
+if TYPE_CHECKING:
+	import numpy
+
+MAGIC = b"YAKSHARE"
+FORMAT_VERSION = 3
+
+_PREAMBLE = struct.Struct("<8sHQI")
+
+_SECTION_TYPES = {
+	'offsets': 'q', # where each thread starts (plus the end of the last one)
+	# epoch microseconds of every thread's yak, newest first, and the thread
+	# each one belongs to (version 1 snapshots stored the threads newest
+	# first, so they have no time_rows)
+	'created_at': 'q',
+	'time_rows': 'q',
+	# yak id hashes (sorted) and the thread each one belongs to
+	'id_hashes': 'Q',
+	'id_rows': 'q',
+	# user id hashes (sorted), and where in the time order every thread
+	# each one posted or commented in is: user_times[user_indptr[i]:user_indptr[i+1]]
+	'user_hashes': 'Q',
+	'user_indptr': 'q',
+	'user_times': 'q',
+	# since version 3, the column view: every column of its yak and comment
+	# tables, and its string pools (utf-8 text, and where each string starts
+	# plus the end of the last one)
+	**{f'yaks.{name}': typecode for name, typecode in ArchiveColumns.YAK_COLUMNS.items()},
+	**{f'comments.{name}': typecode for name, typecode in ArchiveColumns.COMMENT_COLUMNS.items()},
+	**{f'{pool}{part}': typecode for pool in ('yak_ids', 'users', 'colors', 'comment_ids') for part, typecode in (('', 'B'), ('.offsets', 'q'))},
+	# the yak row of each thread, and the comment rows of each yak row
+	# (comments['...'][comment_indptr[i]:comment_indptr[i+1]])
+	'thread_yaks': 'q',
+	'comment_indptr': 'q',
+}
+
+DEFAULT_PATH = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "yakarchive.snapshot")
+
+
+def publish(archive: YakArchive, path: str = DEFAULT_PATH):
+	"""Write a snapshot of `archive` and swap it into place at `path`"""
+	# a temp file of our own, so publishers racing to the same path (say
+	# two --watch processes) can't write into each other's
+	file_descriptor, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+	try:
+		with os.fdopen(file_descriptor, 'wb') as file_handle:
+			_write_snapshot(archive, file_handle)
+		# mkstemp only lets the owner read it
+		os.chmod(temp_path, 0o644)
+		os.replace(temp_path, path)
+	except BaseException:
+		os.remove(temp_path)
+		raise
+
+def _strings(values: Sequence[str]) -> tuple[array, array]:
+	text = array('B')
+	offsets = array('q', [0])
+	for value in values:
+		text.frombytes(value.encode())
+		offsets.append(len(text))
+	return text, offsets
+
+def _write_snapshot(archive: YakArchive, file_handle):
+	yaks = [] # type: list[Yak]
+	offsets = array('q', [0])
+	user_threads = {} # type: dict[int, list[int]]
+	# built in iteration order, like YakArchive builds its own
+	columns = ArchiveColumns()
+	thread_yaks = array('q')
+	comment_indptr = array('q', [0])
+	
+	file_handle.write(bytes(_PREAMBLE.size))
+	for row, (yak, comments) in enumerate(archive):
+		yaks.append(yak)
+		yak_row = columns.add_yak(yak)
+		thread_yaks.append(yak_row)
+		if yak_row == len(comment_indptr) - 1:
+			# a repeated yak's thread is the same comments again, so a yak's
+			# comment rows are the ones added the first time it's seen
+			columns.add_comments(yak.id, comments)
+			comment_indptr.append(len(columns.comments))
+		data = pickle.dumps((yak, comments), pickle.HIGHEST_PROTOCOL)
+		file_handle.write(data)
+		offsets.append(offsets[-1] + len(data))
+		
+		users = {comment.user_id for comment in comments}
+		users.add(yak.user_id)
+		users.discard(None)
+		for user_id in users:
+			user_threads.setdefault(hash64(user_id), []).append(row)
+	
+	# sorted() is stable, so yaks posted at the same time stay in iteration order
+	time_rows = sorted(range(len(yaks)), key=lambda row: yaks[row].created_at, reverse=True)
+	time_of_row = array('q', bytes(8 * len(yaks)))
+	for time, row in enumerate(time_rows):
+		time_of_row[row] = time
+	
+	id_order = sorted(range(len(yaks)), key=lambda row: hash64(yaks[row].id))
+	user_hashes = sorted(user_threads)
+	user_indptr = array('q', [0])
+	user_times = array('q')
+	for user_hash in user_hashes:
+		user_times.extend(sorted(time_of_row[row] for row in user_threads[user_hash]))
+		user_indptr.append(len(user_times))
+	
+	sections = {
+		'offsets': offsets,
+		'created_at': array('q', (epoch_microseconds(yaks[row].created_at) for row in time_rows)),
+		'time_rows': array('q', time_rows),
+		'id_hashes': array('Q', (hash64(yaks[row].id) for row in id_order)),
+		'id_rows': array('q', id_order),
+		'user_hashes': array('Q', user_hashes),
+		'user_indptr': user_indptr,
+		'user_times': user_times,
+		**{f'yaks.{name}': column[:len(columns.yaks)] for name, column in columns.yaks.columns.items()},
+		**{f'comments.{name}': column[:len(columns.comments)] for name, column in columns.comments.columns.items()},
+		'thread_yaks': thread_yaks,
+		'comment_indptr': comment_indptr,
+	}
+	for pool, values in (('yak_ids', columns.yak_ids.values), ('users', columns.users.values), ('colors', columns.colors.values), ('comment_ids', [comment_id for _, comment_id in columns.comments.keys])):
+		sections[pool], sections[f'{pool}.offsets'] = _strings(values)
+	section_positions = {} # type: dict[str, list[int]]
+	for name, values in sections.items():
+		file_handle.write(bytes(-file_handle.tell() % 8))
+		section_positions[name] = [file_handle.tell(), len(values) * values.itemsize]
+		file_handle.write(values.tobytes())
+	
+	header = json.dumps({
+		'num_yaks': len(yaks),
+		'threads': [_PREAMBLE.size, offsets[-1]],
+		'sections': section_positions,
+		'published_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+	}).encode()
+	header_offset = file_handle.tell()
+	file_handle.write(header)
+	file_handle.seek(0)
+	file_handle.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_offset, len(header)))
+
+
+class _Strings(collections.abc.Sequence):
+	"""A string section, decoded one string at a time"""
+	
+	def __init__(self, sections: dict[str, memoryview], name: str):
+		self.text = sections[name]
+		self.offsets = sections[f'{name}.offsets']
+	
+	def __len__(self):
+		return len(self.offsets) - 1
+	
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in range(*i.indices(len(self)))]
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError(i)
+		return str(self.text[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+class _SnapshotStrings(StringPool):
+	"""A read-only `StringPool` over a string section"""
+	
+	def __init__(self, values: _Strings):
+		self.values = values # type: ignore
+		self._codes = None # type: Optional[dict[str, int]]
+	
+	@property
+	def codes(self) -> dict[str, int]: # type: ignore
+		# only decoded if something looks a string up
+		if self._codes is None:
+			self._codes = {value: code for code, value in enumerate(self.values)}
+		return self._codes
+	
+	def code(self, value: Optional[str]) -> int:
+		code = self.get_code(value)
+		if code is None:
+			raise KeyError(f"{value!r} isn't in the snapshot")
+		return code
+
+
+class _Keys(collections.abc.Sequence):
+	"""The record id of every row of a snapshot's table, made when asked for"""
+	
+	def __init__(self, key: Callable[[int], Hashable], length: int):
+		self.key = key
+		self.length = length
+	
+	def __len__(self):
+		return self.length
+	
+	def __getitem__(self, row):
+		if isinstance(row, slice):
+			return [self[i] for i in range(*row.indices(self.length))]
+		if not 0 <= row < self.length:
+			raise IndexError(row)
+		return self.key(row)
+
+
+class _Rows(collections.abc.Mapping):
+	"""Record id -> row for a snapshot's table, checking the rows
+	`candidates` gives for an id against their keys"""
+	
+	def __init__(self, record_ids: _Keys, candidates: Callable[[Hashable], Iterable[int]]):
+		self.record_ids = record_ids
+		self.candidates = candidates
+	
+	def __len__(self):
+		return len(self.record_ids)
+	
+	def __iter__(self):
+		return iter(self.record_ids)
+	
+	def __getitem__(self, record_id):
+		for row in self.candidates(record_id):
+			if self.record_ids[row] == record_id:
+				return row
+		raise KeyError(record_id)
+
+
+class _SnapshotTable(ColumnTable):
+	"""A read-only `ColumnTable` whose columns are sections of a snapshot"""
+	
+	def __init__(self, columns: dict[str, memoryview], rows: _Rows):
+		self.columns = columns # type: ignore
+		self._capacity = len(rows)
+		self.rows = rows # type: ignore
+		self.keys = rows.record_ids # type: ignore
+		self._sorted = {}
+	
+	def upsert(self, record_id: Hashable, values: dict[str, int]) -> int:
+		raise TypeError("a snapshot's columns can't be changed")
+	
+	def to_numpy(self) -> dict[str, numpy.ndarray]:
+		import numpy
+		# read-only already, because the snapshot is mapped read-only
+		return {name: numpy.frombuffer(column, dtype=column.format) for name, column in self.columns.items()}
+
+
+class _SnapshotColumns(ArchiveColumns):
+	"""The `ArchiveColumns` stored in a snapshot, read in place"""
+	
+	def __init__(self, sections: dict[str, memoryview], thread_rows: Callable[[str], Iterable[int]]):
+		self.users = _SnapshotStrings(_Strings(sections, 'users'))
+		self.colors = _SnapshotStrings(_Strings(sections, 'colors'))
+		self.yak_ids = _SnapshotStrings(_Strings(sections, 'yak_ids'))
+		self._yak_rows = None
+		
+		yak_columns = {name: sections[f'yaks.{name}'] for name in self.YAK_COLUMNS}
+		yak_ids, yak_codes = self.yak_ids.values, yak_columns['id']
+		thread_yaks = sections['thread_yaks']
+		self.yaks = _SnapshotTable(yak_columns, _Rows(
+			_Keys(lambda row: yak_ids[yak_codes[row]], len(yak_codes)),
+			lambda yak_id: (thread_yaks[thread] for thread in thread_rows(yak_id)),
+		))
+		
+		comment_columns = {name: sections[f'comments.{name}'] for name in self.COMMENT_COLUMNS}
+		comment_ids, parent_codes = _Strings(sections, 'comment_ids'), comment_columns['yak']
+		indptr = sections['comment_indptr']
+		
+		def thread_comments(key: Hashable) -> Iterable[int]:
+			yak_row = self.yaks.rows.get(key[0]) # type: ignore
+			return range(indptr[yak_row], indptr[yak_row + 1]) if yak_row is not None else ()
+		
+		self.comments = _SnapshotTable(comment_columns, _Rows(
+			_Keys(lambda row: (yak_ids[parent_codes[row]], comment_ids[row]), len(parent_codes)),
+			thread_comments,
+		))
+
+
+class SharedArchive:
+	"""A published snapshot, read in place.
+	
+	Has the reading side of `YakArchive` (iteration, `get_yak`, `len`), so
+	the `yak_data` functions that iterate an archive work on it directly.
+	The column view for the vectorized ones is read straight from the
+	snapshot (for snapshots older than version 3, it's built per process
+	on first use)."""
+	
+	def __init__(self, path: str = DEFAULT_PATH):
+		self.path = path
+		
+		# per process caches, like YakArchive's
+		self.token_cache = {} # type: dict[str, tuple[str, tuple[str, ...]]]
+		self._emoji_counts = None # type: Optional[EmojiCounts]
+		self._columns = None # type: Optional[ArchiveColumns]
+		
+		self._attach()
+	
+	def _attach(self):
+		with open(self.path, 'rb') as file_handle:
+			stat = os.fstat(file_handle.fileno())
+			mapped = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+		
+		magic, version, header_offset, header_length = _PREAMBLE.unpack_from(mapped)
+		if magic != MAGIC:
+			raise ValueError(f"{self.path} isn't an archive snapshot")
+		if version > FORMAT_VERSION:
+			raise ValueError(f"Snapshot {self.path} has format version {version}, but only versions up to {FORMAT_VERSION} are supported")
+		header = json.loads(mapped[header_offset:header_offset + header_length])
+		
+		# NOTE: the map is never closed explicitly; it goes away with the last
+		#       view of it, so anything still reading an old snapshot after a
+		#       refresh() keeps working
+		view = memoryview(mapped)
+		threads_start, threads_length = header['threads']
+		self._threads = view[threads_start:threads_start + threads_length]
+		self._sections = {
+			name: view[offset:offset + length].cast(_SECTION_TYPES[name])
+			for name, (offset, length) in header['sections'].items()
+		}
+		if version == 1:
+			self._sections['user_times'] = self._sections.pop('user_rows')
+		self.num_yaks = header['num_yaks'] # type: int
+		self.published_at = datetime.datetime.fromisoformat(header['published_at'])
+		self._identity = (stat.st_ino, stat.st_mtime_ns)
+	
+	def refresh(self) -> bool:
+		"""Switch to the latest snapshot if a newer one has been published
+		since this one was attached; returns whether it did"""
+		stat = os.stat(self.path)
+		if (stat.st_ino, stat.st_mtime_ns) == self._identity:
+			return False
+		self._attach()
+		self._emoji_counts = None
+		self._columns = None
+		return True
+	
+	def _thread(self, row: int) -> tuple[Yak, list[Comment]]:
+		offsets = self._sections['offsets']
+		return pickle.loads(self._threads[offsets[row]:offsets[row + 1]])
+	
+	def __len__(self):
+		return self.num_yaks
+	
+	def __iter__(self):
+		return self.get_yaks()
+	
+	def __reversed__(self):
+		for row in reversed(range(self.num_yaks)):
+			yield self._thread(row)
+	
+	def get_yaks(self) -> Generator[tuple[Yak, list[Comment]], None, None]:
+		for row in range(self.num_yaks):
+			yield self._thread(row)
+	
+	def _thread_rows(self, yak_id: str) -> Iterator[int]:
+		"""The threads whose yak id has the same hash as `yak_id`"""
+		id_hashes, id_rows = self._sections['id_hashes'], self._sections['id_rows']
+		yak_hash = hash64(yak_id)
+		i = bisect.bisect_left(id_hashes, yak_hash)
+		while i < len(id_hashes) and id_hashes[i] == yak_hash:
+			yield id_rows[i]
+			i += 1
+	
+	def get_yak(self, yak_id: str) -> Optional[tuple[Yak, list[Comment]]]:
+		for row in self._thread_rows(yak_id):
+			thread = self._thread(row)
+			if thread[0].id == yak_id:
+				return thread
+		return None
+	
+	def threads(self,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+		user_id: Optional[str] = None,
+	) -> Generator[tuple[Yak, list[Comment]], None, None]:
+		"""Threads whose yak was posted in [start_time, end_time] (and that
+		`user_id` posted or commented in), newest first, found with the
+		snapshot's indexes rather than by decoding every thread"""
+		created_at = self._sections['created_at']
+		# created_at is newest first, so search it negated
+		first = 0 if end_time is None else bisect.bisect_left(created_at, -epoch_microseconds(end_time), key=lambda time: -time)
+		last = self.num_yaks if start_time is None else bisect.bisect_right(created_at, -epoch_microseconds(start_time), key=lambda time: -time)
+		
+		if user_id is None:
+			times = range(first, last) # type: range | memoryview
+		else:
+			user_hashes = self._sections['user_hashes']
+			user_hash = hash64(user_id)
+			i = bisect.bisect_left(user_hashes, user_hash)
+			if i == len(user_hashes) or user_hashes[i] != user_hash:
+				return
+			indptr = self._sections['user_indptr']
+			times = self._sections['user_times'][indptr[i]:indptr[i + 1]]
+			times = times[bisect.bisect_left(times, first):bisect.bisect_left(times, last)]
+		
+		time_rows = self._sections.get('time_rows')
+		for time in times:
+			yak, comments = self._thread(time if time_rows is None else time_rows[time])
+			# a different user with the same hash (which is very unlikely)
+			if user_id is None or yak.user_id == user_id or any(comment.user_id == user_id for comment in comments):
+				yield yak, comments
+	
+	def to_columns(self) -> ArchiveColumns:
+		if self._columns is None and 'yaks.id' in self._sections:
+			self._columns = _SnapshotColumns(self._sections, self._thread_rows)
+		elif self._columns is None:
+			columns = ArchiveColumns()
+			for yak, comments in self:
+				columns.add_yak(yak)
+				columns.add_comments(yak.id, comments)
+			self._columns = columns
+		return self._columns
+	
+	def emoji_counts(self) -> EmojiCounts:
+		if self._emoji_counts is None:
+			emoji_counts = EmojiCounts()
+			for yak, comments in self:
+				emoji_counts.add_yak(yak)
+				for comment in comments:
+					emoji_counts.add_comment(yak.id, comment)
+			self._emoji_counts = emoji_counts
+		return self._emoji_counts
+	
+	def yak_ids(self) -> Iterator[str]:
+		"""Every yak's id, in iteration order"""
+		columns = self.to_columns()
+		yak_ids, yak_codes = columns.yak_ids.values, columns.yaks['id']
+		# a column view built by this process is in iteration order
+		return (yak_ids[yak_codes[row]] for row in self._sections.get('thread_yaks', range(len(columns.yaks))))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("archive")
+	parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+	parser.add_argument("--watch", type=float, metavar="SECONDS", help="republish whenever the archive changes, checking this often")
+	args = parser.parse_args()
+	
+	published = None
+	while True:
+		stat = os.stat(args.archive)
+		if (stat.st_size, stat.st_mtime_ns) != published:
+			published = stat.st_size, stat.st_mtime_ns
+			start = time.perf_counter()
+			publish(YakArchive(args.archive), args.path)
+			print(f"Published {args.archive} to {args.path} in {time.perf_counter() - start:.1f}s")
+		if args.watch is None:
+			break
+		time.sleep(args.watch)
+
+if __name__ == '__main__': main()
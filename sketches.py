@@ -0,0 +1,143 @@
+"""Fixed-memory approximate counting for archives too big to count exactly.
+
+Hashes come from blake2b rather than `hash()`, so sketches built in
+different processes (or pickled and reloaded) agree and can be merged.
+"""
+from __future__ import annotations
+
+from array import array
+from hashlib import blake2b
+import heapq
+import math
+from typing import Generic, Hashable, Iterator, TypeVar
+
+_Key = TypeVar("_Key", bound=Hashable)
+
+
+def hash64(key: str) -> int:
+	"""A 64 bit hash of `key` that's the same in every process"""
+	return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+def key_string(key: Hashable) -> str:
+	# tuples of user ids (pairs) hash as their joined ids
+	if isinstance(key, tuple):
+		return '\0'.join(key)
+	return str(key)
+
+
+class CountMinSketch:
+	"""Approximate counts in `width * depth` counters; estimates never
+	undercount, and overcount by at most ~e/width of the total with
+	probability 1 - e**-depth"""
+	
+	def __init__(self, width: int = 2**16, depth: int = 4):
+		self.width = width
+		self.depth = depth
+		self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+		self.total = 0
+	
+	def _columns(self, key: str) -> Iterator[int]:
+		# double hashing: depth indexes from one 128 bit digest
+		digest = int.from_bytes(blake2b(key.encode(), digest_size=16).digest(), 'little')
+		h1, h2 = digest & (2**64 - 1), digest >> 64 | 1
+		for i in range(self.depth):
+			yield (h1 + i * h2) % self.width
+	
+	def add(self, key: str, count: int = 1) -> int:
+		"""Add to `key`'s count and return its new estimate"""
+		self.total += count
+		estimate = None
+		for row, column in zip(self.rows, self._columns(key)):
+			row[column] += count
+			estimate = row[column] if estimate is None else min(estimate, row[column])
+		return estimate or 0
+	
+	def estimate(self, key: str) -> int:
+		return min(row[column] for row, column in zip(self.rows, self._columns(key)))
+	
+	def merge(self, other: CountMinSketch):
+		if (self.width, self.depth) != (other.width, other.depth):
+			raise ValueError("Can only merge count-min sketches of the same size")
+		for row, other_row in zip(self.rows, other.rows):
+			for i, value in enumerate(other_row):
+				row[i] += value
+		self.total += other.total
+
+
+class HeavyHitters(Generic[_Key]):
+	"""The `k` keys with the largest estimated counts, tracked alongside a
+	`CountMinSketch` in O(k) memory"""
+	
+	def __init__(self, k: int, sketch: CountMinSketch):
+		self.k = k
+		self.sketch = sketch
+		self.estimates = {} # type: dict[_Key, int]
+		# min heap of (estimate, tiebreak, key); entries go stale when a key's
+		# estimate changes or it's evicted, and are skipped when popped
+		self._heap = [] # type: list[tuple[int, int, _Key]]
+		self._pushes = 0
+	
+	def _push(self, key: _Key, estimate: int):
+		self._pushes += 1
+		heapq.heappush(self._heap, (estimate, self._pushes, key))
+		if len(self._heap) > 4 * self.k + 16:
+			self._heap = [(estimate, i, key) for i, (key, estimate) in enumerate(self.estimates.items())]
+			heapq.heapify(self._heap)
+	
+	def _minimum(self) -> tuple[int, _Key]:
+		while True:
+			estimate, _, key = self._heap[0]
+			if self.estimates.get(key) == estimate:
+				return estimate, key
+			heapq.heappop(self._heap)
+	
+	def add(self, key: _Key, count: int = 1):
+		estimate = self.sketch.add(key_string(key), count)
+		if key in self.estimates:
+			self.estimates[key] = estimate
+			self._push(key, estimate)
+		elif len(self.estimates) < self.k:
+			self.estimates[key] = estimate
+			self._push(key, estimate)
+		else:
+			minimum, minimum_key = self._minimum()
+			if estimate > minimum:
+				del self.estimates[minimum_key]
+				self.estimates[key] = estimate
+				self._push(key, estimate)
+	
+	def top(self) -> dict[_Key, int]:
+		return dict(sorted(self.estimates.items(), key=lambda x:x[1], reverse=True))
+
+
+class HyperLogLog:
+	"""Approximate distinct count in 2**precision bytes (~0.8% standard
+	error at the default precision)"""
+	
+	def __init__(self, precision: int = 14):
+		self.precision = precision
+		self.registers = bytearray(2**precision)
+	
+	def add(self, key: str):
+		value = hash64(key)
+		index = value >> (64 - self.precision)
+		rest = value & ((1 << (64 - self.precision)) - 1)
+		rank = (64 - self.precision) - rest.bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+	
+	def merge(self, other: HyperLogLog):
+		if self.precision != other.precision:
+			raise ValueError("Can only merge HyperLogLogs of the same precision")
+		self.registers = bytearray(map(max, self.registers, other.registers))
+	
+	def __len__(self) -> int:
+		num_registers = len(self.registers)
+		alpha = 0.7213 / (1 + 1.079 / num_registers)
+		estimate = alpha * num_registers**2 / sum(2.0**-register for register in self.registers)
+		
+		zeros = self.registers.count(0)
+		if estimate <= 2.5 * num_registers and zeros:
+			# small range correction (linear counting)
+			estimate = num_registers * math.log(num_registers / zeros)
+		return round(estimate)
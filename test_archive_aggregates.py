@@ -0,0 +1,68 @@
+import dataclasses
+import pickle
+
+import pytest
+
+import yak_data
+from yak_archive import TIMEZONE
+
+
+def _whole_archive(archive):
+	times = [yak.created_at for yak in archive.archive.yaks]
+	times += [comment.created_at for thread in archive.archive.comments.values() for comment in thread]
+	return min(times), max(times)
+
+def _check(archive):
+	aggregates = archive.aggregates()
+	start, end = _whole_archive(archive)
+	
+	assert aggregates.user_activity() == yak_data.most_active_users(archive, start, end)
+	for only_anonymous in (True, False):
+		for repeat_comments_per_thread in (True, False):
+			assert aggregates.coupled_users(False, repeat_comments_per_thread, only_anonymous) == \
+				yak_data.common_coupled_users(archive, start, end, False, repeat_comments_per_thread, only_anonymous)
+	hour_counts = yak_data.HourCounts()
+	yak_data.aggregate(archive, [hour_counts], start, end)
+	assert aggregates.hour_counts(TIMEZONE) == hour_counts.hour_counts
+
+def test_matches_yak_data(archive):
+	_check(archive)
+
+def test_stays_up_to_date(archive, synthetic):
+	archive.aggregates()
+	yaks = archive.archive.yaks
+	
+	# new vote counts, a yak losing its user id (and with it, its thread's
+	# comments) and a comment changing hands
+	for yak in yaks[:20]:
+		archive.add_yak(dataclasses.replace(yak, vote_count=yak.vote_count + 3))
+	no_user = next(yak for yak in yaks if yak.id in archive.archive.comments)
+	archive.add_yak(dataclasses.replace(no_user, user_id=None))
+	yak_id, thread = next(iter(archive.archive.comments.items()))
+	archive.add_comments(yak_id, [dataclasses.replace(thread[0], user_id="someone else")])
+	_check(archive)
+	
+	# comments before their yak only count once it shows up, and a comment
+	# filed under two yaks counts under both
+	yak, comments = next(synthetic.threads())
+	yak.id = "Yak:late"
+	archive.add_comments(yak.id, comments)
+	_check(archive)
+	archive.add_yak(yak)
+	archive.add_comments(yaks[1].id, thread[:1])
+	_check(archive)
+
+def test_word_counts(archive):
+	aggregates = archive.aggregates()
+	yak = archive.archive.yaks[0]
+	before = aggregates.words.copy()
+	archive.add_yak(dataclasses.replace(yak, text="zebra zebra " + yak.text))
+	assert aggregates.words - before == {"zebra": 2}
+	archive.add_yak(yak)
+	assert aggregates.words == before
+
+def test_sidecar_has_no_text(archive):
+	aggregates = archive.aggregates()
+	data = pickle.dumps(aggregates)
+	texts = [yak.text for yak in archive.archive.yaks if len(yak.text) > 40]
+	assert texts and not any(text.encode() in data for text in texts)
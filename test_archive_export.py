@@ -0,0 +1,78 @@
+import datetime
+import gzip
+import json
+import os
+
+import pytest
+
+from archive_export import COMMENT_COLUMNS, YAK_COLUMNS, export, export_archive
+from yak_archive import TIMEZONE
+
+
+def _read_ndjson(path):
+	opener = gzip.open if path.endswith('.gz') else open
+	with opener(path, 'rt', encoding='utf-8') as file:
+		return [json.loads(line) for line in file]
+
+def _comment_keys(archive):
+	return sorted((yak_id, comment.id) for yak_id, thread in archive.archive.comments.items() for comment in thread)
+
+def test_ndjson(archive, tmp_path):
+	directory = str(tmp_path / "export")
+	rows = export([(archive.archive.yaks, archive.archive.comments)], directory, chunk_size=7)
+	assert rows == {'yaks': len(archive.archive.yaks), 'comments': len(_comment_keys(archive))}
+	assert sorted(os.listdir(directory)) == ["comments.ndjson", "yaks.ndjson"]
+	
+	yaks = _read_ndjson(os.path.join(directory, "yaks.ndjson"))
+	# in the order they were added
+	assert [row['id'] for row in yaks] == [yak.id for yak in archive.archive.yaks]
+	assert all(tuple(row) == YAK_COLUMNS for row in yaks)
+	yak = archive.archive.yaks[0]
+	assert datetime.datetime.fromisoformat(yaks[0]['created_at']) == yak.created_at
+	assert yaks[0]['interest_areas'] == list(yak.interest_areas)
+	
+	comments = _read_ndjson(os.path.join(directory, "comments.ndjson"))
+	assert all(set(row) == set(COMMENT_COLUMNS) for row in comments)
+	assert sorted((row['yak_id'], row['id']) for row in comments) == _comment_keys(archive)
+
+def test_filters_and_partitions(archive, tmp_path):
+	archive.save()
+	times = sorted(yak.created_at for yak in archive.archive.yaks)
+	start, end = times[50], times[250]
+	user_id = archive.archive.yaks[0].user_id
+	directory = str(tmp_path / "export")
+	rows = export_archive(archive.path, directory, start_time=start, end_time=end, user_id=user_id, partition_by="day", compression="gzip", threads=2)
+	
+	expected = sorted(yak.id for yak in archive.archive.yaks if start <= yak.created_at <= end and yak.user_id == user_id)
+	assert expected and rows['yaks'] == len(expected)
+	exported = []
+	for name in os.listdir(os.path.join(directory, "yaks")):
+		assert name.endswith(".ndjson.gz")
+		for row in _read_ndjson(os.path.join(directory, "yaks", name)):
+			assert datetime.datetime.fromisoformat(row['created_at']).astimezone(TIMEZONE).strftime("%Y-%m-%d") + ".ndjson.gz" == name
+			exported.append(row['id'])
+	assert sorted(exported) == expected
+
+def test_bad_options(archive, tmp_path):
+	with pytest.raises(ValueError):
+		export([], str(tmp_path / "csv"), format="csv") # type: ignore
+	with pytest.raises(ValueError):
+		export([(archive.archive.yaks, {})], str(tmp_path / "bz2"), compression="bz2")
+
+def test_failed_export_leaves_no_files(archive, tmp_path):
+	def blocks():
+		yield archive.archive.yaks[:10], {}
+		raise RuntimeError("archive went away")
+	directory = str(tmp_path / "export")
+	with pytest.raises(RuntimeError):
+		export(blocks(), directory, chunk_size=3)
+	assert os.listdir(directory) == []
+
+def test_parquet(archive, tmp_path):
+	pq = pytest.importorskip("pyarrow.parquet")
+	directory = str(tmp_path / "export")
+	export([(archive.archive.yaks, archive.archive.comments)], directory, format="parquet", chunk_size=100)
+	table = pq.read_table(os.path.join(directory, "yaks.parquet"))
+	assert table.column_names == list(YAK_COLUMNS)
+	assert table.column('id').to_pylist() == [yak.id for yak in archive.archive.yaks]
+	assert pq.ParquetFile(os.path.join(directory, "yaks.parquet")).num_row_groups == 3
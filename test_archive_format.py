@@ -0,0 +1,78 @@
+import pickle
+import struct
+
+import pytest
+
+import archive_format
+from archive_format import FORMAT_VERSION, MAGIC, compact, iter_blocks, load_archive, read_version, save_archive
+from yak_archive import Archive
+
+
+def _threads(archive):
+	return [(yak, archive.comments.get(yak.id, [])) for yak in archive.yaks]
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_round_trip(synthetic, tmp_path, codec):
+	archive = synthetic.archive()
+	path = str(tmp_path / "archive.yaks")
+	save_archive(path, archive, codec=codec, block_size=64)
+	
+	assert read_version(path) == FORMAT_VERSION
+	loaded = load_archive(path)
+	assert loaded.yaks == archive.yaks
+	assert loaded.comments == archive.comments
+	assert len(list(iter_blocks(path))) == -(-len(archive.yaks) // 64)
+
+def test_orphaned_comments_are_kept(synthetic, tmp_path):
+	archive = synthetic.archive()
+	orphan_id, orphans = next(iter(archive.comments.items()))
+	archive.yaks = [yak for yak in archive.yaks if yak.id != orphan_id]
+	path = str(tmp_path / "archive.yaks")
+	save_archive(path, archive, block_size=64)
+	
+	assert load_archive(path).comments[orphan_id] == orphans
+	assert [comments for _, comments in iter_blocks(path, orphans_only=True)] == [{orphan_id: orphans}]
+
+def test_version_0_is_a_bare_pickle(synthetic, tmp_path):
+	archive = synthetic.archive()
+	path = str(tmp_path / "archive.pickle")
+	with open(path, 'wb') as file_handle:
+		pickle.dump(archive, file_handle)
+	
+	assert read_version(path) == 0
+	loaded = load_archive(path)
+	assert _threads(loaded) == _threads(archive)
+	
+	compact(path)
+	assert read_version(path) == FORMAT_VERSION
+	assert _threads(load_archive(path)) == _threads(archive)
+
+def test_newer_versions_are_refused(tmp_path):
+	path = tmp_path / "archive.yaks"
+	header = b'{"codec": "zlib", "blocks": []}'
+	path.write_bytes(struct.pack("<8sHI", MAGIC, FORMAT_VERSION + 1, len(header)) + header)
+	with pytest.raises(ValueError, match="format version"):
+		load_archive(str(path))
+
+def test_unknown_codec(tmp_path):
+	with pytest.raises(ValueError, match="Unsupported archive codec"):
+		save_archive(str(tmp_path / "archive.yaks"), Archive([], {}), codec="rar")
+
+def test_compact_drops_duplicates(synthetic, tmp_path):
+	archive = synthetic.archive()
+	yak_id, comments = next(iter(archive.comments.items()))
+	archive.yaks.append(archive.yaks[0])
+	archive.comments[yak_id] = comments + comments[:1]
+	path = str(tmp_path / "archive.yaks")
+	save_archive(path, archive)
+	
+	compact(path)
+	loaded = load_archive(path)
+	assert len(loaded.yaks) == len({yak.id for yak in loaded.yaks})
+	assert loaded.comments[yak_id] == comments
+
+def test_cli_needs_a_codec_value(tmp_path, monkeypatch):
+	monkeypatch.setattr("sys.argv", ["archive_format.py", "compact", str(tmp_path / "archive.yaks"), "--codec"])
+	with pytest.raises(SystemExit) as exit_info:
+		archive_format.main()
+	assert exit_info.value.code == 2
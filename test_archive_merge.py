@@ -0,0 +1,121 @@
+import dataclasses
+import datetime
+
+import pytest
+
+from archive_format import load_archive, save_archive
+from archive_merge import diff_archives, merge_archives
+from vote_history import VoteHistory, load_history, save_history
+from yak_archive import Archive
+
+
+def _split(archive):
+	"""Two overlapping crawls: the second one saw newer vote counts"""
+	yaks = archive.yaks
+	first = Archive(yaks[:200], {yak.id: archive.comments[yak.id] for yak in yaks[:200] if yak.id in archive.comments})
+	updated = [dataclasses.replace(yak, vote_count=yak.vote_count + 1) for yak in yaks[100:]]
+	second = Archive(updated, {yak.id: archive.comments[yak.id] for yak in updated if yak.id in archive.comments})
+	return first, second
+
+def test_merge(synthetic, tmp_path):
+	archive = synthetic.archive()
+	first, second = _split(archive)
+	paths = [str(tmp_path / "first.yaks"), str(tmp_path / "second.yaks")]
+	save_archive(paths[0], first, block_size=32)
+	save_archive(paths[1], second, block_size=32)
+	
+	output = str(tmp_path / "merged.yaks")
+	assert merge_archives(paths, output) == len(archive.yaks)
+	merged = load_archive(output)
+	
+	assert [yak.id for yak in merged.yaks] == [yak.id for yak in archive.yaks]
+	later = {yak.id: yak for yak in first.yaks + second.yaks}
+	assert merged.yaks == [later[yak.id] for yak in archive.yaks]
+	assert merged.comments == archive.comments
+
+def test_merge_keeps_vote_history(synthetic, tmp_path):
+	first, second = _split(synthetic.archive())
+	paths = [str(tmp_path / "first.yaks"), str(tmp_path / "second.yaks")]
+	for path, crawl, hours in zip(paths, (first, second), (1, 2)):
+		save_archive(path, crawl)
+		history = VoteHistory()
+		for yak in crawl.yaks:
+			history.add_yak(yak, yak.created_at + datetime.timedelta(hours=hours))
+		save_history(path, history)
+	
+	output = str(tmp_path / "merged.yaks")
+	merge_archives(paths, output)
+	merged = load_history(output)
+	for yak in first.yaks + second.yaks:
+		in_both = [crawl for crawl in (first, second) if yak in crawl.yaks]
+		assert [sample[1] for sample in merged.series(yak.id)] == [
+			next(copy for copy in crawl.yaks if copy.id == yak.id).vote_count for crawl in in_both
+		]
+
+def test_merge_dedupes_comments(synthetic, tmp_path):
+	archive = synthetic.archive()
+	yak_id, thread = next(iter(archive.comments.items()))
+	edited = [dataclasses.replace(thread[0], vote_count=thread[0].vote_count + 5)]
+	paths = [str(tmp_path / "first.yaks"), str(tmp_path / "second.yaks")]
+	save_archive(paths[0], archive)
+	save_archive(paths[1], Archive([], {yak_id: edited}))
+	
+	merge_archives(paths, str(tmp_path / "merged.yaks"))
+	assert load_archive(str(tmp_path / "merged.yaks")).comments[yak_id] == edited + thread[1:]
+
+def test_merge_needs_sorted_inputs(synthetic, tmp_path):
+	archive = synthetic.archive()
+	archive.yaks.reverse()
+	save_archive(str(tmp_path / "unsorted.yaks"), archive)
+	with pytest.raises(ValueError, match="isn't sorted"):
+		merge_archives([str(tmp_path / "unsorted.yaks")], str(tmp_path / "merged.yaks"))
+
+def test_diff(synthetic, tmp_path):
+	archive = synthetic.archive()
+	first, second = _split(archive)
+	yak_id = next(yak.id for yak in second.yaks if yak.id in second.comments)
+	second.comments[yak_id] = second.comments[yak_id][1:]
+	save_archive(str(tmp_path / "first.yaks"), first)
+	save_archive(str(tmp_path / "second.yaks"), second)
+	
+	diff = diff_archives(str(tmp_path / "first.yaks"), str(tmp_path / "second.yaks"))
+	first_ids, second_ids = {yak.id for yak in first.yaks}, {yak.id for yak in second.yaks}
+	assert set(diff.new_yaks) == second_ids - first_ids
+	assert set(diff.deleted_yaks) == first_ids - second_ids
+	assert set(diff.updated_yaks) == first_ids & second_ids
+	assert set(diff.deleted_comments) == {archive.comments[yak_id][0].id} | {
+		comment.id for yak in first.yaks if yak.id not in second_ids for comment in first.comments.get(yak.id, [])
+	}
+	assert set(diff.new_comments) == {
+		comment.id for yak in second.yaks if yak.id not in first_ids for comment in second.comments.get(yak.id, [])
+	}
+	assert not diff.updated_comments
+
+def test_most_recently_observed_copy_wins(synthetic, tmp_path):
+	archive = synthetic.archive()
+	yak_id, thread = next(iter(archive.comments.items()))
+	yak = next(yak for yak in archive.yaks if yak.id == yak_id)
+	stale_yak = dataclasses.replace(yak, vote_count=yak.vote_count - 3)
+	stale_comment = dataclasses.replace(thread[0], vote_count=thread[0].vote_count - 3)
+	
+	# the newer crawl is listed first, and the older one has the comment as an orphan
+	paths = [str(tmp_path / "newer.yaks"), str(tmp_path / "older.yaks")]
+	save_archive(paths[0], Archive([yak], {yak_id: thread}))
+	save_archive(paths[1], Archive([], {yak_id: [stale_comment]}))
+	for path, (crawled_yak, comment), hours in zip(paths, ((yak, thread[0]), (stale_yak, stale_comment)), (2, 1)):
+		history = VoteHistory()
+		history.add_yak(crawled_yak, yak.created_at + datetime.timedelta(hours=hours))
+		history.add_comment(comment, yak.created_at + datetime.timedelta(hours=hours))
+		save_history(path, history)
+	
+	output = str(tmp_path / "merged.yaks")
+	merge_archives(paths, output)
+	merged = load_archive(output).comments[yak_id]
+	assert [comment.id for comment in merged] == [comment.id for comment in thread]
+	assert merged[0].vote_count == thread[0].vote_count
+	
+	# and the same for yaks, whichever order the inputs are in
+	save_archive(paths[1], Archive([stale_yak], {}))
+	for inputs in (paths, paths[::-1]):
+		merge_archives(inputs, output)
+		assert load_archive(output).yaks[0].vote_count == yak.vote_count
@@ -0,0 +1,99 @@
+import collections
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from yak import Yak
+from yak_archive import TIMEZONE
+
+
+@pytest.fixture
+def yaks(archive):
+	return list(archive.archive.yaks)
+
+@pytest.fixture
+def comments(archive, yaks):
+	return [(yak, comment) for yak in yaks for comment in archive.archive.comments.get(yak.id, [])]
+
+@pytest.fixture
+def since(yaks):
+	return sorted(yak.created_at for yak in yaks)[len(yaks) // 2]
+
+def _busiest(user_ids, rank=1):
+	return collections.Counter(user_id for user_id in user_ids if user_id is not None).most_common(rank + 1)[rank][0]
+
+def test_yak_filters(archive, yaks, since):
+	query = archive.query()
+	user = _busiest(yak.user_id for yak in yaks)
+	until = sorted(yak.created_at for yak in yaks)[len(yaks) * 3 // 4]
+	assert sorted(query.where(user=user).ids()) == sorted(yak.id for yak in yaks if yak.user_id == user)
+	assert query.where(since=since, until=until, min_votes=5).count() == sum(1 for yak in yaks if since <= yak.created_at <= until and yak.vote_count >= 5)
+	assert query.where(user=user, since=since).count() == sum(1 for yak in yaks if yak.user_id == user and yak.created_at >= since)
+	assert query.where(incognito=True, max_votes=2).count() == sum(1 for yak in yaks if yak.is_incognito and yak.vote_count <= 2)
+	assert query.where(user="nobody").count() == 0
+	assert query.where(since=since).sum() == sum(yak.vote_count for yak in yaks if yak.created_at >= since)
+	# where()s add up
+	assert query.where(user=user).where(since=since).ids() == query.where(user=user, since=since).ids()
+
+def test_comment_filters(archive, comments, since):
+	query = archive.query().comments()
+	user = _busiest(comment.user_id for _, comment in comments)
+	assert query.where(user=user, since=since, incognito=True, min_votes=1).count() == sum(
+		1 for yak, comment in comments
+		if comment.user_id == user and comment.created_at >= since and yak.is_incognito and comment.vote_count >= 1
+	)
+	yak = max((yak for yak, _ in comments), key=lambda yak: yak.comment_count)
+	thread = archive.archive.comments[yak.id]
+	assert query.where(yak=yak.id).all() == sorted(thread, key=lambda comment: comment.created_at, reverse=True)
+	assert sorted(query.where(yak=yak.id).ids()) == sorted(comment.id for comment in thread)
+
+def test_ordering(archive, yaks):
+	query = archive.query()
+	assert [yak.id for yak in query.limit(5).all()] == [yak.id for yak in sorted(yaks, key=lambda yak: yak.created_at, reverse=True)[:5]]
+	assert [yak.id for yak in query.order_by("oldest").limit(5)] == [yak.id for yak in sorted(yaks, key=lambda yak: yak.created_at)[:5]]
+	assert [yak.vote_count for yak in query.order_by("votes").limit(5)] == sorted((yak.vote_count for yak in yaks), reverse=True)[:5]
+	with pytest.raises(ValueError):
+		query.order_by("random") # type: ignore
+	with pytest.raises(ValueError):
+		query.group_by("month") # type: ignore
+
+def test_grouping(archive, yaks, comments):
+	query = archive.query()
+	local = lambda record: record.created_at.astimezone(TIMEZONE)
+	assert query.group_by("weekday").count() == dict(sorted(collections.Counter(local(yak).weekday() for yak in yaks).items()))
+	assert query.comments().where(incognito=True).group_by("hour").count() == \
+		dict(sorted(collections.Counter(local(comment).hour for yak, comment in comments if yak.is_incognito).items()))
+	assert query.comments().group_by("day").count() == dict(sorted(collections.Counter(local(comment).date() for _, comment in comments).items()))
+	
+	by_user = query.group_by("user").count()
+	assert by_user == dict(collections.Counter(yak.user_id for yak in yaks))
+	assert list(by_user.values()) == sorted(by_user.values(), reverse=True)
+	assert query.comments().group_by("yak").limit(3).count() == dict(collections.Counter(yak.id for yak, _ in comments).most_common(3))
+
+def test_text(archive, yaks, since):
+	word = yaks[0].text.split()[0]
+	expected = sorted(record.id for record in archive.search(word) if isinstance(record, Yak) and record.created_at >= since)
+	assert expected
+	assert sorted(archive.query().where(text=word, since=since).ids()) == expected
+	# the text index settles since/until itself
+	assert "with numpy" not in archive.query().where(text=word, since=since).explain()
+
+def test_explain_picks_the_narrowest_index(archive, yaks, since):
+	query = archive.query()
+	user = _busiest(yak.user_id for yak in yaks)
+	plan = query.where(user=user, since=since, min_votes=3).explain()
+	assert "sorted index on user_id" in plan
+	assert "an index on created_at would leave" in plan
+	assert "filter since, min_votes with numpy" in plan
+	assert "full scan" in query.where(incognito=True).comments().group_by("hour").explain()
+	assert "id lookup" in query.comments().where(yak=yaks[0].id).explain()
+	assert "text index search" in query.where(text="the").explain()
+	assert query.where(user=user).explain().splitlines()[0] == f"yaks where user = {user!r}"
+
+def test_explain_records_every_step(archive, yaks):
+	steps = archive.query().where(yak=yaks[0].id).explain().splitlines()[1:]
+	expected = ["column view of yaks", "id lookup", "order by newest", "look up yaks"]
+	assert len(steps) == len(expected)
+	assert all(step.lstrip().startswith(f"{i}. {name}") for i, (step, name) in enumerate(zip(steps, expected), 1))
+	assert archive.query().comments().group_by("user").explain().splitlines()[-1].lstrip().startswith("3. group by user")
@@ -0,0 +1,103 @@
+import contextlib
+import io
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("jwt")
+
+from client import YikYakClient
+import crawler
+from crawler import Crawler
+from fake_server import FakeServer, FakeYikYak
+from yak_archive import YakArchive
+
+
+@pytest.fixture
+def server():
+	with FakeServer(FakeYikYak(120, num_threads=0)) as server:
+		yield server
+
+def _crawl(server, tmp_path, make_client=None):
+	archive = YakArchive(str(tmp_path / "archive.yaks"))
+	make_client = make_client or (lambda: YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url))
+	crawler = Crawler(archive, make_client, fetchers=2, decoders=1)
+	with contextlib.redirect_stdout(io.StringIO()):
+		crawler.run()
+	return archive, crawler
+
+def _commented(server):
+	return sum(1 for comments in server.fake.comments.values() if comments)
+
+def test_crawl(server, tmp_path):
+	archive, crawler = _crawl(server, tmp_path)
+	assert len(archive) == len(server.fake.yaks)
+	assert sum(len(thread) for thread in archive.archive.comments.values()) == sum(len(thread) for thread in server.fake.comments.values())
+	assert crawler.stats['comments'].skipped == 0
+
+def test_expired_token_is_refreshed(server, tmp_path):
+	def make_client():
+		client = YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url)
+		# every token issued so far has expired
+		server.fake.access_tokens.clear()
+		return client
+	
+	archive, crawler = _crawl(server, tmp_path, make_client)
+	assert len(archive) == len(server.fake.yaks)
+	assert len(archive.archive.comments) == _commented(server)
+	assert crawler.stats['feed'].errors + crawler.stats['comments'].errors > 0
+	assert crawler.stats['comments'].skipped == 0
+
+def test_deleted_yaks_are_skipped(server, tmp_path):
+	deleted = next(yak_id for yak_id, comments in server.fake.comments.items() if comments)
+	# still in the feed, but gone by the time its comments are fetched
+	del server.fake.yaks[deleted]
+	
+	archive, crawler = _crawl(server, tmp_path)
+	assert deleted not in archive.archive.comments
+	assert len(archive.archive.comments) == _commented(server) - 1
+	assert crawler.stats['comments'].skipped == 1
+
+def test_other_errors_stop_the_crawl(server, tmp_path):
+	broken = next(yak_id for yak_id, comments in server.fake.comments.items() if comments)
+	
+	def make_client():
+		client = YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url)
+		comment_page = client.comment_page
+		def buggy_comment_page(yak_id, cursor=None):
+			if yak_id == broken:
+				raise KeyError("edges")
+			return comment_page(yak_id, cursor)
+		client.comment_page = buggy_comment_page
+		return client
+	
+	with pytest.raises(KeyError):
+		_crawl(server, tmp_path, make_client)
+
+def test_skipped_threads_are_fetched_next_time(server, tmp_path, monkeypatch):
+	monkeypatch.setattr(crawler.time, "sleep", lambda seconds: None)
+	flaky = next(yak_id for yak_id, comments in server.fake.comments.items() if comments)
+	
+	def make_client():
+		client = YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url)
+		comment_page = client.comment_page
+		def flaky_comment_page(yak_id, cursor=None):
+			if yak_id == flaky:
+				raise requests.RequestException("connection reset")
+			return comment_page(yak_id, cursor)
+		client.comment_page = flaky_comment_page
+		return client
+	
+	archive, first = _crawl(server, tmp_path, make_client)
+	assert first.stats['comments'].skipped == 1
+	assert flaky not in archive.archive.comments
+	assert archive.yak_hash[flaky].comment_count == 0
+	# the vote history still has what the feed showed
+	assert archive.history.series(flaky)[-1][2] == len(server.fake.comments[flaky])
+	
+	second = Crawler(archive, lambda: YikYakClient("fake-refresh-token", (0.0, 0.0), api_url=server.api_url, token_url=server.token_url), fetchers=2, decoders=1)
+	with contextlib.redirect_stdout(io.StringIO()):
+		second.run()
+	assert len(archive.archive.comments[flaky]) == len(server.fake.comments[flaky])
+	assert archive.yak_hash[flaky].comment_count == len(server.fake.comments[flaky])
+	assert second.stats['comments'].pages == 1
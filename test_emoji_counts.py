@@ -0,0 +1,72 @@
+import collections
+import dataclasses
+
+import yak_data
+from emoji_counts import EmojiCounts
+
+
+def _expected(archive):
+	counts = {}
+	for yak, thread in archive:
+		for comment in thread:
+			if comment.user_id is None or comment.user_emoji in (None, 'OP'): continue
+			look = (comment.user_color, comment.secondary_user_color, comment.user_emoji)
+			counts.setdefault(comment.user_id, collections.Counter())[look] += 1
+	return counts
+
+def _commented(archive):
+	for yak, thread in archive:
+		for comment in thread:
+			if comment.user_id is not None and comment.user_emoji not in (None, 'OP'):
+				return yak, comment
+	raise AssertionError("no comments with a look")
+
+def test_counts_match_archive(archive):
+	assert archive.emoji_counts().counts == _expected(archive)
+
+def test_kept_up_to_date(archive):
+	index = archive.emoji_counts()
+	yak, comment = _commented(archive)
+	
+	# yaks never change emoji counts, so adding one doesn't rebuild anything
+	archive.add_yak(yak)
+	assert archive.emoji_counts() is index
+	
+	archive.add_comments(yak.id, [dataclasses.replace(comment, user_emoji="🦄")])
+	assert archive.emoji_counts() is index
+	assert index.counts == _expected(archive)
+	assert index.counts[comment.user_id][(comment.user_color, comment.secondary_user_color, "🦄")] >= 1
+
+def test_orphans_count_once_their_yak_arrives(archive):
+	yak, comment = _commented(archive)
+	index = EmojiCounts()
+	index.add_comment(yak.id, comment)
+	index.add_comment(yak.id, dataclasses.replace(comment, id=comment.id + "-op", user_emoji='OP'))
+	assert index.counts == {}
+	
+	index.add_yak(yak)
+	index.add_yak(yak)
+	assert index.counts == {comment.user_id: {(comment.user_color, comment.secondary_user_color, comment.user_emoji): 1}}
+	
+	index.add_comment(yak.id, dataclasses.replace(comment, user_id=None))
+	assert index.counts == {}
+
+def test_get_emojis(archive):
+	expected = {}
+	for user_id, counts in _expected(archive).items():
+		named = collections.Counter()
+		for (color, secondary_color, emoji), count in counts.items():
+			named[yak_data.COLOR_CODES.get((color, secondary_color), '??') + emoji] += count
+		expected[user_id] = named
+	
+	emojis = yak_data.all_emojis(archive)
+	assert emojis.keys() == expected.keys()
+	for user_id, names in emojis.items():
+		assert sorted(names) == sorted(expected[user_id])
+		assert names == sorted(expected[user_id], key=lambda name: (-expected[user_id][name], name))
+		assert yak_data.get_emojis(archive, user_id) == names
+	
+	user_id = next(iter(expected))
+	total = sum(expected[user_id].values())
+	assert yak_data.get_emojis(archive, user_id, 0.2) == [name for name in emojis[user_id] if expected[user_id][name] / total > 0.2]
+	assert yak_data.get_emojis(archive, "nobody") == []
@@ -0,0 +1,99 @@
+import dataclasses
+import datetime
+import itertools
+
+import pytest
+
+import yak_data
+from interaction_graph import InteractionGraph
+
+
+FLAGS = list(itertools.product([False, True], repeat=3))
+
+def _rebuilt(archive):
+	graph = InteractionGraph()
+	for yak, thread in archive:
+		graph.add_yak(yak)
+		for comment in thread:
+			graph.add_comment(yak.id, comment)
+	return graph
+
+@pytest.mark.parametrize("include_self, repeat_comments_per_thread, only_anonymous", FLAGS)
+def test_matches_common_coupled_users(archive, include_self, repeat_comments_per_thread, only_anonymous):
+	start = min(yak.created_at for yak in archive.archive.yaks)
+	end = max(yak.created_at for yak in archive.archive.yaks)
+	flags = dict(include_self=include_self, repeat_comments_per_thread=repeat_comments_per_thread, only_anonymous=only_anonymous)
+	
+	graph = archive.interaction_graph().graph(**flags)
+	assert graph.pairs() == yak_data.common_coupled_users(archive, start, end, **flags)
+	
+	middle = start + (end - start) / 2
+	windowed = archive.interaction_graph().graph(start_time=start, end_time=middle, **flags)
+	assert windowed.pairs() == yak_data.common_coupled_users(archive, start, middle, **flags)
+
+def test_neighbors_and_degrees(archive):
+	graph = archive.interaction_graph().graph(include_self=True, only_anonymous=False)
+	pairs = graph.pairs()
+	poster, commenter = next(iter(pairs))
+	
+	assert graph.weight(poster, commenter) == pairs[(poster, commenter)]
+	assert graph.neighbors(poster) == {c: weight for (p, c), weight in pairs.items() if p == poster}
+	assert graph.neighbors(commenter, "in") == {p: weight for (p, c), weight in pairs.items() if c == commenter}
+	assert graph.degree(poster, weighted=True) == sum(graph.neighbors(poster).values())
+	assert graph.degrees().sum() == graph.num_edges == len(pairs)
+	assert graph.degrees("in", weighted=True).sum() == sum(pairs.values())
+	assert graph.neighbors("nobody") == {}
+
+def test_kept_up_to_date(archive):
+	index = archive.interaction_graph()
+	before = index.graph(only_anonymous=False)
+	
+	yak, thread = next((yak, thread) for yak, thread in archive if yak.user_id is not None and thread)
+	archive.add_comments(yak.id, [
+		dataclasses.replace(thread[0], user_id="newcomer"),
+		dataclasses.replace(thread[0], id="new comment", user_id="newcomer"),
+	])
+	archive.add_yak(dataclasses.replace(yak, is_incognito=not yak.is_incognito))
+	
+	assert archive.interaction_graph() is index
+	after = index.graph(only_anonymous=False)
+	assert after is not before
+	assert after.weight(yak.user_id, "newcomer") == 2
+	for flags in FLAGS:
+		assert index.graph(*flags).pairs() == _rebuilt(archive).graph(*flags).pairs()
+	# unchanged vote counts don't throw the cached graphs away
+	archive.add_comments(yak.id, [dataclasses.replace(archive.get_comment(yak.id, "new comment"), vote_count=99)])
+	assert index.graph(only_anonymous=False) is after
+
+def test_comments_before_their_yak(archive):
+	yak, thread = next((yak, thread) for yak, thread in archive if yak.user_id is not None and thread)
+	graph = InteractionGraph()
+	for comment in thread:
+		graph.add_comment(yak.id, comment)
+	assert graph.graph(include_self=True, only_anonymous=False).pairs() == {}
+	
+	graph.add_yak(yak)
+	expected = yak_data.CoupledUserCounts(include_self=True, only_anonymous=False)
+	expected.add_thread(yak, True, thread, thread)
+	assert graph.graph(include_self=True, only_anonymous=False).pairs() == expected.finish(yak.created_at, yak.created_at + datetime.timedelta(1))
+
+def test_windows_follow_new_rows(archive):
+	index = archive.interaction_graph()
+	times = sorted(yak.created_at for yak in archive.archive.yaks)
+	windows = [(times[0], times[100]), (times[100], times[250]), (times[200], None), (None, times[50])]
+	for start, end in windows:
+		index.graph(start_time=start, end_time=end, only_anonymous=False)
+	
+	# new threads (merged into the sorted rows), one of them before its yak
+	# (which moves its rows once the yak arrives)
+	yak, thread = next((yak, thread) for yak, thread in archive if yak.user_id is not None and thread)
+	early = dataclasses.replace(yak, id="Yak:early", created_at=times[10])
+	archive.add_comments(early.id, [dataclasses.replace(comment, id=f"{comment.id}:early") for comment in thread])
+	archive.add_comments(yak.id, [dataclasses.replace(thread[0], id="new comment", user_id="newcomer")])
+	index.graph(start_time=times[0], end_time=times[100], only_anonymous=False)
+	archive.add_yak(early)
+	
+	rebuilt = _rebuilt(archive)
+	for start, end in windows:
+		for flags in FLAGS:
+			assert index.graph(*flags, start_time=start, end_time=end).pairs() == rebuilt.graph(*flags, start_time=start, end_time=end).pairs()
@@ -0,0 +1,49 @@
+import copyreg
+import dataclasses
+import pickle
+import sys
+
+import pytest
+
+from comment import Comment
+from fake_server import comment_node, yak_node
+from interning import shared_tuple
+from yak import Yak
+
+
+@pytest.fixture
+def records(synthetic):
+	archive = synthetic.archive()
+	yak = next(yak for yak in archive.yaks if archive.comments.get(yak.id) and yak.interest_areas)
+	return yak, archive.comments[yak.id][0]
+
+def test_records_are_slotted(records):
+	for record in records:
+		assert not hasattr(record, '__dict__')
+
+def test_from_json_shares_strings_and_tuples(records):
+	yak, comment = records
+	first, second = Yak.from_json(yak_node(yak)), Yak.from_json(yak_node(yak))
+	assert first.interest_areas is second.interest_areas
+	assert first.user_color is second.user_color
+	assert shared_tuple(list(yak.interest_areas)) is first.interest_areas
+	# "".join makes a new, uninterned copy
+	assert Comment.from_json({**comment_node(comment), 'userColor': "".join(comment.user_color)}).user_color is \
+		Comment.from_json(comment_node(comment)).user_color
+
+def test_pickles_fields_as_a_dict(records):
+	for record in records:
+		state = record.__getstate__()
+		assert state == {field.name: getattr(record, field.name) for field in dataclasses.fields(record)}
+		copy = pickle.loads(pickle.dumps(record))
+		assert dataclasses.asdict(copy) == dataclasses.asdict(record)
+
+def test_loads_state_from_unslotted_records(records):
+	_, comment = records
+	# what a plain dataclass pickles, either bare or as (__dict__, slots)
+	state = {**comment.__getstate__(), 'user_color': "".join(comment.user_color)}
+	for pickled_state in (state, (state, {})):
+		loaded = copyreg.__newobj__(Comment) # type: ignore
+		loaded.__setstate__(pickled_state)
+		assert dataclasses.asdict(loaded) == dataclasses.asdict(comment)
+		assert loaded.user_color is sys.intern(comment.user_color)
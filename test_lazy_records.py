@@ -0,0 +1,55 @@
+import dataclasses
+import pickle
+
+import pytest
+
+from comment import Comment
+from fake_server import comment_node, yak_node
+from lazy_records import LazyComment, LazyYak
+from yak import Yak
+
+
+@pytest.fixture
+def records(synthetic):
+	archive = synthetic.archive()
+	yak = next(yak for yak in archive.yaks if archive.comments.get(yak.id))
+	return yak, archive.comments[yak.id][0]
+
+def _fields(record):
+	return {field.name: getattr(record, field.name) for field in dataclasses.fields(record)}
+
+def test_fields_decode_like_from_json(records):
+	yak, comment = records
+	for lazy_class, record, from_json, node in (
+		(LazyYak, yak, Yak.from_json, yak_node(yak)),
+		(LazyComment, comment, Comment.from_json, comment_node(comment)),
+	):
+		lazy = lazy_class(node)
+		assert lazy.id == record.id
+		assert lazy == record and hash(lazy) == hash(record)
+		assert _fields(lazy) == _fields(from_json(node))
+		with pytest.raises(AttributeError):
+			lazy.missing
+
+def test_materialize_keeps_changed_fields(records):
+	yak, _ = records
+	lazy = LazyYak(yak_node(yak))
+	lazy.vote_count = -7
+	materialized = lazy.materialize()
+	assert type(materialized) is Yak
+	assert materialized.vote_count == -7
+	assert _fields(materialized) == {**_fields(Yak.from_json(yak_node(yak))), 'vote_count': -7}
+
+def test_pickling_needs_materialize(records):
+	yak, comment = records
+	for lazy in (LazyYak(yak_node(yak)), LazyComment(comment_node(comment))):
+		with pytest.raises(TypeError):
+			pickle.dumps(lazy)
+		assert pickle.loads(pickle.dumps(lazy.materialize())) == lazy
+
+def test_archive_stores_plain_records(archive, records):
+	yak, comment = records
+	archive.add_yak(LazyYak(yak_node(yak)))
+	archive.add_comments(yak.id, [LazyComment(comment_node(comment))])
+	assert type(archive.yak_hash[yak.id]) is Yak
+	assert all(type(stored) is Comment for stored in archive.archive.comments[yak.id])
@@ -0,0 +1,75 @@
+import collections
+import dataclasses
+import datetime
+
+import pytest
+
+import yak_data
+from comment import Comment
+from live_stats import LiveStats
+
+
+@pytest.fixture
+def items(synthetic):
+	items = [item for yak, thread in synthetic.threads() for item in [yak] + thread]
+	items.sort(key=lambda item: item.created_at)
+	return items
+
+def test_window_matches_recount(items, monkeypatch):
+	monkeypatch.setattr(yak_data, "tokenize", lambda texts: [tuple(text.split()) for text in texts])
+	monkeypatch.setattr(yak_data, "stopwords", lambda: frozenset(["the"]))
+	
+	stats = LiveStats(window=datetime.timedelta(days=2), resolution=datetime.timedelta(hours=1))
+	stats.update(items[:len(items) // 2])
+	
+	# buckets are whole hours, so the window starts at the top of an hour
+	newest = max(item.created_at for item in items[:len(items) // 2])
+	start = newest.replace(minute=0, second=0, microsecond=0) - datetime.timedelta(days=2) + datetime.timedelta(hours=1)
+	window = [item for item in items[:len(items) // 2] if item.created_at >= start]
+	
+	assert stats.posts == sum(1 for item in window if not isinstance(item, Comment))
+	assert stats.comments == sum(1 for item in window if isinstance(item, Comment))
+	
+	words = collections.Counter(word for item in window for word in item.text.split())
+	del words["the"]
+	assert stats.most_common_words() == dict(sorted(words.items(), key=lambda x: x[1], reverse=True))
+	
+	totals = collections.Counter(item.user_id for item in window if item.user_id is not None)
+	activity = stats.most_active_users()
+	assert {user_id: counts['total'] for user_id, counts in activity.items()} == totals
+	assert list(stats.most_active_users(limit=3)) == list(activity)[:3]
+
+def test_items_seen_again_replace_themselves(items):
+	stats = LiveStats(track_words=False)
+	yak = next(item for item in items if not isinstance(item, Comment) and item.user_id is not None)
+	stats.add_yak(yak)
+	stats.add_yak(dataclasses.replace(yak, vote_count=yak.vote_count + 10))
+	assert stats.posts == 1
+	assert stats.most_active_users()[yak.user_id]['post_upvotes'] == yak.vote_count + 10
+	
+	# an hour later it's out of the window
+	stats.advance(yak.created_at + datetime.timedelta(hours=1, minutes=1))
+	assert stats.posts == 0
+	assert stats.most_active_users() == {}
+
+def test_rate_before_the_window_fills(items):
+	stats = LiveStats(track_words=False)
+	yak = next(item for item in items if not isinstance(item, Comment))
+	start = yak.created_at.replace(second=0, microsecond=0)
+	
+	assert stats.yaks_per_hour() == {'posts': 0, 'comments': 0, 'total': 0}
+	
+	# two posts over the first half hour are four an hour, not two
+	stats.add_yak(dataclasses.replace(yak, id="a", created_at=start))
+	stats.add_yak(dataclasses.replace(yak, id="b", created_at=start + datetime.timedelta(minutes=29)))
+	assert stats.yaks_per_hour()['posts'] == pytest.approx(4)
+	
+	# once the window is full, it's the whole hour
+	stats.advance(start + datetime.timedelta(minutes=59))
+	assert stats.yaks_per_hour()['posts'] == pytest.approx(2)
+	stats.advance(start + datetime.timedelta(hours=5))
+	assert stats.yaks_per_hour()['posts'] == 0
+
+def test_update_rejects_other_types():
+	with pytest.raises(TypeError):
+		LiveStats().update(["not a yak"]) # type: ignore
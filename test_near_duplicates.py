@@ -0,0 +1,105 @@
+import datetime
+import pickle
+
+import pytest
+
+import near_duplicates
+from near_duplicates import NearDuplicateIndex, shingles, signature, similarity
+
+
+NOW = datetime.datetime(2023, 3, 1, tzinfo=datetime.timezone.utc)
+TEXT = "does anyone know if the dining hall is open late tonight"
+
+def test_signatures_ignore_case_quotes_and_spacing():
+	assert signature("It’s   OPEN tonight") == signature("it's open tonight")
+	assert signature("   ") is None
+	assert shingles("") == set()
+	assert len(signature(TEXT)) == near_duplicates.NUM_HASHES
+
+def test_similarity_estimates_jaccard():
+	first = TEXT
+	second = TEXT.replace("tonight", "tomorrow")
+	first_shingles, second_shingles = shingles(first), shingles(second)
+	jaccard = len(first_shingles & second_shingles) / len(first_shingles | second_shingles)
+	assert similarity(signature(first), signature(second)) == pytest.approx(jaccard, abs=0.2)
+	assert similarity(signature(first), signature(first)) == 1
+
+def test_near_duplicates_and_clusters():
+	index = NearDuplicateIndex()
+	index.add_document("a", TEXT, NOW)
+	index.add_document("b", TEXT.upper() + "!!", NOW + datetime.timedelta(minutes=1))
+	index.add_document("c", "my roommate keeps eating my cereal and i am losing it", NOW + datetime.timedelta(minutes=2))
+	index.add_document("d", TEXT, NOW + datetime.timedelta(days=1))
+	
+	assert [doc_id for doc_id, _ in index.near_duplicates("a")] == ["d", "b"]
+	assert index.near_duplicates("c") == []
+	assert {doc_id for doc_id, score in index.similar_to(TEXT) if score == 1} == {"a", "d"}
+	assert index.similar_to("") == []
+	assert index.clusters() == [["a", "b", "d"]]
+	assert index.clusters(end_time=NOW + datetime.timedelta(hours=1)) == [["a", "b"]]
+	with pytest.raises(KeyError):
+		index.near_duplicates("missing")
+
+def test_edited_text_is_reindexed():
+	index = NearDuplicateIndex()
+	index.add_document("a", TEXT, NOW)
+	index.add_document("b", TEXT, NOW)
+	index.add_document("b", "something else entirely, nothing like it", NOW)
+	assert index.near_duplicates("a") == []
+	row = index.rows["b"]
+	assert {key for key, rows in index.buckets.items() if row in rows} == set(index._band_keys(signature("something else entirely, nothing like it")))
+
+def test_empty_text_then_edited():
+	index = NearDuplicateIndex()
+	index.add_document("a", "   ", NOW)
+	assert index.near_duplicates("a") == []
+	assert index.buckets == {}
+	
+	index.add_document("a", TEXT, NOW)
+	index.add_document("b", TEXT, NOW)
+	assert [doc_id for doc_id, _ in index.near_duplicates("b")] == ["a"]
+	
+	# and back to empty
+	index.add_document("a", "", NOW)
+	assert index.near_duplicates("b") == []
+
+def test_archive_index(archive):
+	yak = archive.archive.yaks[0]
+	index = archive.near_duplicates()
+	assert len(index.ids) == len(archive.archive.yaks) + sum(len(thread) for thread in archive.archive.comments.values())
+	assert yak.id in [doc_id for doc_id, _ in index.similar_to(yak.text, threshold=1)]
+
+def test_windowed_clusters_only_look_at_the_window(monkeypatch):
+	index = NearDuplicateIndex()
+	for day in range(30):
+		index.add_document(f"old{day}", TEXT, NOW - datetime.timedelta(days=day + 1))
+	index.add_document("a", TEXT, NOW)
+	index.add_document("b", TEXT + "!", NOW + datetime.timedelta(minutes=1))
+	index.add_document("c", "my roommate keeps eating my cereal and i am losing it", NOW + datetime.timedelta(minutes=2))
+	
+	looked_at = []
+	band_keys = index._band_keys
+	monkeypatch.setattr(index, "_band_keys", lambda sig: looked_at.append(sig) or band_keys(sig))
+	assert index.clusters(NOW, NOW + datetime.timedelta(hours=1)) == [["a", "b"]]
+	assert len(looked_at) == 3
+	
+	# rows added after the window was sorted
+	index.add_document("d", TEXT, NOW + datetime.timedelta(minutes=3))
+	assert index.clusters(NOW, NOW + datetime.timedelta(hours=1)) == [["a", "b", "d"]]
+	assert len(index.clusters()[0]) == 33
+
+def test_pickled_index(archive):
+	index = archive.near_duplicates()
+	index.clusters(end_time=archive.archive.yaks[0].created_at)
+	loaded = pickle.loads(pickle.dumps(index))
+	assert loaded._sorted is None
+	assert loaded.clusters() == index.clusters()
+	
+	# saved before buckets were dicts
+	old = pickle.loads(pickle.dumps(index))
+	old.buckets = {key: list(rows) for key, rows in old.buckets.items()}
+	loaded = pickle.loads(pickle.dumps(old))
+	assert all(isinstance(rows, dict) for rows in loaded.buckets.values())
+	yak = archive.archive.yaks[0]
+	loaded.add_document(yak.id, "something else entirely, nothing like it", yak.created_at)
+	assert yak.id not in [doc_id for doc_id, _ in loaded.similar_to(yak.text)]
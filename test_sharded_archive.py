@@ -0,0 +1,124 @@
+import contextlib
+import dataclasses
+import datetime
+import io
+import multiprocessing
+
+import pytest
+
+from sharded_archive import ShardedYakArchive
+from yak_archive import YakArchive
+
+
+def _quiet(function, *args, **kwargs):
+	# YakArchive prints every load and save
+	with contextlib.redirect_stdout(io.StringIO()):
+		return function(*args, **kwargs)
+
+def _thread_ids(archive):
+	return [(yak.id, [comment.id for comment in comments]) for yak, comments in archive]
+
+def test_from_archive(archive, tmp_path):
+	sharded = _quiet(ShardedYakArchive.from_archive, archive, str(tmp_path / "shards"))
+	reopened = ShardedYakArchive(str(tmp_path / "shards"))
+	
+	newest_first = sorted(archive.archive.yaks, key=lambda yak: yak.created_at, reverse=True)
+	assert len(reopened) == len(archive)
+	assert [yak_id for yak_id, _ in _quiet(_thread_ids, reopened)] == [yak.id for yak in newest_first]
+	assert [yak.id for yak, _ in _quiet(list, reversed(reopened))] == [yak.id for yak in reversed(newest_first)]
+	
+	yak = newest_first[len(newest_first) // 2]
+	assert _quiet(reopened.get_yak, yak.id) == archive.get_yak(yak.id)
+	assert len(sharded.shard_keys()) > 1
+	assert sharded.shard_keys(yak.created_at, yak.created_at) == [sharded.shard_key(yak.created_at)]
+
+def test_from_archive_keeps_vote_history(archive, tmp_path):
+	yaks = archive.archive.yaks[:20]
+	for i, yak in enumerate(yaks):
+		archive.add_yak(yak, yak.created_at + datetime.timedelta(minutes=i))
+		archive.add_comments(yak.id, archive.archive.comments.get(yak.id, []), yak.created_at + datetime.timedelta(hours=1))
+	
+	directory = str(tmp_path / "shards")
+	_quiet(ShardedYakArchive.from_archive, archive, directory)
+	reopened = ShardedYakArchive(directory)
+	for yak in archive.archive.yaks:
+		history = _quiet(reopened.shard, reopened.index[yak.id]).history
+		# only what was really observed, nothing stamped with the migration time
+		assert history.series(yak.id) == archive.history.series(yak.id)
+		for comment in archive.archive.comments.get(yak.id, []):
+			assert history.series(comment.id) == archive.history.series(comment.id)
+
+def test_writers_sharing_a_shard_keep_each_others_changes(archive, tmp_path):
+	directory = str(tmp_path / "shards")
+	yaks = sorted(archive.archive.yaks, key=lambda yak: yak.created_at)[:20]
+	first, second = ShardedYakArchive(directory), ShardedYakArchive(directory)
+	
+	for i, yak in enumerate(yaks):
+		writer = first if i % 2 else second
+		_quiet(writer.add_yak, yak)
+		_quiet(writer.add_comments, yak.id, archive.archive.comments.get(yak.id, []))
+	_quiet(first.save)
+	_quiet(second.save)
+	
+	reopened = ShardedYakArchive(directory)
+	assert sorted(_quiet(_thread_ids, reopened)) == sorted(_quiet(_thread_ids, [archive.get_yak(yak.id) for yak in yaks]))
+
+def _write_yaks(directory, yaks, start):
+	sharded = ShardedYakArchive(directory)
+	for i, yak in enumerate(yaks):
+		sharded.add_yak(dataclasses.replace(yak, id=f"Yak:{start + i}"))
+		if i % 5 == 4:
+			sharded.save()
+	sharded.save()
+
+def test_concurrent_processes(archive, tmp_path):
+	directory = str(tmp_path / "shards")
+	# all in the same month, so every save goes to the same shard
+	yak = archive.archive.yaks[0]
+	yaks = [dataclasses.replace(yak, created_at=yak.created_at.replace(day=1) + datetime.timedelta(hours=i)) for i in range(30)]
+	
+	context = multiprocessing.get_context("fork")
+	with contextlib.redirect_stdout(io.StringIO()):
+		processes = [context.Process(target=_write_yaks, args=(directory, yaks, start)) for start in (0, 1000, 2000)]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join()
+	assert all(process.exitcode == 0 for process in processes)
+	
+	reopened = ShardedYakArchive(directory)
+	assert len(reopened) == 90
+	assert len(_quiet(list, reopened)) == 90
+
+def test_comments_before_their_yak(archive, tmp_path):
+	directory = str(tmp_path / "shards")
+	yak = archive.archive.yaks[0]
+	comments = archive.archive.comments[yak.id] = [
+		dataclasses.replace(comment, created_at=yak.created_at + datetime.timedelta(days=40))
+		for comment in archive.archive.comments.get(yak.id, [])
+	] or pytest.skip("the newest yak has no comments")
+	
+	sharded = ShardedYakArchive(directory)
+	_quiet(sharded.add_comments, yak.id, comments)
+	assert _quiet(sharded.get_yak, yak.id) is None
+	_quiet(sharded.save)
+	
+	sharded = ShardedYakArchive(directory)
+	_quiet(sharded.add_yak, yak)
+	_quiet(sharded.save)
+	assert _quiet(ShardedYakArchive(directory).get_yak, yak.id) == (yak, comments)
+	
+	# the copies left behind in the first shard go when it's compacted
+	orphan_key = sharded.shard_key(comments[0].created_at)
+	assert orphan_key != sharded.shard_key(yak.created_at)
+	_quiet(sharded.compact, orphan_key)
+	assert yak.id not in _quiet(YakArchive, sharded.shard_path(orphan_key)).archive.comments
+
+def test_compacted_shards_are_read_only(archive, tmp_path):
+	sharded = _quiet(ShardedYakArchive.from_archive, archive, str(tmp_path / "shards"))
+	key = sharded.shard_keys()[0]
+	_quiet(sharded.compact, key)
+	
+	yak = next(yak for yak in archive.archive.yaks if sharded.shard_key(yak.created_at) == key)
+	with pytest.raises(ValueError, match="read-only"):
+		ShardedYakArchive(str(tmp_path / "shards")).add_yak(yak)
@@ -0,0 +1,119 @@
+import concurrent.futures
+import os
+import random
+
+import pytest
+
+import yak_data
+from shared_archive import SharedArchive, publish
+
+
+def _threads(archive):
+	return [(yak.id, [comment.id for comment in comments]) for yak, comments in archive]
+
+@pytest.fixture
+def unsorted(archive):
+	# like an archive that's had yaks added since it was last saved
+	random.Random(0).shuffle(archive.archive.yaks)
+	return archive
+
+@pytest.fixture
+def shared(unsorted, tmp_path):
+	path = str(tmp_path / "snapshot")
+	publish(unsorted, path)
+	return SharedArchive(path)
+
+def test_iterates_like_the_archive(unsorted, shared):
+	assert len(shared) == len(unsorted)
+	assert _threads(shared) == _threads(unsorted)
+	assert _threads(reversed(shared)) == _threads(reversed(unsorted))
+	assert list(shared.yak_ids()) == list(unsorted.yak_ids())
+	yak = unsorted.archive.yaks[17]
+	assert shared.get_yak(yak.id) == unsorted.get_yak(yak.id)
+	assert shared.get_yak("missing") is None
+
+def test_yak_data_gives_the_same_results(unsorted, shared):
+	start = min(yak.created_at for yak in unsorted.archive.yaks)
+	end = max(yak.created_at for yak in unsorted.archive.yaks)
+	for function in (yak_data.most_active_users, yak_data.common_coupled_users, yak_data.yaks_by_user, yak_data.most_active_users_vectorized):
+		assert list(function(shared, start, end).items()) == list(function(unsorted, start, end).items())
+	assert yak_data.avg_yaks_per_hour(shared, end_time=end) == yak_data.avg_yaks_per_hour(unsorted, end_time=end)
+	assert yak_data.all_emojis(shared) == yak_data.all_emojis(unsorted)
+
+def test_threads(unsorted, shared):
+	newest_first = sorted(unsorted.archive.yaks, key=lambda yak: yak.created_at, reverse=True)
+	start, end = newest_first[200].created_at, newest_first[50].created_at
+	in_window = [yak.id for yak in newest_first if start <= yak.created_at <= end]
+	assert [yak.id for yak, _ in shared.threads(start, end)] == in_window
+	assert [yak.id for yak, _ in shared.threads()] == [yak.id for yak in newest_first]
+	
+	user_id = newest_first[100].user_id
+	assert user_id is not None
+	expected = [
+		yak.id for yak in newest_first
+		if start <= yak.created_at <= end
+		and (yak.user_id == user_id or any(comment.user_id == user_id for comment in unsorted.archive.comments.get(yak.id, [])))
+	]
+	assert [yak.id for yak, _ in shared.threads(start, end, user_id)] == expected
+	assert list(shared.threads(user_id="nobody")) == []
+
+def test_refresh(unsorted, shared, tmp_path):
+	assert not shared.refresh()
+	old = list(shared)
+	unsorted.archive.yaks = unsorted.archive.yaks[:10]
+	publish(unsorted, shared.path)
+	assert shared.refresh()
+	assert len(shared) == 10
+	assert len(old) == 300
+
+def test_publish_leaves_no_temp_files(unsorted, tmp_path):
+	path = str(tmp_path / "snapshot")
+	publish(unsorted, path)
+	publish(unsorted, path)
+	assert os.listdir(tmp_path) == ["snapshot"]
+	assert oct(os.stat(path).st_mode & 0o777) == oct(0o644)
+	
+	class Broken:
+		def __iter__(self):
+			raise RuntimeError("archive went away")
+	with pytest.raises(RuntimeError):
+		publish(Broken(), path) # type: ignore
+	assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+	assert len(SharedArchive(path)) == 300
+
+def test_concurrent_publishers(unsorted, tmp_path):
+	path = str(tmp_path / "snapshot")
+	with concurrent.futures.ThreadPoolExecutor(4) as executor:
+		list(executor.map(lambda _: publish(unsorted, path), range(8)))
+	assert _threads(SharedArchive(path)) == _threads(unsorted)
+	assert os.listdir(tmp_path) == ["snapshot"]
+
+def test_columns_are_read_in_place(unsorted, shared, monkeypatch):
+	np = pytest.importorskip("numpy")
+	monkeypatch.setattr(SharedArchive, "_thread", lambda self, row: pytest.fail("thread unpickled"))
+	columns, expected = shared.to_columns(), unsorted.to_columns()
+	
+	assert list(shared.yak_ids()) == list(unsorted.yak_ids())
+	assert len(columns.yaks) == len(expected.yaks) and len(columns.comments) == len(expected.comments)
+	for table, expected_table in ((columns.yaks, expected.yaks), (columns.comments, expected.comments)):
+		views = table.to_numpy()
+		assert not any(view.flags.writeable for view in views.values())
+		for name, values in expected_table.to_numpy().items():
+			# iteration order, which the archive's own view isn't built in
+			rows = [expected_table.rows[key] for key in table.keys]
+			if name in ('user_id', 'user_color', 'secondary_user_color'):
+				pool = expected.users if name == 'user_id' else expected.colors
+				shared_pool = columns.users if name == 'user_id' else columns.colors
+				assert [shared_pool.value(code) for code in views[name]] == [pool.value(code) for code in values[rows]]
+			elif name not in ('id', 'yak'):
+				assert list(views[name]) == list(values[rows])
+	
+	yak, comments = next((yak, comments) for yak, comments in unsorted if comments)
+	row = columns.yaks.rows[yak.id]
+	assert columns.yak_ids.value(columns.yaks['id'][row]) == yak.id
+	assert columns.comments.rows[(yak.id, comments[-1].id)] == columns.comments.keys.index((yak.id, comments[-1].id))
+	assert "missing" not in columns.yaks.rows
+	assert (yak.id, "missing") not in columns.comments.rows
+	assert columns.users.get_code(yak.user_id) == columns.yaks['user_id'][row]
+	with pytest.raises(TypeError):
+		columns.yaks.upsert(yak.id, {})
@@ -0,0 +1,75 @@
+import collections
+import random
+
+import pytest
+
+import yak_data
+from sketches import CountMinSketch, HeavyHitters, HyperLogLog
+
+
+def _zipf_stream(num_keys=2000, length=50_000, seed=0):
+	rng = random.Random(seed)
+	keys = [f"user{i}" for i in range(num_keys)]
+	return rng.choices(keys, weights=[1 / rank for rank in range(1, num_keys + 1)], k=length)
+
+def test_count_min_never_undercounts():
+	stream = _zipf_stream()
+	sketch = CountMinSketch(width=1024, depth=4)
+	for key in stream:
+		sketch.add(key)
+	counts = collections.Counter(stream)
+	assert all(sketch.estimate(key) >= count for key, count in counts.items())
+	# within e/width of the total, for nearly every key
+	bound = 2.72 / 1024 * len(stream)
+	assert sum(sketch.estimate(key) - count > bound for key, count in counts.items()) < 0.05 * len(counts)
+
+def test_count_min_merge():
+	stream = _zipf_stream()
+	whole, first, second = CountMinSketch(256, 3), CountMinSketch(256, 3), CountMinSketch(256, 3)
+	for i, key in enumerate(stream):
+		whole.add(key)
+		(first if i % 2 else second).add(key)
+	first.merge(second)
+	assert first.rows == whole.rows and first.total == whole.total
+	with pytest.raises(ValueError):
+		first.merge(CountMinSketch(128, 3))
+
+def test_heavy_hitters_find_the_top_keys():
+	stream = _zipf_stream()
+	heavy_hitters = HeavyHitters(10, CountMinSketch(2048, 4))
+	for key in stream:
+		heavy_hitters.add(key)
+	top = heavy_hitters.top()
+	assert len(top) == 10
+	assert set(top) == {key for key, _ in collections.Counter(stream).most_common(10)}
+	assert list(top.values()) == sorted(top.values(), reverse=True)
+
+@pytest.mark.parametrize("num_keys", [100, 5000, 100_000])
+def test_hyperloglog(num_keys):
+	hyperloglog = HyperLogLog()
+	for i in range(num_keys):
+		hyperloglog.add(f"user{i}")
+		hyperloglog.add(f"user{i // 2}")
+	assert len(hyperloglog) == pytest.approx(num_keys, rel=0.03)
+
+def test_hyperloglog_merge():
+	first, second = HyperLogLog(10), HyperLogLog(10)
+	for i in range(3000):
+		(first if i < 2000 else second).add(f"user{i}")
+		second.add(f"user{i // 3}")
+	first.merge(second)
+	assert len(first) == pytest.approx(3000, rel=0.1)
+
+def test_top_k_is_a_prefix_of_the_full_ranking(archive):
+	full = yak_data.most_active_users(archive)
+	for top_k in (1, 5, 50):
+		assert list(yak_data.most_active_users(archive, top_k=top_k).items()) == list(full.items())[:top_k]
+	coupled = yak_data.common_coupled_users(archive, only_anonymous=False)
+	assert list(yak_data.common_coupled_users(archive, only_anonymous=False, top_k=7).items()) == list(coupled.items())[:7]
+
+def test_approximate_rankings(archive):
+	exact = yak_data.most_active_users(archive)
+	approx = yak_data.approx_most_active_users(archive, top_k=5)
+	assert set(approx) == set(list(exact)[:5])
+	assert all(count >= exact[user]['total'] for user, count in approx.items())
+	assert yak_data.approx_distinct_users(archive) == pytest.approx(len(exact), rel=0.05)
@@ -0,0 +1,113 @@
+import dataclasses
+import datetime
+import pickle
+
+import pytest
+
+from text_index import TextIndex, tokenize
+from yak_archive import YakArchive
+
+START = datetime.datetime(2022, 10, 13, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def index():
+	index = TextIndex()
+	documents = [
+		("a", "Free food in the dining hall", "alice"),
+		("b", "free pizza tonight", "bob"),
+		("c", "the food is free, no really", "alice"),
+		("d", "Pizza at the library’s front desk", "carol"),
+		("e", "nothing to see here", "bob"),
+	]
+	for hours, (doc_id, text, user_id) in enumerate(documents):
+		index.add_document(doc_id, text, START + datetime.timedelta(hours=hours), user_id)
+	return index
+
+def test_tokenize_folds_case_and_quotes():
+	assert tokenize("Don’t SHOUT, it's “fine”") == ["don't", "shout", "it's", "fine"]
+
+@pytest.mark.parametrize("query, expected", [
+	("free", ["c", "b", "a"]),
+	("free food", ["c", "a"]),
+	('"free food"', ["a"]),
+	('"food free"', []),
+	("pizza OR food", ["d", "c", "b", "a"]),
+	("free -pizza", ["c", "a"]),
+	('free -"free food"', ["c", "b"]),
+	("-free", ["e", "d"]),
+	('"free food" OR pizza -dining', ["d", "b", "a"]),
+	("library's", ["d"]),
+	("missing", []),
+])
+def test_query_grammar(index, query, expected):
+	assert index.search(query) == expected
+
+def test_filters(index):
+	assert index.search("free", user_id="alice") == ["c", "a"]
+	assert index.search("free", start_time=START + datetime.timedelta(hours=1)) == ["c", "b"]
+	assert index.search("free", end_time=START + datetime.timedelta(hours=1)) == ["b", "a"]
+	assert index.search("free", limit=1) == ["c"]
+	
+	# to the microsecond
+	index.add_document("f", "free refills", START + datetime.timedelta(hours=1, microseconds=500), "dave")
+	assert index.search("free", start_time=START + datetime.timedelta(hours=1, microseconds=1)) == ["c", "f"]
+	assert index.search("free", end_time=START + datetime.timedelta(hours=1, microseconds=499)) == ["b", "a"]
+
+def test_or_inside_quotes_is_a_word(index):
+	index.add_document("f", "salt or pepper", START, "dave")
+	assert index.search('"salt or pepper"') == ["f"]
+	assert index.search('"free OR pizza"') == []
+	assert index.search('"salt OR pepper" OR pizza') == ["d", "b", "f"]
+
+def test_updating_and_removing_documents(index):
+	index.add_document("a", "no longer about that", START, "alice")
+	assert index.search("food") == ["c"]
+	assert index.search("longer") == ["a"]
+	
+	index.remove_document("c")
+	assert index.search("food") == []
+	assert "dining" not in index.postings
+	assert len(index) == 4
+
+def test_archive_search_stays_up_to_date(archive):
+	yak = archive.archive.yaks[0]
+	word = yak.text.split()[0]
+	assert yak in archive.search(word)
+	
+	comment = next(iter(archive.archive.comments.values()))[0]
+	comment.text = "xylophone"
+	archive.add_comments(next(iter(archive.archive.comments)), [comment])
+	assert archive.search("xylophone") == [comment]
+
+def test_saved_index_misses_unsaved_changes(archive):
+	archive.search("anything")
+	archive.save()
+	
+	reopened = YakArchive(archive.path)
+	yak = dataclasses.replace(reopened.archive.yaks[0], id="new", text="xylophone")
+	# added before the index is loaded from next to the archive
+	reopened.add_yak(yak)
+	assert reopened.search("xylophone") == [yak]
+	reopened.save()
+	assert YakArchive(archive.path).search("xylophone") == [yak]
+	
+	# and an unchanged archive still uses what was saved
+	loaded = YakArchive(archive.path)
+	index = loaded._get_index('textindex', lambda: pytest.fail("index rebuilt"), persist=True)
+	assert index.search("xylophone") == ["new"]
+
+def test_outdated_saved_index_is_rebuilt(archive):
+	archive.search("anything")
+	archive.save()
+	# as pickled before created_at was kept in microseconds
+	sidecar = f"{archive.path}.textindex"
+	with open(sidecar, 'rb') as file_handle:
+		signature, index = pickle.load(file_handle)
+	index.documents = {doc_id: (created_at // 1_000_000, *rest) for doc_id, (created_at, *rest) in index.documents.items()}
+	del index.version
+	with open(sidecar, 'wb') as file_handle:
+		pickle.dump((signature, index), file_handle)
+	
+	rebuilt = YakArchive(archive.path).text_index()
+	assert rebuilt.documents == archive.text_index().documents
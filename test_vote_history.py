@@ -0,0 +1,150 @@
+import datetime
+
+import pytest
+
+import vote_history
+from vote_history import VoteHistory, load_history, save_history
+
+
+def _observations(archive, count=3):
+	"""A few made up crawls of every yak and comment, each a minute apart"""
+	samples, seen = [], set()
+	for yak, thread in archive:
+		# a few synthetic comment ids are under more than one yak
+		thread = [comment for comment in thread if comment.id not in seen]
+		seen.update(comment.id for comment in thread)
+		for i in range(count):
+			observed_at = yak.created_at + datetime.timedelta(minutes=i + 1)
+			samples.append((yak, observed_at, yak.vote_count + i * 3 - 4, yak.comment_count + i))
+			for comment in thread:
+				samples.append((comment, observed_at, comment.vote_count - i * 200, 0))
+	return samples
+
+def _history(samples):
+	history = VoteHistory()
+	for record, observed_at, vote_count, comment_count in samples:
+		history.record(record.id, not hasattr(record, 'comment_count'), record.created_at, vote_count, comment_count, observed_at)
+	return history
+
+def _expected(samples):
+	series = {}
+	for record, observed_at, vote_count, comment_count in samples:
+		series.setdefault(record.id, []).append((observed_at.replace(microsecond=0), vote_count, comment_count))
+	return series
+
+def test_series_round_trip(archive):
+	samples = _observations(archive)
+	history = _history(samples)
+	for item_id, series in _expected(samples).items():
+		assert [(time.timestamp(), votes, comments) for time, votes, comments in history.series(item_id)] == \
+			[(time.timestamp(), votes, comments) for time, votes, comments in series]
+	assert history.series("missing") == []
+
+def test_varints_are_small():
+	history = VoteHistory()
+	created_at = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+	history.record("a", False, created_at, 5, 1, created_at + datetime.timedelta(minutes=5))
+	history.record("a", False, created_at, 4, 2, created_at + datetime.timedelta(minutes=10))
+	# 300 seconds takes two bytes and each count one
+	assert len(history._series_bytes(0)) == 4 + 4
+	history.record("a", False, created_at, -(1 << 40), 2, created_at + datetime.timedelta(days=1000))
+	assert history.series("a")[-1][1:] == (-(1 << 40), 2)
+
+def test_series_share_one_buffer(archive, monkeypatch):
+	monkeypatch.setattr(vote_history, "_MIN_GARBAGE", 100)
+	samples = _observations(archive)
+	history = _history(samples[:len(samples) // 2])
+	history.decode()
+	assert sum(history.lengths) == len(history.data)
+	# adding to series in the middle of the buffer (compacting it every so
+	# often) as well as new ones
+	for record, observed_at, vote_count, comment_count in samples[len(samples) // 2:]:
+		history.record(record.id, not hasattr(record, 'comment_count'), record.created_at, vote_count, comment_count, observed_at)
+		assert history._garbage <= max(100, len(history.data) // 2) + 100
+	for item_id, series in _expected(samples).items():
+		assert [(time.timestamp(), votes, comments) for time, votes, comments in history.series(item_id)] == \
+			[(time.timestamp(), votes, comments) for time, votes, comments in series]
+	assert [list(values) for values in history.decode().values()] == [list(values) for values in _history(samples).decode().values()]
+	assert sum(history.lengths) == len(history.data)
+
+def test_loads_histories_of_bytearrays():
+	history = VoteHistory()
+	created_at = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+	for minutes in range(3):
+		for item_id in "abc":
+			history.record(item_id, False, created_at, minutes, 0, created_at + datetime.timedelta(minutes=minutes))
+	state = history.__getstate__()
+	# as pickled before series were packed into one buffer
+	state['samples'] = [bytearray(history._series_bytes(row)) for row in range(len(history))]
+	for name in ('data', 'starts', 'lengths', '_garbage', '_compacted'):
+		del state[name]
+	old = VoteHistory.__new__(VoteHistory)
+	old.__setstate__(state)
+	assert all(old.series(item_id) == history.series(item_id) for item_id in "abc")
+	old.record("b", False, created_at, 9, 0, created_at + datetime.timedelta(hours=1))
+	assert old.series("b") == history.series("b") + [(created_at + datetime.timedelta(hours=1), 9, 0)]
+
+def test_decode_matches_series(archive):
+	history = _history(_observations(archive))
+	decoded = history.decode()
+	for row, item_id in enumerate(history.ids[:50]):
+		created_at = history.created_at[row]
+		series = [(int(time.timestamp()) - created_at, votes, comments) for time, votes, comments in history.series(item_id)]
+		mask = decoded['series'] == row
+		assert list(zip(decoded['age'][mask].tolist(), decoded['votes'][mask].tolist(), decoded['comments'][mask].tolist())) == series
+
+def test_at_age(archive):
+	history = _history(_observations(archive))
+	early = history.at_age(datetime.timedelta(minutes=2, seconds=30))
+	for row, votes, age in zip(early['series'].tolist(), early['votes'].tolist(), early['observed_age'].tolist()):
+		assert not history.is_comment[row]
+		time, expected_votes, _ = history.series(history.ids[row])[1]
+		assert (votes, age) == (expected_votes, int(time.timestamp()) - history.created_at[row])
+	assert len(early['series']) == sum(1 for is_comment in history.is_comment if not is_comment)
+	assert len(history.at_age(datetime.timedelta(0))['series']) == 0
+
+def test_merge(archive):
+	samples = _observations(archive)
+	first = _history(samples[::2])
+	# some samples are in both
+	second = _history(samples[1::2] + samples[:10:2])
+	
+	merged = VoteHistory()
+	merged.merge(first)
+	merged.merge(second)
+	merged.merge(second)
+	expected = _expected(sorted(samples, key=lambda sample: sample[1]))
+	assert set(merged.ids) == set(expected)
+	for item_id, series in expected.items():
+		assert merged.series(item_id) == sorted(series, key=lambda sample: sample[0])
+	
+	some = VoteHistory()
+	some.merge(first, first.ids[:3] + ["missing"])
+	assert some.ids == first.ids[:3]
+
+def test_load_and_save(tmp_path):
+	path = str(tmp_path / "archive.yaks")
+	assert len(load_history(path)) == 0
+	history = VoteHistory()
+	created_at = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+	history.record("a", True, created_at, 1, 0, created_at)
+	history.decode()
+	save_history(path, history)
+	loaded = load_history(path)
+	assert loaded.series("a") == history.series("a")
+	assert loaded._decoded is None
+
+def test_archive_records_history(archive):
+	yak = archive.archive.yaks[0]
+	observed_at = yak.created_at + datetime.timedelta(hours=1)
+	archive.add_yak(yak, observed_at)
+	archive.add_yak(yak, observed_at + datetime.timedelta(hours=1))
+	assert [sample[1] for sample in archive.history.series(yak.id)] == [yak.vote_count] * 2
+	
+	other = VoteHistory()
+	other.add_yak(yak, yak.created_at + datetime.timedelta(minutes=1))
+	archive.add_yak(yak, history=other)
+	assert len(archive.history.series(yak.id)) == 3
+	# records without any history don't get a made up sample
+	archive.add_yak(archive.archive.yaks[1], history=other)
+	assert archive.history.series(archive.archive.yaks[1].id) == []
@@ -0,0 +1,72 @@
+import dataclasses
+import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from yak_columns import ArchiveColumns, epoch_microseconds
+
+
+def test_epoch_microseconds_is_exact():
+	time = datetime.datetime(2022, 10, 13, 12, 34, 56, 789012, tzinfo=datetime.timezone.utc)
+	assert epoch_microseconds(time) == 1665664496789012
+	assert epoch_microseconds(time + datetime.timedelta(microseconds=1)) == 1665664496789013
+
+def test_columns_match_archive(archive):
+	columns = archive.to_columns()
+	yaks = columns.yaks.to_numpy()
+	assert len(columns.yaks) == len(archive.archive.yaks)
+	for yak in archive.archive.yaks:
+		row = columns.yaks.rows[yak.id]
+		assert columns.yak_ids.value(yaks['id'][row]) == yak.id
+		assert columns.users.value(yaks['user_id'][row]) == yak.user_id
+		assert yaks['created_at'][row] == epoch_microseconds(yak.created_at)
+		assert yaks['vote_count'][row] == yak.vote_count
+	num_comments = sum(len(comments) for comments in archive.archive.comments.values())
+	assert len(columns.comments) == num_comments
+
+def test_to_numpy_doesnt_block_adding(archive, synthetic):
+	columns = archive.to_columns()
+	kept = columns.yaks.to_numpy()
+	yak, comments = next(synthetic.threads())
+	yak.id = "Yak:new"
+	archive.add_yak(yak)
+	archive.add_comments(yak.id, comments)
+	assert len(columns.yaks) == len(kept['id']) + 1
+	# more than the spare capacity, so the arrays are replaced under it
+	for i in range(5000):
+		archive.add_yak(dataclasses.replace(yak, id=f"Yak:new{i}"))
+	assert len(columns.yaks.to_numpy()['id']) == len(kept['id']) + 5001
+	assert list(kept['id']) == list(columns.yaks['id'][:len(kept['id'])])
+
+def test_to_numpy_doesnt_copy(archive):
+	columns = archive.to_columns()
+	view = columns.yaks.to_numpy()['vote_count']
+	assert np.shares_memory(view, columns.yaks.to_numpy()['vote_count'])
+	assert not view.flags.writeable
+	yak = archive.archive.yaks[0]
+	archive.add_yak(dataclasses.replace(yak, vote_count=yak.vote_count + 100))
+	assert view[columns.yaks.rows[yak.id]] == yak.vote_count + 100
+
+def test_upsert_updates_in_place(archive):
+	columns = archive.to_columns()
+	yak = archive.archive.yaks[0]
+	row = columns.yaks.rows[yak.id]
+	yak.vote_count += 100
+	archive.add_yak(yak)
+	assert columns.yaks.rows[yak.id] == row
+	assert columns.yaks.to_numpy()['vote_count'][row] == yak.vote_count
+
+def test_sorted_by_follows_new_rows(archive, synthetic):
+	columns = archive.to_columns()
+	order, values = columns.yaks.sorted_by('created_at')
+	assert list(values) == sorted(columns.yaks['created_at'])
+	assert list(values) == [columns.yaks['created_at'][row] for row in order]
+	
+	yak, _ = next(synthetic.threads())
+	yak.id = "Yak:new"
+	archive.add_yak(yak)
+	order, values = columns.yaks.sorted_by('created_at')
+	assert len(order) == len(columns.yaks)
+	assert list(values) == sorted(columns.yaks['created_at'])
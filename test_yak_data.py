@@ -0,0 +1,104 @@
+import collections
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+import yak_data
+from yak_archive import ARCHIVE_START, TIMEZONE
+
+
+@pytest.fixture
+def window(archive):
+	times = sorted(yak.created_at for yak in archive.archive.yaks)
+	return times[len(times) // 4], times[3 * len(times) // 4]
+
+def test_one_pass_matches_separate_calls(archive, window):
+	start, end = window
+	hours, activity, coupled, by_user = yak_data.aggregate(archive, [
+		yak_data.HourCounts(),
+		yak_data.UserActivityCounts(),
+		yak_data.CoupledUserCounts(),
+		yak_data.YaksByUser(),
+	], start, end)
+	assert hours == yak_data.avg_yaks_per_hour(archive, start_time=start, end_time=end)
+	assert activity == yak_data.most_active_users(archive, start, end)
+	assert coupled == yak_data.common_coupled_users(archive, start, end)
+	assert by_user == yak_data.yaks_by_user(archive, start, end)
+
+def test_most_active_users(archive, window):
+	start, end = window
+	posts, comments = collections.Counter(), collections.Counter()
+	for yak, thread in archive:
+		if start <= yak.created_at <= end:
+			if yak.user_id is None: continue
+			posts[yak.user_id] += 1
+		comments.update(comment.user_id for comment in thread if start <= comment.created_at <= end and comment.user_id is not None)
+	
+	activity = yak_data.most_active_users(archive, start, end)
+	assert {user_id: counts['posts'] for user_id, counts in activity.items() if counts['posts']} == posts
+	assert {user_id: counts['comments'] for user_id, counts in activity.items() if counts['comments']} == comments
+	totals = [counts['total'] for counts in activity.values()]
+	assert totals == sorted(totals, reverse=True)
+	assert list(yak_data.most_active_users(archive, start, end, top_k=5).items()) == list(activity.items())[:5]
+
+def test_hour_counts(archive):
+	end = max(yak.created_at for yak in archive.archive.yaks)
+	counts = yak_data.aggregate(archive, [yak_data.HourCounts()], end_time=end)[0]
+	posts = collections.Counter(yak.created_at.astimezone(TIMEZONE).hour for yak in archive.archive.yaks)
+	days = (datetime.datetime.now(TIMEZONE) - ARCHIVE_START).days
+	for hour, count in posts.items():
+		assert counts[hour]['posts'] * (days + (hour > datetime.datetime.now(TIMEZONE).hour)) == pytest.approx(count)
+
+@pytest.mark.parametrize("user", [None, "user0", "user7"])
+def test_vectorized_matches_loops(archive, window, user):
+	pytest.importorskip("numpy")
+	start, end = window
+	assert yak_data.avg_yaks_per_hour_vectorized(archive, user, start, end) == yak_data.avg_yaks_per_hour(archive, user, start, end)
+	assert yak_data.avg_yaks_per_hour_vectorized(archive, user) == yak_data.avg_yaks_per_hour(archive, user)
+	assert list(yak_data.most_active_users_vectorized(archive, start, end).items()) == list(yak_data.most_active_users(archive, start, end).items())
+
+def test_vectorized_on_an_unsorted_archive_with_odd_threads(archive):
+	pytest.importorskip("numpy")
+	yaks = archive.archive.yaks
+	yaks.reverse()
+	yaks[3].user_id = None
+	# the same comment filed under two yaks is counted under both by the loops
+	first, second = [yak.id for yak in yaks if yak.id in archive.archive.comments][:2]
+	archive.add_comments(second, archive.archive.comments[first][:1])
+	# and comments whose yak isn't in the archive aren't counted at all
+	archive.add_comments("Yak:missing", archive.archive.comments[first][1:])
+	
+	assert list(yak_data.most_active_users_vectorized(archive).items()) == list(yak_data.most_active_users(archive).items())
+	assert yak_data.avg_yaks_per_hour_vectorized(archive) == yak_data.avg_yaks_per_hour(archive)
+
+def test_word_counts_reuse_the_token_cache(archive, monkeypatch):
+	tokenized = []
+	def tokenize(texts):
+		tokenized.extend(texts)
+		return [tuple(text.lower().split()) for text in texts]
+	monkeypatch.setattr(yak_data, "tokenize", tokenize)
+	monkeypatch.setattr(yak_data, "stopwords", lambda: frozenset(["the"]))
+	
+	counts = yak_data.most_common_words(archive)
+	expected = collections.Counter(word for yak, thread in archive for text in [yak.text] + [comment.text for comment in thread] for word in text.lower().split())
+	del expected["the"]
+	assert counts == expected
+	assert len(tokenized) == len(archive.token_cache)
+	
+	# only new or edited text is tokenized again
+	tokenized.clear()
+	yak = archive.archive.yaks[0]
+	yak.text = "an edited yak"
+	archive.add_yak(yak)
+	counts = yak_data.most_common_words(archive)
+	assert tokenized == ["an edited yak"]
+	assert counts["edited"] == 1
+
+def test_import_is_headless():
+	# a fresh interpreter, since other tests may have loaded these already
+	code = "import sys, yak_data; print(sorted(name for name in ('matplotlib', 'nltk', 'numpy') if name in sys.modules))"
+	output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+	assert output.strip() == "[]"
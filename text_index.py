@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import datetime
+import re
+from typing import Optional
+
+from comment import Comment
+from yak import Yak
+from yak_columns import epoch_microseconds
+
+_TOKEN_REGEX = re.compile(r"\w+(?:'\w+)*")
+_QUERY_REGEX = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+
+def normalize_text(text: str) -> str:
+	# fold curly quotes into straight ones and lowercase everything
+	return text.replace('’', "'") \
+	.replace("“", '"') \
+	.replace("”", '"') \
+	.lower() \
+	#.replace("'", '')
+
+def tokenize(text: str) -> list[str]:
+	return _TOKEN_REGEX.findall(normalize_text(text))
+
+
+class TextIndex:
+	"""Positional inverted index over yak and comment text.
+	
+	Queries are whitespace separated terms, all of which must match; `"a
+	quoted phrase"` matches consecutive words, a leading `-` excludes a term
+	or phrase, and `OR` separates alternatives:
+		
+		index.search('"free food" OR pizza -dining')
+	"""
+	
+	# bumped whenever what's stored changes, so indexes pickled before
+	# that are rebuilt instead of loaded
+	VERSION = 2
+	
+	def __init__(self):
+		# term -> document id -> positions of the term in the document
+		self.postings = {} # type: dict[str, dict[str, tuple[int, ...]]]
+		# document id -> (created_at epoch microseconds, user id, parent yak id or None for yaks)
+		self.documents = {} # type: dict[str, tuple[int, Optional[str], Optional[str]]]
+		# document id -> its distinct terms, so documents can be removed
+		self._document_terms = {} # type: dict[str, tuple[str, ...]]
+		self.version = self.VERSION
+	
+	def __len__(self):
+		return len(self.documents)
+	
+	def add_document(self, doc_id: str, text: str, created_at: datetime.datetime, user_id: Optional[str], yak_id: Optional[str] = None):
+		if doc_id in self.documents:
+			self.remove_document(doc_id)
+		
+		positions = {} # type: dict[str, list[int]]
+		for position, term in enumerate(tokenize(text)):
+			positions.setdefault(term, []).append(position)
+		for term, term_positions in positions.items():
+			self.postings.setdefault(term, {})[doc_id] = tuple(term_positions)
+		
+		self.documents[doc_id] = (epoch_microseconds(created_at), user_id, yak_id)
+		self._document_terms[doc_id] = tuple(positions)
+	
+	def remove_document(self, doc_id: str):
+		for term in self._document_terms.pop(doc_id, ()):
+			postings = self.postings[term]
+			del postings[doc_id]
+			if not postings:
+				del self.postings[term]
+		self.documents.pop(doc_id, None)
+	
+	def add_yak(self, yak: Yak):
+		self.add_document(yak.id, yak.text, yak.created_at, yak.user_id)
+	
+	def add_comment(self, yak_id: str, comment: Comment):
+		self.add_document(comment.id, comment.text, comment.created_at, comment.user_id, yak_id)
+	
+	def _match_phrase(self, terms: list[str]) -> set[str]:
+		if not terms:
+			return set()
+		postings = [self.postings.get(term, {}) for term in terms]
+		# intersect starting from the rarest term
+		candidates = set(min(postings, key=len))
+		for term_postings in postings:
+			candidates.intersection_update(term_postings)
+			if not candidates:
+				return candidates
+		if len(terms) == 1:
+			return candidates
+		
+		matches = set()
+		for doc_id in candidates:
+			starts = set(postings[0][doc_id])
+			for offset, term_postings in enumerate(postings[1:], 1):
+				starts.intersection_update(position - offset for position in term_postings[doc_id])
+				if not starts: break
+			if starts:
+				matches.add(doc_id)
+		return matches
+	
+	@staticmethod
+	def _parse(query: str) -> list[list[tuple[bool, list[str]]]]:
+		"""The query's OR separated clauses, as (negated, terms) pairs. Quoted
+		phrases are read first, so an OR inside quotes is just a word."""
+		clauses = [[]] # type: list[list[tuple[bool, list[str]]]]
+		for negated, phrase, word in _QUERY_REGEX.findall(query):
+			if word == 'OR':
+				clauses.append([])
+				continue
+			if word.startswith('-') and len(word) > 1:
+				negated, word = '-', word[1:]
+			clauses[-1].append((bool(negated), tokenize(phrase or word)))
+		return clauses
+	
+	def _match_clause(self, clause: list[tuple[bool, list[str]]]) -> set[str]:
+		included = [] # type: list[set[str]]
+		excluded = set() # type: set[str]
+		for negated, terms in clause:
+			matches = self._match_phrase(terms)
+			if negated:
+				excluded |= matches
+			else:
+				included.append(matches)
+		
+		if not included:
+			# a purely negative clause matches everything else
+			return set(self.documents) - excluded
+		included.sort(key=len)
+		result = included[0].intersection(*included[1:])
+		return result - excluded
+	
+	def search(self, query: str,
+		user_id: Optional[str] = None,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+		limit: Optional[int] = None,
+	) -> list[str]:
+		"""Ids of the matching yaks and comments, newest first"""
+		matches = set() # type: set[str]
+		for clause in self._parse(query):
+			matches |= self._match_clause(clause)
+		
+		start = epoch_microseconds(start_time) if start_time is not None else float('-inf')
+		end = epoch_microseconds(end_time) if end_time is not None else float('inf')
+		
+		results = []
+		for doc_id in matches:
+			created_at, doc_user_id, _ = self.documents[doc_id]
+			if user_id is not None and doc_user_id != user_id: continue
+			if not start <= created_at <= end: continue
+			results.append((created_at, doc_id))
+		results.sort(reverse=True)
+		
+		return [doc_id for _, doc_id in results[:limit]]
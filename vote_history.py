@@ -0,0 +1,285 @@
+"""Every vote/comment count ever observed for each yak and comment, so
+re-fetching a yak adds to its trajectory instead of overwriting it.
+
+Each yak/comment gets a series of (time, vote_count, comment_count)
+samples, stored as zigzag varints of the difference from the previous
+sample (the first sample is relative to `created_at` and zero counts), so a
+typical re-observation takes 3-5 bytes. Every series lives in one shared
+buffer, found through an index of where it starts and how long it is,
+rather than being an object of its own: a series that's added to is moved
+to the end of the buffer (if it isn't there already), and the space it
+leaves is reclaimed once it's half the buffer. Decoding everything at once
+for vectorized queries needs numpy.
+"""
+from __future__ import annotations
+
+from array import array
+import datetime
+import os
+import pickle
+from typing import TYPE_CHECKING, Iterable, Literal, Optional
+
+from comment import Comment
+from yak import Yak
+from yak_columns import epoch_microseconds
+
+if TYPE_CHECKING:
+	import numpy
+
+_SECOND = 1_000_000 # microseconds
+# bytes of moved series the buffer can hold before it's compacted, if
+# they're less than half of it
+_MIN_GARBAGE = 1 << 16
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _write_varint(buffer: bytearray, value: int):
+	value = (value << 1) ^ (value >> 63) # zigzag, so small negatives stay small
+	while value > 0x7f:
+		buffer.append(value & 0x7f | 0x80)
+		value >>= 7
+	buffer.append(value)
+
+def _read_varints(buffer: bytes) -> list[int]:
+	values, value, shift = [], 0, 0
+	for byte in buffer:
+		value |= (byte & 0x7f) << shift
+		shift += 7
+		if not byte & 0x80:
+			values.append((value >> 1) ^ -(value & 1))
+			value, shift = 0, 0
+	return values
+
+
+class VoteHistory:
+	"""Append-only vote and comment count samples, one series per yak or
+	comment id, with times kept to the second"""
+	
+	def __init__(self):
+		self.ids = [] # type: list[str]
+		self.rows = {} # type: dict[str, int]
+		self.is_comment = array('b')
+		self.created_at = array('q') # epoch seconds
+		self.num_samples = array('q')
+		# the latest sample of each series, which the next one is encoded
+		# relative to
+		self.last_time = array('q')
+		self.last_votes = array('q')
+		self.last_comments = array('q')
+		# every series' samples: series i is data[starts[i]:starts[i]+lengths[i]]
+		self.data = bytearray()
+		self.starts = array('q')
+		self.lengths = array('q')
+		# bytes of data no series uses any more, and whether the series are
+		# back to back in row order (as decode() needs them)
+		self._garbage = 0
+		self._compacted = True
+		
+		self._decoded = None # type: Optional[dict[str, numpy.ndarray]]
+	
+	def __len__(self):
+		return len(self.ids)
+	
+	def __getstate__(self):
+		self._compact()
+		return {**self.__dict__, '_decoded': None}
+	
+	def __setstate__(self, state):
+		samples = state.pop('samples', None)
+		self.__dict__.update(state)
+		if samples is not None:
+			# saved when every series was a bytearray of its own
+			self.data = bytearray(b''.join(samples))
+			self.starts, self.lengths = array('q'), array('q')
+			for buffer in samples:
+				self.starts.append(self.starts[-1] + self.lengths[-1] if self.starts else 0)
+				self.lengths.append(len(buffer))
+			self._garbage, self._compacted = 0, True
+	
+	def _series_bytes(self, row: int) -> bytearray:
+		return self.data[self.starts[row]:self.starts[row] + self.lengths[row]]
+	
+	def _compact(self):
+		"""Rewrite the buffer with every series back to back in row order"""
+		if self._compacted:
+			return
+		data = bytearray()
+		for row in range(len(self.ids)):
+			series = self._series_bytes(row)
+			self.starts[row] = len(data)
+			data += series
+		self.data, self._garbage, self._compacted = data, 0, True
+	
+	def record(self, item_id: str, is_comment: bool, created_at: datetime.datetime, vote_count: int, comment_count: int, observed_at: datetime.datetime):
+		row = self.rows.get(item_id)
+		if row is None:
+			row = self.rows[item_id] = len(self.ids)
+			self.ids.append(item_id)
+			self.is_comment.append(is_comment)
+			self.created_at.append(epoch_microseconds(created_at) // _SECOND)
+			self.num_samples.append(0)
+			self.last_time.append(self.created_at[row])
+			self.last_votes.append(0)
+			self.last_comments.append(0)
+			self.starts.append(len(self.data))
+			self.lengths.append(0)
+		
+		self._move_to_end(row)
+		time = epoch_microseconds(observed_at) // _SECOND
+		_write_varint(self.data, time - self.last_time[row])
+		_write_varint(self.data, vote_count - self.last_votes[row])
+		_write_varint(self.data, comment_count - self.last_comments[row])
+		self.lengths[row] = len(self.data) - self.starts[row]
+		self.last_time[row], self.last_votes[row], self.last_comments[row] = time, vote_count, comment_count
+		self.num_samples[row] += 1
+		self._decoded = None
+	
+	def _move_to_end(self, row: int):
+		"""Make `row`'s series the last thing in the buffer, so it can grow"""
+		start, length = self.starts[row], self.lengths[row]
+		if start + length == len(self.data):
+			return
+		if self._garbage > max(_MIN_GARBAGE, len(self.data) // 2):
+			self._compact()
+			start = self.starts[row]
+		self.data += self.data[start:start + length]
+		self.starts[row] = len(self.data) - length
+		self._garbage += length
+		self._compacted = False
+	
+	def merge(self, other: VoteHistory, ids: Optional[Iterable[str]] = None):
+		"""Add the samples `other` has for `ids` (default all of them) to this
+		history. Series in both are interleaved by observation time, with
+		samples that are in both only kept once, so merging the same history
+		twice changes nothing."""
+		for item_id in (other.ids if ids is None else ids):
+			other_row = other.rows.get(item_id)
+			if other_row is None:
+				continue
+			
+			row = self.rows.get(item_id)
+			if row is None:
+				# a new series is encoded the same way in both, so its bytes
+				# can be copied as they are
+				self.rows[item_id] = len(self.ids)
+				self.ids.append(item_id)
+				self.is_comment.append(other.is_comment[other_row])
+				self.created_at.append(other.created_at[other_row])
+				self.num_samples.append(other.num_samples[other_row])
+				self.last_time.append(other.last_time[other_row])
+				self.last_votes.append(other.last_votes[other_row])
+				self.last_comments.append(other.last_comments[other_row])
+				self.starts.append(len(self.data))
+				self.data += other._series_bytes(other_row)
+				self.lengths.append(len(self.data) - self.starts[-1])
+				self._decoded = None
+				continue
+			
+			samples = self.series(item_id)
+			seen = set(samples)
+			new_samples = [sample for sample in other.series(item_id) if sample not in seen]
+			if not new_samples:
+				continue
+			
+			# re-encode the whole series in time order
+			self.num_samples[row] = 0
+			self.last_time[row], self.last_votes[row], self.last_comments[row] = self.created_at[row], 0, 0
+			self._garbage += self.lengths[row]
+			self.lengths[row] = 0
+			self._compacted = False
+			created_at = _EPOCH + datetime.timedelta(seconds=self.created_at[row])
+			for observed_at, vote_count, comment_count in sorted(samples + new_samples, key=lambda sample: sample[0]):
+				self.record(item_id, bool(self.is_comment[row]), created_at, vote_count, comment_count, observed_at)
+	
+	def add_yak(self, yak: Yak, observed_at: Optional[datetime.datetime] = None):
+		self.record(yak.id, False, yak.created_at, yak.vote_count, yak.comment_count, observed_at or datetime.datetime.now(datetime.timezone.utc))
+	
+	def add_comment(self, comment: Comment, observed_at: Optional[datetime.datetime] = None):
+		self.record(comment.id, True, comment.created_at, comment.vote_count, 0, observed_at or datetime.datetime.now(datetime.timezone.utc))
+	
+	def series(self, item_id: str) -> list[tuple[datetime.datetime, int, int]]:
+		"""(observed at, vote count, comment count) for every time `item_id`
+		was seen, in the order they were recorded"""
+		row = self.rows.get(item_id)
+		if row is None:
+			return []
+		
+		time, votes, comments = self.created_at[row], 0, 0
+		deltas = _read_varints(self._series_bytes(row))
+		result = []
+		for i in range(0, len(deltas), 3):
+			time += deltas[i]
+			votes += deltas[i + 1]
+			comments += deltas[i + 2]
+			result.append((_EPOCH + datetime.timedelta(seconds=time), votes, comments))
+		return result
+	
+	def decode(self) -> dict[str, numpy.ndarray]:
+		"""Every sample as flat numpy columns: `series` (row in `ids`), `age`
+		(seconds since created_at), `votes` and `comments`, grouped by
+		series in recording order. Cached until the next sample."""
+		if self._decoded is not None:
+			return self._decoded
+		import numpy as np
+		
+		self._compact()
+		data = np.frombuffer(self.data, dtype=np.uint8)
+		# varints end at bytes without the continuation bit; OR together
+		# each one's 7 bit groups
+		is_last = (data & 0x80) == 0
+		starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+		shift = (np.arange(len(data)) - np.repeat(starts, np.diff(np.append(starts, len(data))))) * 7
+		values = np.bitwise_or.reduceat((data & 0x7f).astype(np.uint64) << shift.astype(np.uint64), starts) if len(data) else np.zeros(0, dtype=np.uint64)
+		deltas = ((values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)).reshape(-1, 3)
+		
+		# running sums within each series (the first delta of each series
+		# is relative to created_at / zero)
+		counts = np.frombuffer(self.num_samples, dtype=np.int64).copy()
+		series = np.repeat(np.arange(len(counts)), counts)
+		totals = np.cumsum(deltas, axis=0)
+		first = np.cumsum(counts) - counts
+		offsets = (totals[first] - deltas[first])[counts > 0]
+		totals -= np.repeat(offsets, counts[counts > 0], axis=0)
+		
+		self._decoded = {'series': series, 'age': totals[:, 0], 'votes': totals[:, 1], 'comments': totals[:, 2]}
+		return self._decoded
+	
+	def at_age(self, age: datetime.timedelta, kind: Literal["yak", "comment", None] = "yak") -> dict[str, numpy.ndarray]:
+		"""The counts each yak (or comment) had `age` after it was posted,
+		taken from its last sample at or before that age.
+		
+		Returns numpy columns `series` (rows in `ids`), `votes`, `comments`
+		and `observed_age` for just the series sampled that early."""
+		import numpy as np
+		
+		decoded = self.decode()
+		mask = decoded['age'] <= age // datetime.timedelta(seconds=1)
+		if kind is not None:
+			is_comment = np.frombuffer(self.is_comment, dtype=np.int8)
+			mask &= is_comment[decoded['series']] == (kind == "comment")
+		
+		# the last qualifying sample of each series
+		sample = np.flatnonzero(mask)
+		last = np.full(len(self.ids), -1, dtype=np.int64)
+		np.maximum.at(last, decoded['series'][sample], sample)
+		series = np.flatnonzero(last >= 0)
+		last = last[series]
+		return {
+			'series': series,
+			'votes': decoded['votes'][last],
+			'comments': decoded['comments'][last],
+			'observed_age': decoded['age'][last],
+		}
+
+
+def load_history(archive_path: str) -> VoteHistory:
+	"""The history saved next to an archive (empty if there isn't one)"""
+	if os.path.exists(f"{archive_path}.history"):
+		with open(f"{archive_path}.history", 'rb') as file_handle:
+			return pickle.load(file_handle)
+	return VoteHistory()
+
+def save_history(archive_path: str, history: VoteHistory) -> None:
+	with open(f"{archive_path}.history.tmp", 'wb') as file_handle:
+		pickle.dump(history, file_handle, pickle.HIGHEST_PROTOCOL)
+	os.replace(f"{archive_path}.history.tmp", f"{archive_path}.history")
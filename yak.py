@@ -1,9 +1,11 @@
 import datetime
 from dataclasses import dataclass
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 
+from interning import get_field_state, intern_optional, set_field_state, shared_tuple
 
-@dataclass
+
+@dataclass(slots=True)
 class Yak:
 	id: str
 	
@@ -22,7 +24,7 @@ class Yak:
 	
 	distance: int
 	geohash: Optional[str]
-	interest_areas: list[str]
+	interest_areas: tuple[str, ...]
 	
 	created_at: datetime.datetime
 	
@@ -46,24 +48,39 @@ class Yak:
 			video_playback_hls_url=yak_json["videoPlaybackHlsUrl"] or None,
 			video_download_mp4_url=yak_json["videoDownloadMp4Url"] or None,
 			video_thumbnail_url=yak_json["videoThumbnailUrl"] or None,
-			video_state=yak_json["videoState"],
+			video_state=intern_optional(yak_json["videoState"]), # type: ignore
 			text=yak_json["text"],
-			user_emoji=yak_json["userEmoji"] or None,
-			user_color=yak_json["userColor"] or None,
-			secondary_user_color=yak_json["secondaryUserColor"] or None,
+			user_emoji=intern_optional(yak_json["userEmoji"] or None),
+			user_color=intern_optional(yak_json["userColor"] or None), # type: ignore
+			secondary_user_color=intern_optional(yak_json["secondaryUserColor"] or None),
 			distance=yak_json["distance"],
 			geohash=yak_json["geohash"] or None,
-			interest_areas=yak_json["interestAreas"],
+			interest_areas=shared_tuple(yak_json["interestAreas"] or ()),
 			created_at=datetime.datetime.fromisoformat(yak_json["createdAt"]),
 			comment_count=yak_json["commentCount"],
 			vote_count=yak_json["voteCount"],
 			is_incognito=yak_json["isIncognito"],
 			is_mine=yak_json["isMine"],
 			is_reported=yak_json["isReported"],
-			my_vote=yak_json["myVote"],
+			my_vote=intern_optional(yak_json["myVote"]), # type: ignore
 			user_id=yak_json.get("userId"),
 		)
 	
+	def __getstate__(self) -> dict[str, Any]:
+		return get_field_state(self)
+	
+	def __setstate__(self, state) -> None:
+		set_field_state(self, state)
+		
+		# archives pickled before Yak was slotted have plain strings and lists,
+		# so compact them on the way in
+		self.video_state = intern_optional(self.video_state) # type: ignore
+		self.user_emoji = intern_optional(self.user_emoji)
+		self.user_color = intern_optional(self.user_color) # type: ignore
+		self.secondary_user_color = intern_optional(self.secondary_user_color)
+		self.interest_areas = shared_tuple(self.interest_areas or ())
+		self.my_vote = intern_optional(self.my_vote) # type: ignore
+	
 	def __hash__(self) -> int:
 		return hash(self.id)
 	
@@ -75,4 +92,5 @@ class Yak:
 	def __format__(self, format_spec: str) -> str:
 		if format_spec == "s":
 			return self.text
-		return super().__format__(format_spec)
\ No newline at end of file
+		# NOTE: zero-argument super() doesn't work in slotted dataclasses
+		return object.__format__(self, format_spec)
\ No newline at end of file
@@ -1,12 +1,34 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+import datetime
 import os
 import pickle
-from typing import Generator, Iterable, Optional
+from typing import TYPE_CHECKING, Callable, Generator, Iterable, Iterator, Literal, Optional, Protocol, TypeVar
 
+from archive_aggregates import ArchiveAggregates
+from archive_format import load_archive, save_archive
 from comment import Comment
+from emoji_counts import EmojiCounts
+from interaction_graph import InteractionGraph
+from lazy_records import LazyComment, LazyYak
+from near_duplicates import NearDuplicateIndex
+from text_index import TextIndex
+from vote_history import VoteHistory, load_history, save_history
 from yak import Yak
+from yak_columns import ArchiveColumns
+
+if TYPE_CHECKING:
+	from archive_query import Query
+	
+	class ArchiveIndex(Protocol):
+		def add_yak(self, yak: Yak, /) -> object: ...
+		def add_comment(self, yak_id: str, comment: Comment, /) -> object: ...
+	
+	_Index = TypeVar("_Index", bound=ArchiveIndex)
+
+TIMEZONE = datetime.timezone(datetime.timedelta(0,-4*3600))
+ARCHIVE_START = datetime.datetime(2022, 10, 13, 0, 0, 0, tzinfo=TIMEZONE)
 
 @dataclass
 class Archive:
@@ -14,12 +36,22 @@ class Archive:
 	comments: dict[str, list[Comment]]
 
 class YakArchive:
-	def __init__(self, path: str):
+	def __init__(self, path: str, archive: Optional[Archive] = None):
 		self.path = path
 		
-		if os.path.exists(self.path):
-			with open(self.path, 'rb+') as file_handle:
-				self.archive = pickle.load(file_handle)
+		# changes since the archive was last loaded from or saved to path; a
+		# saved index only matches the archive while this is 0
+		self._unsaved_changes = 0
+		
+		if archive is not None:
+			# already loaded elsewhere (e.g. in a worker process), and may
+			# not match what's at path
+			self.archive = archive
+			self._unsaved_changes = 1
+		elif os.path.exists(self.path):
+			# old bare-pickle archives load fine too, and get rewritten in
+			# the current format on the next save
+			self.archive = load_archive(self.path) # type: Archive
 		else:
 			# print("Archive not found, creating new archive")
 			self.archive = Archive([], {})
@@ -28,13 +60,38 @@ class YakArchive:
 		
 		# O(1) lookup for yaks by id
 		self.yak_hash = {yak.id: yak for yak in self.archive.yaks}
+		
+		# where each yak/comment sits in its list, so updates don't need a
+		# linear search (built lazily, and reset when save() reorders yaks)
+		self._yak_positions = None # type: Optional[dict[str, int]]
+		self._comment_positions = {} # type: dict[str, dict[str, int]]
+		
+		# derived indexes (columns, text search, ...), each built on first use
+		# and kept up to date by add_yak/add_comments after that. the ones in
+		# _persisted_indexes are saved next to the archive too
+		self._indexes = {} # type: dict[str, ArchiveIndex]
+		self._persisted_indexes = set() # type: set[str]
+		
+		# tokenized text by yak/comment id for yak_data.most_common_words
+		self.token_cache = {} # type: dict[str, tuple[str, tuple[str, ...]]]
+		# every vote/comment count observed, which (unlike the indexes)
+		# can't be rebuilt from the archive, so it's always kept and saved
+		self.history = load_history(self.path)
 	
 	def save(self):
 		self.archive.yaks.sort(key=lambda yak: yak.created_at, reverse=True)
+		self._yak_positions = None
+		
+		save_archive(self.path, self.archive)
+		self._unsaved_changes = 0
 		
-		with open(self.path, 'wb+') as file_handle:
-			pickle.dump(self.archive, file_handle)
-			file_handle.flush()
+		save_history(self.path, self.history)
+		
+		signature = self._signature()
+		for name in self._persisted_indexes:
+			with open(f"{self.path}.{name}.tmp", 'wb') as file_handle:
+				pickle.dump((signature, self._indexes[name]), file_handle, pickle.HIGHEST_PROTOCOL)
+			os.replace(f"{self.path}.{name}.tmp", f"{self.path}.{name}")
 		
 		print(f"Archive saved (length {len(self.archive.yaks)})")
 	
@@ -45,23 +102,152 @@ class YakArchive:
 		self.save()
 		return False
 	
-	def add_yak(self, yak: Yak):
-		if yak not in self.archive.yaks:
+	def add_yak(self, yak: Yak, observed_at: Optional[datetime.datetime] = None, history: Optional[VoteHistory] = None):
+		"""Add or update a yak; `observed_at` (default now) is when its vote
+		and comment counts were fetched. A yak copied from another archive
+		passes that archive's `history` instead, and keeps the samples it
+		has there rather than getting a new one."""
+		if isinstance(yak, LazyYak):
+			yak = yak.materialize()
+		if yak.id not in self.yak_hash:
 			# this isnt in chronological order, but since we sort the yaks by 
 			# date when we close the archive, it doesnt matter
 			self.archive.yaks.append(yak)
-			self.yak_hash[yak.id] = yak
+			if self._yak_positions is not None:
+				self._yak_positions[yak.id] = len(self.archive.yaks) - 1
 		else:
 			# update the yak if it already exists
-			self.yak_hash[yak.id] = yak
-			self.archive.yaks[self.archive.yaks.index(yak)] = yak
+			if self._yak_positions is None:
+				self._yak_positions = {yak.id: i for i, yak in enumerate(self.archive.yaks)}
+			self.archive.yaks[self._yak_positions[yak.id]] = yak
+		self.yak_hash[yak.id] = yak
+		self._unsaved_changes += 1
+		if history is not None:
+			self.history.merge(history, [yak.id])
+		else:
+			self.history.add_yak(yak, observed_at)
+		
+		for index in self._indexes.values():
+			index.add_yak(yak)
 	
-	def add_comments(self, yak_id: str, comments: Iterable[Comment]):
+	def add_comments(self, yak_id: str, comments: Iterable[Comment], observed_at: Optional[datetime.datetime] = None, history: Optional[VoteHistory] = None):
+		"""Add or update comments on a yak (which doesn't have to be in the
+		archive yet), like `add_yak`"""
+		thread = self.archive.comments.get(yak_id, [])
+		positions = self._comment_positions.get(yak_id)
+		if positions is None:
+			positions = self._comment_positions[yak_id] = {comment.id: i for i, comment in enumerate(thread)}
+		
 		for comment in comments:
-			if comment not in self.archive.comments.get(yak_id, []):
-				self.archive.comments.setdefault(yak_id, []).append(comment)
+			if isinstance(comment, LazyComment):
+				comment = comment.materialize()
+			if comment.id not in positions:
+				positions[comment.id] = len(thread)
+				thread.append(comment)
+			else:
+				thread[positions[comment.id]] = comment
+			self._unsaved_changes += 1
+			if history is not None:
+				self.history.merge(history, [comment.id])
+			else:
+				self.history.add_comment(comment, observed_at)
+			
+			for index in self._indexes.values():
+				index.add_comment(yak_id, comment)
+		
+		if thread and yak_id not in self.archive.comments:
+			self.archive.comments[yak_id] = thread
+	
+	def _signature(self) -> tuple[int, int]:
+		stat = os.stat(self.path)
+		return stat.st_size, stat.st_mtime_ns
+	
+	def _get_index(self, name: str, factory: Callable[[], _Index], persist: bool = False) -> _Index:
+		if name in self._indexes:
+			return self._indexes[name] # type: ignore
+		
+		# an index saved alongside the archive is only good if the archive
+		# hasn't been written since, or changed in memory since it was loaded,
+		# and the index was saved in its current VERSION (if it has one)
+		sidecar_path = f"{self.path}.{name}"
+		if persist and not self._unsaved_changes and os.path.exists(sidecar_path) and os.path.exists(self.path):
+			with open(sidecar_path, 'rb') as file_handle:
+				signature, saved_index = pickle.load(file_handle)
+			if signature == self._signature() and getattr(saved_index, 'version', None) == getattr(saved_index, 'VERSION', None):
+				self._persisted_indexes.add(name)
+				self._indexes[name] = saved_index
+				return saved_index
+		
+		index = factory()
+		for yak in self.archive.yaks:
+			index.add_yak(yak)
+		for yak_id, comments in self.archive.comments.items():
+			for comment in comments:
+				index.add_comment(yak_id, comment)
+		
+		self._indexes[name] = index
+		if persist:
+			self._persisted_indexes.add(name)
+		return index
+	
+	def to_columns(self) -> ArchiveColumns:
+		return self._get_index('columns', ArchiveColumns)
+	
+	def text_index(self) -> TextIndex:
+		return self._get_index('textindex', TextIndex, persist=True)
+	
+	def aggregates(self) -> ArchiveAggregates:
+		return self._get_index('aggregates', ArchiveAggregates, persist=True)
+	
+	def interaction_graph(self) -> InteractionGraph:
+		return self._get_index('graph', InteractionGraph)
+	
+	def emoji_counts(self) -> EmojiCounts:
+		return self._get_index('emojis', EmojiCounts)
+	
+	def near_duplicates(self) -> NearDuplicateIndex:
+		return self._get_index('minhash', NearDuplicateIndex, persist=True)
+	
+	def export(self, directory: str, format: Literal["ndjson", "parquet"] = "ndjson", **options) -> dict[str, int]:
+		"""Write the archive out as NDJSON or Parquet tables of yaks and
+		comments (see `archive_export.export` for filters and partitioning)"""
+		# NOTE: archive_export imports this module, so it can't be imported
+		#       at the top
+		from archive_export import export
+		return export([(self.archive.yaks, self.archive.comments)], directory, format, **options)
+	
+	def search(self, query: str,
+		user_id: Optional[str] = None,
+		start_time: Optional[datetime.datetime] = None,
+		end_time: Optional[datetime.datetime] = None,
+		limit: Optional[int] = None,
+	) -> list[Yak | Comment]:
+		"""Full text search over yaks and comments (see `TextIndex` for the
+		query syntax), newest first"""
+		index = self.text_index()
+		
+		results = [] # type: list[Yak | Comment]
+		for doc_id in index.search(query, user_id, start_time, end_time, limit):
+			yak_id = index.documents[doc_id][2]
+			if yak_id is None:
+				results.append(self.yak_hash[doc_id])
 			else:
-				self.archive.comments[yak_id][self.archive.comments[yak_id].index(comment)] = comment
+				results.append(self.get_comment(yak_id, doc_id))
+		return results
+	
+	def get_comment(self, yak_id: str, comment_id: str) -> Comment:
+		thread = self.archive.comments[yak_id]
+		positions = self._comment_positions.get(yak_id)
+		if positions is None:
+			positions = self._comment_positions[yak_id] = {comment.id: i for i, comment in enumerate(thread)}
+		return thread[positions[comment_id]]
+	
+	def query(self) -> Query:
+		"""A query over every yak (see `archive_query.Query`)"""
+		# NOTE: archive_query imports this module, so it can't be imported
+		#       at the top
+		from archive_query import Query
+		return Query(self)
 	
 	def __iter__(self):
 		return self.get_yaks()
@@ -73,6 +259,10 @@ class YakArchive:
 		for yak in reversed(self.archive.yaks):
 			yield yak, self.archive.comments.get(yak.id, [])
 	
+	def yak_ids(self) -> Iterator[str]:
+		"""Every yak's id, in iteration order"""
+		return (yak.id for yak in self.archive.yaks)
+	
 	def get_yaks(self) -> Generator[tuple[Yak, list[Comment]], None, None]:
 		for yak in self.archive.yaks:
 			yield yak, self.archive.comments.get(yak.id, [])
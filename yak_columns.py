@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from array import array
+import datetime
+from typing import TYPE_CHECKING, Hashable, Iterable, Optional
+
+from comment import Comment
+from yak import Yak
+
+if TYPE_CHECKING:
+	import numpy
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def epoch_microseconds(time: datetime.datetime) -> int:
+	# exact, unlike int(time.timestamp() * 1e6)
+	return (time - _EPOCH) // _MICROSECOND
+
+
+class StringPool:
+	"""Dictionary encoding for repeated strings (user ids, colors, ...).
+	
+	`None` is always encoded as -1."""
+	
+	def __init__(self):
+		self.values = [] # type: list[str]
+		self.codes = {} # type: dict[str, int]
+	
+	def __len__(self):
+		return len(self.values)
+	
+	def code(self, value: Optional[str]) -> int:
+		if value is None:
+			return -1
+		code = self.codes.get(value)
+		if code is None:
+			code = self.codes[value] = len(self.values)
+			self.values.append(value)
+		return code
+	
+	def get_code(self, value: Optional[str]) -> Optional[int]:
+		"""Like `code`, but doesn't add unknown values to the pool"""
+		if value is None:
+			return -1
+		return self.codes.get(value)
+	
+	def value(self, code: int) -> Optional[str]:
+		return self.values[code] if code >= 0 else None
+
+
+class ColumnTable:
+	"""Fixed-width typed columns (one `array.array` each) with one row per record.
+	
+	Rows are appended in insertion order and updated in place, so a row index
+	stays valid for the lifetime of the table. The arrays are allocated with
+	spare capacity and replaced by bigger ones when they fill up, rather than
+	resized, so views of them (see `to_numpy`) never stop later upserts."""
+	
+	def __init__(self, typecodes: dict[str, str]):
+		# each holds _capacity values, of which the first len(self) are rows
+		self.columns = {name: array(typecode) for name, typecode in typecodes.items()}
+		self._capacity = 0
+		self.rows = {} # type: dict[Hashable, int]
+		# and the other way around, row -> record id
+		self.keys = [] # type: list[Hashable]
+		# column name -> (number of rows, row order, sorted values)
+		self._sorted = {} # type: dict[str, tuple[int, numpy.ndarray, numpy.ndarray]]
+	
+	def __len__(self):
+		return len(self.rows)
+	
+	def __getitem__(self, name: str) -> memoryview:
+		return memoryview(self.columns[name])[:len(self)]
+	
+	def _grow(self):
+		self._capacity = max(1024, 2 * self._capacity)
+		for name, column in self.columns.items():
+			grown = array(column.typecode, bytes(self._capacity * column.itemsize))
+			grown[:len(column)] = column
+			self.columns[name] = grown
+	
+	def upsert(self, record_id: Hashable, values: dict[str, int]) -> int:
+		row = self.rows.get(record_id)
+		if row is None:
+			row = len(self.rows)
+			if row == self._capacity:
+				self._grow()
+			self.rows[record_id] = row
+			self.keys.append(record_id)
+		for name, column in self.columns.items():
+			column[row] = values[name]
+		return row
+	
+	def sorted_by(self, name: str) -> tuple[numpy.ndarray, numpy.ndarray]:
+		"""(row order, sorted values) of a column, for binary searching it.
+		
+		Cached until more rows are added, so it's only for columns whose
+		values never change once a row exists (like created_at and user_id)."""
+		cached = self._sorted.get(name)
+		if cached is None or cached[0] != len(self):
+			import numpy
+			values = self.to_numpy()[name]
+			order = numpy.argsort(values, kind='stable')
+			cached = self._sorted[name] = (len(self), order, values[order])
+		return cached[1], cached[2]
+	
+	def to_numpy(self) -> dict[str, numpy.ndarray]:
+		"""A read-only numpy view of every column, without copying.
+		
+		A view sees later updates to the rows it has, but not rows added
+		after it was made (and once the table outgrows its arrays, not
+		updates either), so get a new one rather than keeping it around."""
+		import numpy
+		views = {}
+		for name, column in self.columns.items():
+			view = views[name] = numpy.frombuffer(column, dtype=column.typecode, count=len(self))
+			view.flags.writeable = False
+		return views
+
+
+class ArchiveColumns:
+	"""A columnar view of a `YakArchive`.
+	
+	Strings are dictionary encoded: `user_id`, `user_color` and
+	`secondary_user_color` hold codes into `users` and `colors`, and a
+	yak's `id` / a comment's parent `yak` hold codes into `yak_ids`.
+	Comment rows are keyed by (yak id, comment id), because the same comment
+	id can be filed under more than one yak, and iterating the archive sees
+	each copy.
+	`created_at` is in epoch microseconds, so comparing it against
+	`epoch_microseconds(some_datetime)` gives exactly the same answer as
+	comparing the datetimes."""
+	
+	YAK_COLUMNS = {
+		'id': 'i',
+		'user_id': 'i',
+		'created_at': 'q',
+		'vote_count': 'q',
+		'comment_count': 'q',
+		'is_incognito': 'b',
+		'user_color': 'i',
+		'secondary_user_color': 'i',
+	}
+	COMMENT_COLUMNS = {
+		'yak': 'i',
+		'user_id': 'i',
+		'created_at': 'q',
+		'vote_count': 'q',
+		'user_color': 'i',
+		'secondary_user_color': 'i',
+	}
+	
+	def __init__(self):
+		self.users = StringPool()
+		self.colors = StringPool()
+		self.yak_ids = StringPool()
+		
+		self.yaks = ColumnTable(self.YAK_COLUMNS)
+		self.comments = ColumnTable(self.COMMENT_COLUMNS)
+		# (number of yak ids, number of yaks, yak row of each yak id code)
+		self._yak_rows = None # type: Optional[tuple[int, int, numpy.ndarray]]
+	
+	def yak_rows(self) -> numpy.ndarray:
+		"""The yak row of each code in `yak_ids`, or -1 for ids only seen as
+		a comment's parent (cached until more yaks or ids are added)"""
+		cached = self._yak_rows
+		if cached is None or cached[:2] != (len(self.yak_ids), len(self.yaks)):
+			import numpy
+			rows = numpy.full(len(self.yak_ids), -1, dtype=numpy.int64)
+			rows[self.yaks.to_numpy()['id']] = numpy.arange(len(self.yaks))
+			cached = self._yak_rows = (len(self.yak_ids), len(self.yaks), rows)
+		return cached[2]
+	
+	def add_yak(self, yak: Yak) -> int:
+		return self.yaks.upsert(yak.id, {
+			'id': self.yak_ids.code(yak.id),
+			'user_id': self.users.code(yak.user_id),
+			'created_at': epoch_microseconds(yak.created_at),
+			'vote_count': yak.vote_count,
+			'comment_count': yak.comment_count,
+			'is_incognito': yak.is_incognito,
+			'user_color': self.colors.code(yak.user_color),
+			'secondary_user_color': self.colors.code(yak.secondary_user_color),
+		})
+	
+	def add_comment(self, yak_id: str, comment: Comment) -> int:
+		return self.comments.upsert((yak_id, comment.id), {
+			'yak': self.yak_ids.code(yak_id),
+			'user_id': self.users.code(comment.user_id),
+			'created_at': epoch_microseconds(comment.created_at),
+			'vote_count': comment.vote_count,
+			'user_color': self.colors.code(comment.user_color),
+			'secondary_user_color': self.colors.code(comment.secondary_user_color),
+		})
+	
+	def add_comments(self, yak_id: str, comments: Iterable[Comment]):
+		for comment in comments:
+			self.add_comment(yak_id, comment)
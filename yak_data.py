@@ -1,19 +1,28 @@
 from __future__ import annotations
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import datetime
 from functools import cache
-from typing import TYPE_CHECKING, Callable, Optional, Protocol, TypeAlias, TypeVar, TypedDict
+import heapq
+from typing import TYPE_CHECKING, Any, Callable, Optional, Protocol, Sequence, TypeAlias, TypeVar, TypedDict
 
-import matplotlib.pyplot as plt
 from comment import Comment
+from emoji_counts import Look
 from yak import Yak
 
-from yak_archive import YakArchive
-from yak_archive import Archive # type: ignore (for pickle purposes)
+from yak_archive import TIMEZONE, YakArchive
+from yak_archive import ARCHIVE_START as _ARCHIVE_START
+from text_index import normalize_text
+from yak_columns import ArchiveColumns, epoch_microseconds
+from sketches import CountMinSketch, HeavyHitters, HyperLogLog
 
-import nltk
+# NOTE: matplotlib and nltk are slow to import and only needed for graphs
+#       and word counts, so they're imported where they're used
 
 
 if TYPE_CHECKING:
+	import numpy
+	
 	class TotalYakData(TypedDict):
 		posts: int | float
 		comments: int | float
@@ -26,49 +35,55 @@ if TYPE_CHECKING:
 		post_upvotes: int
 		comment_upvotes: int
 		total_upvotes: int
-
+	
 	_T_contra = TypeVar("_T_contra", contravariant=True)
 	class SupportsDunderLT(Protocol[_T_contra]):
 		def __lt__(self, __other: _T_contra) -> bool: ...
 	class SupportsDunderGT(Protocol[_T_contra]):
 		def __gt__(self, __other: _T_contra) -> bool: ...
 	SupportsRichComparison: TypeAlias = SupportsDunderGT | SupportsDunderLT
+	
+	_K = TypeVar("_K")
+	_V = TypeVar("_V")
 
 
-TIMEZONE = datetime.timezone(datetime.timedelta(0,-4*3600))
-_ARCHIVE_START = datetime.datetime(2022, 10, 13, 0, 0, 0, tzinfo=TIMEZONE)
+def ranked(items: dict[_K, _V], key: Callable[[_V], SupportsRichComparison], top_k: Optional[int] = None) -> dict[_K, _V]:
+	"""`items` sorted by `key`, largest first, cut to the `top_k` largest"""
+	# heapq.nlargest gives exactly sorted(..., reverse=True)[:top_k], ties
+	# included, without sorting everything
+	if top_k is None:
+		return dict(sorted(items.items(), key=lambda x:key(x[1]), reverse=True))
+	return dict(heapq.nlargest(top_k, items.items(), key=lambda x:key(x[1])))
 
+class Aggregator(Protocol):
+	"""One analysis over an archive, fed by `aggregate` so that any number of
+	them can share a single pass.
+	
+	`add_thread` is called once per yak with its full comment list and the
+	comments already filtered to the time window; `finish` returns the result."""
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]) -> None: ...
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> Any: ...
 
-def avg_yaks_per_hour(archive: YakArchive,
-	user_id: Optional[str] = None,
+def aggregate(archive: YakArchive,
+	aggregators: Sequence[Aggregator],
 	start_time: datetime.datetime = _ARCHIVE_START,
 	end_time: Optional[datetime.datetime] = None,
-	show_graph: bool = False,
-	graph_name: Optional[str] = None
-) -> dict[int, float]:
+) -> list[Any]:
+	"""Run several aggregators over one shared traversal of the archive and
+	return their results in the same order"""
 	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
 	
-	hour_counts = {} # type: dict[int, TotalYakData]
-	
 	for yak, comments in archive:
-		if user_id is None or yak.user_id == user_id:
-			# NOTE: a micro optimization could be made here by continuing 
-			#       if yak.created_at > end_time because the comments must 
-			#       be made after the post, but this is fine for now
-			if start_time <= yak.created_at <= end_time:
-				hour = yak.created_at.astimezone(TIMEZONE).hour
-				hour_counts[hour] = hour_counts.get(hour, {'posts': 0, 'comments': 0, 'total': 0})
-				hour_counts[hour]['posts'] += 1
-				hour_counts[hour]['total'] += 1
-		
-		for comment in comments:
-			if user_id is None or comment.user_id == user_id:
-				if start_time <= comment.created_at <= end_time:
-					hour = comment.created_at.astimezone(TIMEZONE).hour
-					hour_counts[hour] = hour_counts.get(hour, {'posts': 0, 'comments': 0, 'total': 0})
-					hour_counts[hour]['comments'] += 1
-					hour_counts[hour]['total'] += 1
+		yak_in_window = start_time <= yak.created_at <= end_time
+		comments_in_window = [comment for comment in comments if start_time <= comment.created_at <= end_time]
+		for aggregator in aggregators:
+			aggregator.add_thread(yak, yak_in_window, comments, comments_in_window)
 	
+	return [aggregator.finish(start_time, end_time) for aggregator in aggregators]
+
+
+def _average_per_hour(hour_counts: dict[int, TotalYakData], start_time: datetime.datetime) -> dict[int, TotalYakData]:
 	# convert hour counts into average yaks per hour
 	# (divide by number of same hours since start time)
 	num_days = (datetime.datetime.now(TIMEZONE) - start_time).days
@@ -84,28 +99,288 @@ def avg_yaks_per_hour(archive: YakArchive,
 			'comments': count['comments'] / hours_passed,
 			'total': count['total'] / hours_passed
 		}
+	return average_yaks_per_hour
+
+class HourCounts:
+	def __init__(self, user_id: Optional[str] = None):
+		self.user_id = user_id
+		self.hour_counts = {} # type: dict[int, TotalYakData]
 	
-	if show_graph:
-		# show a stacked bar graph of the average yaks per hour
-		_, ax = plt.subplots()
-		hours = list(average_yaks_per_hour.keys())
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		hour_counts = self.hour_counts
+		if yak_in_window and (self.user_id is None or yak.user_id == self.user_id):
+			hour = yak.created_at.astimezone(TIMEZONE).hour
+			hour_counts[hour] = hour_counts.get(hour, {'posts': 0, 'comments': 0, 'total': 0})
+			hour_counts[hour]['posts'] += 1
+			hour_counts[hour]['total'] += 1
+		
+		for comment in comments_in_window:
+			if self.user_id is None or comment.user_id == self.user_id:
+				hour = comment.created_at.astimezone(TIMEZONE).hour
+				hour_counts[hour] = hour_counts.get(hour, {'posts': 0, 'comments': 0, 'total': 0})
+				hour_counts[hour]['comments'] += 1
+				hour_counts[hour]['total'] += 1
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[int, TotalYakData]:
+		return _average_per_hour(self.hour_counts, start_time)
+
+@cache
+def stopwords() -> frozenset[str]:
+	"""The words `most_common_words` leaves out"""
+	from nltk.corpus import stopwords as nltk_stopwords
+	return frozenset(nltk_stopwords.words('english'))
+
+def tokenize(texts: list[str]) -> list[tuple[str, ...]]:
+	"""The words `most_common_words` counts in each text"""
+	# top level (and batched) so it can run in a process pool
+	import nltk
+	filtered = normalize_text
+	return [tuple(map(filtered, nltk.word_tokenize(filtered(text)))) for text in texts]
+
+class WordCounts:
+	CHUNK_SIZE = 2000 # texts per process pool task
+	
+	def __init__(self,
+		user_id: Optional[str] = None,
+		token_cache: Optional[dict[str, tuple[str, tuple[str, ...]]]] = None,
+		processes: Optional[int] = None,
+	):
+		self.user_id = user_id
+		# id -> (text, tokens), reused across calls so the same text is
+		# never tokenized twice (an edited text is just tokenized again)
+		self.token_cache = token_cache if token_cache is not None else {}
+		self.processes = processes
+		self.documents = [] # type: list[tuple[str, str]]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if yak_in_window and (self.user_id is None or yak.user_id == self.user_id):
+			self.documents.append((yak.id, yak.text))
+		
+		for comment in comments_in_window:
+			if self.user_id is None or comment.user_id == self.user_id:
+				self.documents.append((comment.id, comment.text))
+	
+	def _tokenize_missing(self):
+		token_cache = self.token_cache
+		missing = [(doc_id, text) for doc_id, text in self.documents if token_cache.get(doc_id, (None,))[0] != text]
+		texts = [text for _, text in missing]
+		
+		if self.processes is not None and self.processes > 1 and len(texts) > self.CHUNK_SIZE:
+			chunks = [texts[i:i+self.CHUNK_SIZE] for i in range(0, len(texts), self.CHUNK_SIZE)]
+			with ProcessPoolExecutor(self.processes) as executor:
+				token_lists = [tokens for chunk in executor.map(tokenize, chunks) for tokens in chunk]
+		else:
+			token_lists = tokenize(texts)
+		
+		for (doc_id, text), tokens in zip(missing, token_lists):
+			token_cache[doc_id] = (text, tokens)
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[str, int]:
+		self._tokenize_missing()
 		
-		posts = [average_yaks_per_hour[hour]['posts'] for hour in hours]
-		comments = [average_yaks_per_hour[hour]['comments'] for hour in hours]
+		word_counts = Counter() # type: Counter[str]
+		for doc_id, _ in self.documents:
+			word_counts.update(self.token_cache[doc_id][1])
 		
-		ax.bar(hours, posts, label='Posts', color='tab:blue')
-		ax.bar(hours, comments, bottom=posts, label='Comments', color='tab:green')
+		word_counts.pop('', None) # remove any random empty strings
+		for w in stopwords():
+			word_counts.pop(w, None) # remove stopwords
 		
-		# labels
-		plt.title(f"Average Yaks+Comments Per Hour by {user_id and (graph_name or user_id) or 'All Users'}")
-		plt.xlabel("Hour of Day")
-		plt.ylabel(f"Average Yaks+Comments")
-		plt.legend()
+		return dict(word_counts)
+
+class UserActivityCounts:
+	def __init__(self,
+		sort_by: Optional[Callable[[UserActivity], SupportsRichComparison]] = None,
+		top_k: Optional[int] = None,
+	):
+		self.sort_by = sort_by or (lambda activity: activity['total']) # sort by total yaks by default
+		self.top_k = top_k
+		self.user_activity = {} # type: dict[str, UserActivity]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		user_activity = self.user_activity
+		if yak_in_window:
+			# NOTE: a yak in the window without a user id skips its comments too
+			if yak.user_id is None: return
+			user_activity[yak.user_id] = user_activity.get(yak.user_id, {'posts': 0, 'comments': 0, 'total': 0, 'post_upvotes': 0, 'comment_upvotes': 0, 'total_upvotes': 0})
+			user_activity[yak.user_id]['posts'] += 1
+			user_activity[yak.user_id]['total'] += 1
+			user_activity[yak.user_id]['post_upvotes'] += yak.vote_count
+			user_activity[yak.user_id]['total_upvotes'] += yak.vote_count
 		
-		# x axis scale (0-23) and ticks every 6
-		plt.xticks(range(0, 24, 6))
+		for comment in comments_in_window:
+			if comment.user_id is None: continue
+			user_activity[comment.user_id] = user_activity.get(comment.user_id, {'posts': 0, 'comments': 0, 'total': 0, 'post_upvotes': 0, 'comment_upvotes': 0, 'total_upvotes': 0})
+			user_activity[comment.user_id]['comments'] += 1
+			user_activity[comment.user_id]['total'] += 1
+			user_activity[comment.user_id]['comment_upvotes'] += comment.vote_count
+			user_activity[comment.user_id]['total_upvotes'] += comment.vote_count
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[str, UserActivity]:
+		# sort and return the user activity dict
+		return ranked(self.user_activity, self.sort_by, self.top_k)
+
+class CoupledUserCounts:
+	def __init__(self,
+		include_self: bool = False,
+		repeat_comments_per_thread: bool = True,
+		only_anonymous: bool = True,
+		top_k: Optional[int] = None,
+	):
+		self.include_self = include_self
+		self.repeat_comments_per_thread = repeat_comments_per_thread
+		self.only_anonymous = only_anonymous
+		self.top_k = top_k
+		self.coupled_users = {} # type: dict[tuple[str, str], int]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if not yak_in_window: return
+		if yak.user_id is None: return
+		if self.only_anonymous and not yak.is_incognito: return
+		coupled_users = self.coupled_users
+		seen_users = set()
+		for comment in comments:
+			if comment.user_id is None: continue
+			if not self.include_self and comment.user_id == yak.user_id: continue
+			if not self.repeat_comments_per_thread:
+				if comment.user_id in seen_users: continue
+				seen_users.add(comment.user_id)
+			coupled_users[(yak.user_id, comment.user_id)] = coupled_users.get((yak.user_id, comment.user_id), 0) + 1
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[tuple[str, str], int]:
+		return ranked(self.coupled_users, lambda count: count, self.top_k)
+
+class ApproximateUserActivity:
+	"""The `top_k` users by total posts + comments, counted in fixed memory.
+	
+	Counts are estimates (never lower than the real count); use
+	`UserActivityCounts` when the exact breakdown is needed."""
+	
+	def __init__(self, top_k: int, width: int = 2**16, depth: int = 4):
+		self.heavy_hitters = HeavyHitters(top_k, CountMinSketch(width, depth)) # type: HeavyHitters[str]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if yak_in_window:
+			# same quirk as UserActivityCounts
+			if yak.user_id is None: return
+			self.heavy_hitters.add(yak.user_id)
 		
-		plt.show()
+		for comment in comments_in_window:
+			if comment.user_id is None: continue
+			self.heavy_hitters.add(comment.user_id)
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[str, int]:
+		return self.heavy_hitters.top()
+
+class ApproximateCoupledUsers:
+	"""Like `CoupledUserCounts`, but only keeps the `top_k` pairs (with
+	estimated counts) instead of every pair that ever occurred"""
+	
+	def __init__(self,
+		top_k: int,
+		include_self: bool = False,
+		repeat_comments_per_thread: bool = True,
+		only_anonymous: bool = True,
+		width: int = 2**16,
+		depth: int = 4,
+	):
+		self.include_self = include_self
+		self.repeat_comments_per_thread = repeat_comments_per_thread
+		self.only_anonymous = only_anonymous
+		self.heavy_hitters = HeavyHitters(top_k, CountMinSketch(width, depth)) # type: HeavyHitters[tuple[str, str]]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if not yak_in_window: return
+		if yak.user_id is None: return
+		if self.only_anonymous and not yak.is_incognito: return
+		seen_users = set()
+		for comment in comments:
+			if comment.user_id is None: continue
+			if not self.include_self and comment.user_id == yak.user_id: continue
+			if not self.repeat_comments_per_thread:
+				if comment.user_id in seen_users: continue
+				seen_users.add(comment.user_id)
+			self.heavy_hitters.add((yak.user_id, comment.user_id))
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[tuple[str, str], int]:
+		return self.heavy_hitters.top()
+
+class DistinctUsers:
+	"""Approximate number of distinct users who posted or commented"""
+	
+	def __init__(self, precision: int = 14):
+		self.users = HyperLogLog(precision)
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if yak_in_window and yak.user_id is not None:
+			self.users.add(yak.user_id)
+		for comment in comments_in_window:
+			if comment.user_id is not None:
+				self.users.add(comment.user_id)
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> int:
+		return len(self.users)
+
+class YaksByUser:
+	def __init__(self):
+		self.yaks_by_user = {} # type: dict[str, list[Yak]]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		if yak_in_window:
+			if yak.user_id is None: return
+			self.yaks_by_user[yak.user_id] = self.yaks_by_user.get(yak.user_id, [])
+			self.yaks_by_user[yak.user_id].append(yak)
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[str, list[Yak]]:
+		return self.yaks_by_user
+
+class CommentsByUser:
+	def __init__(self):
+		self.comments_by_user = {} # type: dict[str, list[Comment]]
+	
+	def add_thread(self, yak: Yak, yak_in_window: bool, comments: list[Comment], comments_in_window: list[Comment]):
+		for comment in comments_in_window:
+			if comment.user_id is None: continue
+			self.comments_by_user[comment.user_id] = self.comments_by_user.get(comment.user_id, [])
+			self.comments_by_user[comment.user_id].append(comment)
+	
+	def finish(self, start_time: datetime.datetime, end_time: datetime.datetime) -> dict[str, list[Comment]]:
+		return self.comments_by_user
+
+def _show_hour_graph(average_yaks_per_hour: dict[int, TotalYakData], user_id: Optional[str], graph_name: Optional[str]):
+	# show a stacked bar graph of the average yaks per hour
+	import matplotlib.pyplot as plt
+	_, ax = plt.subplots()
+	hours = list(average_yaks_per_hour.keys())
+	
+	posts = [average_yaks_per_hour[hour]['posts'] for hour in hours]
+	comments = [average_yaks_per_hour[hour]['comments'] for hour in hours]
+	
+	ax.bar(hours, posts, label='Posts', color='tab:blue')
+	ax.bar(hours, comments, bottom=posts, label='Comments', color='tab:green')
+	
+	# labels
+	plt.title(f"Average Yaks+Comments Per Hour by {user_id and (graph_name or user_id) or 'All Users'}")
+	plt.xlabel("Hour of Day")
+	plt.ylabel(f"Average Yaks+Comments")
+	plt.legend()
+	
+	# x axis scale (0-23) and ticks every 6
+	plt.xticks(range(0, 24, 6))
+	
+	plt.show()
+
+def avg_yaks_per_hour(archive: YakArchive,
+	user_id: Optional[str] = None,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+	show_graph: bool = False,
+	graph_name: Optional[str] = None
+) -> dict[int, float]:
+	average_yaks_per_hour, = aggregate(archive, [HourCounts(user_id)], start_time, end_time)
+	
+	if show_graph:
+		_show_hour_graph(average_yaks_per_hour, user_id, graph_name)
 	
 	return average_yaks_per_hour
 
@@ -113,70 +388,156 @@ def most_common_words(archive: YakArchive,
 	user_id: Optional[str] = None,
 	start_time: datetime.datetime = _ARCHIVE_START,
 	end_time: Optional[datetime.datetime] = None,
+	processes: Optional[int] = None,
 ) -> dict[str, int]:
+	word_counts, = aggregate(archive, [WordCounts(user_id, archive.token_cache, processes)], start_time, end_time)
+	return word_counts
+
+def most_active_users(archive: YakArchive,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+	sort_by: Optional[Callable[[UserActivity], SupportsRichComparison]] = None,
+	top_k: Optional[int] = None,
+) -> dict[str, UserActivity]:
+	user_activity, = aggregate(archive, [UserActivityCounts(sort_by, top_k)], start_time, end_time)
+	return user_activity
+
+def _iteration_order(archive: YakArchive, columns: ArchiveColumns, yaks: dict[str, numpy.ndarray], comments: dict[str, numpy.ndarray]) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+	"""For every yak row and comment row, where `for yak, comments in archive`
+	would reach it (-1 for comments whose yak isn't in the archive), plus
+	each comment's parent yak row (also -1 for those)"""
+	import numpy as np
+	
+	num_yaks, num_comments = len(columns.yaks), len(columns.comments)
+	
+	yak_position = np.full(num_yaks, -1, dtype=np.int64)
+	archive_rows = np.fromiter((columns.yaks.rows[yak_id] for yak_id in archive.yak_ids()), dtype=np.int64, count=len(archive))
+	yak_position[archive_rows] = np.arange(len(archive_rows))
+	
+	row_of_code = np.full(len(columns.yak_ids), -1, dtype=np.int64)
+	row_of_code[yaks['id']] = np.arange(num_yaks)
+	parent_row = row_of_code[comments['yak']]
+	parent_position = np.where(parent_row >= 0, yak_position[parent_row], -1)
+	
+	# comment rows are appended thread by thread, so within a thread row
+	# order is the order comments appear in
+	stride = num_comments + 1
+	yak_order = yak_position * stride
+	comment_order = np.where(parent_position >= 0, parent_position * stride + 1 + np.arange(num_comments), -1)
+	return yak_order, comment_order, parent_row
+
+def _first_seen_order(keys: numpy.ndarray, orders: numpy.ndarray, num_keys: int) -> numpy.ndarray:
+	"""The distinct keys, in the order the original loops would first see them"""
+	import numpy as np
+	
+	first_seen = np.full(num_keys, np.iinfo(np.int64).max, dtype=np.int64)
+	np.minimum.at(first_seen, keys, orders)
+	present = np.flatnonzero(first_seen != np.iinfo(np.int64).max)
+	return present[np.argsort(first_seen[present], kind='stable')]
+
+def avg_yaks_per_hour_vectorized(archive: YakArchive,
+	user_id: Optional[str] = None,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+	show_graph: bool = False,
+	graph_name: Optional[str] = None
+) -> dict[int, float]:
+	"""Same result as `avg_yaks_per_hour`, computed with numpy over the
+	archive's column view instead of a python loop"""
+	import numpy as np
+	
 	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
+	start, end = epoch_microseconds(start_time), epoch_microseconds(end_time)
+	offset = TIMEZONE.utcoffset(None) // datetime.timedelta(microseconds=1)
 	
-	word_counts = {}
-	# WORD_SPLIT_REGEX = r"[^a-zA-Z0-9'’]+"
+	columns = archive.to_columns()
+	yaks, comments = columns.yaks.to_numpy(), columns.comments.to_numpy()
+	yak_order, comment_order, _ = _iteration_order(archive, columns, yaks, comments)
 	
-	def filtered(text: str) -> str:
-		return text.replace('’', "'") \
-		.replace("“", '"') \
-		.replace("”", '"') \
-		.lower() \
-		#.replace("'", '')
+	yak_mask = (yak_order >= 0) & (start <= yaks['created_at']) & (yaks['created_at'] <= end)
+	comment_mask = (comment_order >= 0) & (start <= comments['created_at']) & (comments['created_at'] <= end)
+	if user_id is not None:
+		user_code = columns.users.get_code(user_id)
+		yak_mask &= yaks['user_id'] == user_code
+		comment_mask &= comments['user_id'] == user_code
 	
-	for yak, comments in archive:
-		if user_id is None or yak.user_id == user_id:
-			if start_time <= yak.created_at <= end_time:
-				for word in nltk.word_tokenize(filtered(yak.text)):
-					word_counts[filtered(word)] = word_counts.get(filtered(word), 0) + 1
-		
-		for comment in comments:
-			if user_id is None or comment.user_id == user_id:
-				if start_time <= comment.created_at <= end_time:
-					for word in nltk.word_tokenize(filtered(comment.text)):
-						word_counts[filtered(word)] = word_counts.get(filtered(word), 0) + 1
+	yak_hours = (yaks['created_at'][yak_mask] + offset) // 3_600_000_000 % 24
+	comment_hours = (comments['created_at'][comment_mask] + offset) // 3_600_000_000 % 24
+	posts = np.bincount(yak_hours, minlength=24)
+	num_comments = np.bincount(comment_hours, minlength=24)
 	
-	word_counts.pop('', None) # remove any random empty strings
+	hours = _first_seen_order(
+		np.concatenate([yak_hours, comment_hours]),
+		np.concatenate([yak_order[yak_mask], comment_order[comment_mask]]),
+		24,
+	)
+	hour_counts = {
+		int(hour): {'posts': int(posts[hour]), 'comments': int(num_comments[hour]), 'total': int(posts[hour] + num_comments[hour])}
+		for hour in hours
+	} # type: dict[int, TotalYakData]
 	
-	from nltk.corpus import stopwords
-	for w in stopwords.words('english'):
-		word_counts.pop(w, None) # remove stopwords
+	average_yaks_per_hour = _average_per_hour(hour_counts, start_time)
 	
-	return word_counts
+	if show_graph:
+		_show_hour_graph(average_yaks_per_hour, user_id, graph_name)
+	
+	return average_yaks_per_hour # type: ignore
 
-def most_active_users(archive: YakArchive,
+def most_active_users_vectorized(archive: YakArchive,
 	start_time: datetime.datetime = _ARCHIVE_START,
 	end_time: Optional[datetime.datetime] = None,
 	sort_by: Optional[Callable[[UserActivity], SupportsRichComparison]] = None,
+	top_k: Optional[int] = None,
 ) -> dict[str, UserActivity]:
+	"""Same result as `most_active_users`, computed with numpy over the
+	archive's column view instead of a python loop"""
+	import numpy as np
+	
 	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
+	start, end = epoch_microseconds(start_time), epoch_microseconds(end_time)
 	
-	user_activity = {} # type: dict[str, UserActivity]
+	columns = archive.to_columns()
+	yaks, comments = columns.yaks.to_numpy(), columns.comments.to_numpy()
+	yak_order, comment_order, parent_row = _iteration_order(archive, columns, yaks, comments)
+	num_users = len(columns.users)
 	
-	for yak, comments in archive:
-		if start_time <= yak.created_at <= end_time:
-			if yak.user_id is None: continue
-			user_activity[yak.user_id] = user_activity.get(yak.user_id, {'posts': 0, 'comments': 0, 'total': 0, 'post_upvotes': 0, 'comment_upvotes': 0, 'total_upvotes': 0})
-			user_activity[yak.user_id]['posts'] += 1
-			user_activity[yak.user_id]['total'] += 1
-			user_activity[yak.user_id]['post_upvotes'] += yak.vote_count
-			user_activity[yak.user_id]['total_upvotes'] += yak.vote_count
-		
-		for comment in comments:
-			if start_time <= comment.created_at <= end_time:
-				if comment.user_id is None: continue
-				user_activity[comment.user_id] = user_activity.get(comment.user_id, {'posts': 0, 'comments': 0, 'total': 0, 'post_upvotes': 0, 'comment_upvotes': 0, 'total_upvotes': 0})
-				user_activity[comment.user_id]['comments'] += 1
-				user_activity[comment.user_id]['total'] += 1
-				user_activity[comment.user_id]['comment_upvotes'] += comment.vote_count
-				user_activity[comment.user_id]['total_upvotes'] += comment.vote_count
+	yak_in_window = (yak_order >= 0) & (start <= yaks['created_at']) & (yaks['created_at'] <= end)
+	yak_mask = yak_in_window & (yaks['user_id'] >= 0)
+	# most_active_users skips the whole thread of a yak in the window that
+	# has no user id
+	skipped_thread = yak_in_window & (yaks['user_id'] < 0)
+	comment_mask = (comment_order >= 0) & (start <= comments['created_at']) & (comments['created_at'] <= end) & (comments['user_id'] >= 0)
+	comment_mask &= ~skipped_thread[np.maximum(parent_row, 0)]
+	
+	yak_users, comment_users = yaks['user_id'][yak_mask], comments['user_id'][comment_mask]
+	posts = np.bincount(yak_users, minlength=num_users)
+	num_comments = np.bincount(comment_users, minlength=num_users)
+	post_upvotes = np.zeros(num_users, dtype=np.int64)
+	np.add.at(post_upvotes, yak_users, yaks['vote_count'][yak_mask])
+	comment_upvotes = np.zeros(num_users, dtype=np.int64)
+	np.add.at(comment_upvotes, comment_users, comments['vote_count'][comment_mask])
+	
+	users = _first_seen_order(
+		np.concatenate([yak_users, comment_users]),
+		np.concatenate([yak_order[yak_mask], comment_order[comment_mask]]),
+		num_users,
+	)
+	user_activity = {
+		columns.users.values[user]: {
+			'posts': int(posts[user]),
+			'comments': int(num_comments[user]),
+			'total': int(posts[user] + num_comments[user]),
+			'post_upvotes': int(post_upvotes[user]),
+			'comment_upvotes': int(comment_upvotes[user]),
+			'total_upvotes': int(post_upvotes[user] + comment_upvotes[user]),
+		}
+		for user in users
+	} # type: dict[str, UserActivity]
 	
 	sort_by = sort_by or (lambda activity: activity['total']) # sort by total yaks by default
 	
 	# sort and return the user activity dict
-	return dict(sorted(user_activity.items(), key=lambda x:sort_by(x[1]), reverse=True))
+	return ranked(user_activity, sort_by, top_k)
 
 def common_coupled_users(archive: YakArchive,
 	start_time: datetime.datetime = _ARCHIVE_START,
@@ -184,99 +545,109 @@ def common_coupled_users(archive: YakArchive,
 	include_self: bool = False,
 	repeat_comments_per_thread: bool = True,
 	only_anonymous: bool = True,
+	top_k: Optional[int] = None,
 ) -> dict[tuple[str, str], int]:
-	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
-	
-	coupled_users = {} # type: dict[tuple[str, str], int]
-	
-	for yak, comments in archive:
-		if start_time <= yak.created_at <= end_time:
-			if yak.user_id is None: continue
-			if only_anonymous and not yak.is_incognito: continue
-			seen_users = set()
-			for comment in comments:
-				if comment.user_id is None: continue
-				if not include_self and comment.user_id == yak.user_id: continue
-				if not repeat_comments_per_thread:
-					if comment.user_id in seen_users: continue
-					seen_users.add(comment.user_id)
-				coupled_users[(yak.user_id, comment.user_id)] = coupled_users.get((yak.user_id, comment.user_id), 0) + 1
-	
-	return dict(sorted(coupled_users.items(), key=lambda x:x[1], reverse=True))
+	coupled_users, = aggregate(archive, [CoupledUserCounts(include_self, repeat_comments_per_thread, only_anonymous, top_k)], start_time, end_time)
+	return coupled_users
+
+def approx_most_active_users(archive: YakArchive,
+	top_k: int = 100,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+) -> dict[str, int]:
+	"""Estimated total posts + comments of (roughly) the `top_k` most active
+	users, in memory that doesn't grow with the number of users"""
+	top_users, = aggregate(archive, [ApproximateUserActivity(top_k)], start_time, end_time)
+	return top_users
+
+def approx_common_coupled_users(archive: YakArchive,
+	top_k: int = 100,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+	include_self: bool = False,
+	repeat_comments_per_thread: bool = True,
+	only_anonymous: bool = True,
+) -> dict[tuple[str, str], int]:
+	coupled_users, = aggregate(archive, [ApproximateCoupledUsers(top_k, include_self, repeat_comments_per_thread, only_anonymous)], start_time, end_time)
+	return coupled_users
+
+def approx_distinct_users(archive: YakArchive,
+	start_time: datetime.datetime = _ARCHIVE_START,
+	end_time: Optional[datetime.datetime] = None,
+) -> int:
+	distinct_users, = aggregate(archive, [DistinctUsers()], start_time, end_time)
+	return distinct_users
+
+# (user_color, secondary_user_color) -> short name for the color
+COLOR_CODES = {
+	('#00CBFE', '#00CBFE'): "LB",
+	('#00CBFE', '#0D13D5'): "GB", # yes
+	('#15FF46', '#15FF46'): "G",
+	('#15FF46', '#3FC0FF'): "G2", # yes
+	('#5857FF', '#5857FF'): "PB", 
+	('#6EFFE6', '#6EFFE6'): "CY",
+	('#76FFE7', '#00A4FF'): "GC", # yes
+	('#8483FF', '#5857FF'): "GP", # yes
+	('#927AFF', '#927AFF'): "PW",
+	('#C0FF2D', '#C0FF2D'): "YG",
+	('#C16AFF', '#C16AFF'): "P",
+	('#C38637', '#C38637'): "BR",
+	('#D9FB8A', '#B1FD00'): "GG", # yes
+	('#E9FDFB', '#E9FDFB'): "W",  
+	('#FA81FF', '#722DFF'): "LP", # yes
+	('#FA81FF', '#FF1885'): "PI", # yes
+	('#FF7373', '#FF7373'): "CO",
+	('#FF7A7A', '#FF7A7A'): "CO",
+	('#FF9541', '#FF9541'): "O",
+	('#FFA236', '#FF3232'): "GO", # yes
+	('#FFA953', '#FFA953'): "LO",
+	('#FFD38C', '#C38737'): "GT", # yes
+	('#FFD38C', '#FFD38C'): "T",
+	('#FFD815', '#FFD815'): "Y",
+	('#FFF680', '#FFDA00'): "GY", # yes
+	('#FFF98D', '#FFF98D'): "LY",
+}
+
+def _named_emojis(counts: dict[Look, int]) -> dict[str, int]:
+	# several looks can share a name (there are two corals, and unknown
+	# colors are all ??)
+	named = {} # type: dict[str, int]
+	for (color, secondary_color, emoji), count in counts.items():
+		name = COLOR_CODES.get((color, secondary_color), '??') + emoji # type: ignore
+		named[name] = named.get(name, 0) + count
+	return named
+
+def _top_emojis(counts: dict[str, int], percentage_cutoff: float) -> list[str]:
+	# return the emojis sorted by count (ties by name, so the order doesn't
+	# depend on the order comments were added in)
+	total = sum(counts.values())
+	return [emoji for emoji, count in sorted(counts.items(), key=lambda x:(-x[1], x[0])) if count/total > percentage_cutoff]
 
-@cache
 def get_emojis(archive: YakArchive,
 	user_id: str,
 	percentage_cutoff: float = 0.0,
 ) -> list[str]:
-	COLOR_CODES = {
-		('#00CBFE', '#00CBFE'): "LB",
-		('#00CBFE', '#0D13D5'): "GB", # yes
-		('#15FF46', '#15FF46'): "G",
-		('#15FF46', '#3FC0FF'): "G2", # yes
-		('#5857FF', '#5857FF'): "PB", 
-		('#6EFFE6', '#6EFFE6'): "CY",
-		('#76FFE7', '#00A4FF'): "GC", # yes
-		('#8483FF', '#5857FF'): "GP", # yes
-		('#927AFF', '#927AFF'): "PW",
-		('#C0FF2D', '#C0FF2D'): "YG",
-		('#C16AFF', '#C16AFF'): "P",
-		('#C38637', '#C38637'): "BR",
-		('#D9FB8A', '#B1FD00'): "GG", # yes
-		('#E9FDFB', '#E9FDFB'): "W",  
-		('#FA81FF', '#722DFF'): "LP", # yes
-		('#FA81FF', '#FF1885'): "PI", # yes
-		('#FF7373', '#FF7373'): "CO",
-		('#FF7A7A', '#FF7A7A'): "CO",
-		('#FF9541', '#FF9541'): "O",
-		('#FFA236', '#FF3232'): "GO", # yes
-		('#FFA953', '#FFA953'): "LO",
-		('#FFD38C', '#C38737'): "GT", # yes
-		('#FFD38C', '#FFD38C'): "T",
-		('#FFD815', '#FFD815'): "Y",
-		('#FFF680', '#FFDA00'): "GY", # yes
-		('#FFF98D', '#FFF98D'): "LY",
-	}
-	
-	result = {}
-	for _, comments in archive:
-		for comment in comments:
-			if comment.user_id == user_id and comment.user_emoji not in (None, 'OP'):
-				emoji = COLOR_CODES.get((comment.user_color, comment.secondary_user_color),'??')+comment.user_emoji # type: ignore
-				result[emoji] = result.get(emoji, 0) + 1
-	
-	# return the emojis sorted by count
-	return [emoji for emoji, count in sorted(result.items(), key=lambda x:x[1], reverse=True) if count/sum(result.values()) > percentage_cutoff]
+	counts = archive.emoji_counts().counts.get(user_id)
+	if not counts:
+		return []
+	return _top_emojis(_named_emojis(counts), percentage_cutoff)
+
+def all_emojis(archive: YakArchive,
+	percentage_cutoff: float = 0.0,
+) -> dict[str, list[str]]:
+	"""`get_emojis` for every user at once"""
+	return {user_id: _top_emojis(_named_emojis(counts), percentage_cutoff) for user_id, counts in archive.emoji_counts().counts.items()}
 
 def yaks_by_user(archive: YakArchive,
 	start_time: datetime.datetime = _ARCHIVE_START,
 	end_time: Optional[datetime.datetime] = None,
 ) -> dict[str, list[Yak]]:
-	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
-	
-	yaks_by_user = {} # type: dict[str, list[Yak]]
-	
-	for yak, _ in archive:
-		if start_time <= yak.created_at <= end_time:
-			if yak.user_id is None: continue
-			yaks_by_user[yak.user_id] = yaks_by_user.get(yak.user_id, [])
-			yaks_by_user[yak.user_id].append(yak)
-	
+	yaks_by_user, = aggregate(archive, [YaksByUser()], start_time, end_time)
 	return yaks_by_user
 
 def comments_by_user(archive: YakArchive,
 	start_time: datetime.datetime = _ARCHIVE_START,
 	end_time: Optional[datetime.datetime] = None,
 ) -> dict[str, list[Comment]]:
-	end_time = end_time or datetime.datetime.now(tz=TIMEZONE)
-	
-	comments_by_user = {} # type: dict[str, list[Comment]]
-	
-	for _, comments in archive:
-		for comment in comments:
-			if start_time <= comment.created_at <= end_time:
-				if comment.user_id is None: continue
-				comments_by_user[comment.user_id] = comments_by_user.get(comment.user_id, [])
-				comments_by_user[comment.user_id].append(comment)
-	
+	comments_by_user, = aggregate(archive, [CommentsByUser()], start_time, end_time)
 	return comments_by_user